@@ -0,0 +1,133 @@
+"""
+Compare loading ``{groupname: [roles]}`` of a user member of many groups
+with one query per group, as ``UserModel.group_roles`` used to do, against
+the single joined query of ``UserSQLStorage.get_user_group_roles``.
+
+Requires a scratch database, the benchmark tables are dropped when done::
+
+    python benchmarks/bench_group_roles.py --dburl postgresql://postgres@localhost/bench \\
+        --groups 50
+"""
+
+import argparse
+import time
+
+import sqlalchemy as sa
+from morpfw.authn.pas.storage.sqlstorage import dbmodel as db
+from sqlalchemy.orm import sessionmaker
+
+TABLES = [
+    db.User.__table__,
+    db.Group.__table__,
+    db.Membership.__table__,
+    db.RoleAssignment.__table__,
+]
+
+
+def populate(session, groups):
+    user = db.User(username="benchuser")
+    session.add(user)
+    for i in range(groups):
+        group = db.Group(groupname="group%s" % i)
+        membership = db.Membership(group=group, user=user)
+        for rolename in ["member", "editor"]:
+            membership.roles_assignment.append(db.RoleAssignment(rolename=rolename))
+        session.add(group)
+    session.commit()
+    return user.uuid
+
+
+def per_group(session, userid):
+    user = session.query(db.User).filter(db.User.uuid == userid).first()
+    groups = (
+        session.query(db.Group)
+        .join(db.Membership)
+        .filter(sa.and_(db.Membership.user_id == user.id, db.Group.deleted.is_(None)))
+        .all()
+    )
+    result = {}
+    for g in groups:
+        group = session.query(db.Group).filter(db.Group.uuid == g.uuid).first()
+        u = session.query(db.User).filter(db.User.uuid == userid).first()
+        roles = (
+            session.query(db.RoleAssignment)
+            .join(db.Membership)
+            .filter(
+                sa.and_(
+                    db.Membership.group_id == group.id,
+                    db.Membership.user_id == u.id,
+                )
+            )
+            .all()
+        )
+        result[g.groupname] = [r.rolename for r in roles]
+    return result
+
+
+def joined(session, userid):
+    q = (
+        session.query(db.Group.groupname, db.RoleAssignment.rolename)
+        .select_from(db.Membership)
+        .join(db.Membership.group)
+        .join(db.Membership.user)
+        .outerjoin(db.Membership.roles_assignment)
+        .filter(sa.and_(db.User.uuid == userid, db.Group.deleted.is_(None)))
+        .order_by(db.Group.id, db.RoleAssignment.id)
+    )
+    result = {}
+    for groupname, rolename in q.all():
+        roles = result.setdefault(groupname, [])
+        if rolename is not None:
+            roles.append(rolename)
+    return result
+
+
+def measure(engine, session, func, userid, repeat):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sa.event.listen(engine, "before_cursor_execute", count)
+    try:
+        start = time.perf_counter()
+        for i in range(repeat):
+            result = func(session, userid)
+            session.expire_all()
+        elapsed = (time.perf_counter() - start) / repeat * 1000
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", count)
+    return result, elapsed, len(statements) // repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dburl", required=True)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = sa.create_engine(args.dburl)
+    for table in reversed(TABLES):
+        table.drop(engine, checkfirst=True)
+    for table in TABLES:
+        table.create(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        userid = populate(session, args.groups)
+        results = []
+        for name, func in [("per-group", per_group), ("joined", joined)]:
+            result, elapsed, queries = measure(
+                engine, session, func, userid, args.repeat
+            )
+            results.append(result)
+            print("%-9s %8.2f ms  %4d queries" % (name, elapsed, queries))
+        assert results[0] == results[1]
+    finally:
+        session.close()
+        for table in reversed(TABLES):
+            table.drop(engine, checkfirst=True)
+
+
+if __name__ == "__main__":
+    main()
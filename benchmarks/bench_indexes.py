@@ -0,0 +1,106 @@
+"""
+Compare PostgreSQL query plans of soft delete aware queries with and without
+the partial ``(created, id) WHERE deleted IS NULL`` index.
+
+Requires a scratch PostgreSQL database, the benchmark table is dropped when
+done::
+
+    python benchmarks/bench_indexes.py --dburl postgresql://postgres@localhost/bench \\
+        --rows 200000 --deleted-ratio 0.05
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytz
+import sqlalchemy as sa
+from morpfw.crud.storage.sqlstorage import Base
+
+QUERIES = {
+    "latest": (
+        "SELECT id FROM bench_indexes WHERE deleted IS NULL "
+        "ORDER BY created DESC, id DESC LIMIT 20"
+    ),
+    "keyset": (
+        "SELECT id FROM bench_indexes WHERE deleted IS NULL "
+        "AND (created, id) < (:created, :id) ORDER BY created DESC, id DESC LIMIT 20"
+    ),
+    "count": "SELECT count(id) FROM bench_indexes WHERE deleted IS NULL",
+}
+
+
+class BenchIndexes(Base):
+
+    __tablename__ = "bench_indexes"
+
+    title = sa.Column(sa.String(length=256))
+
+
+def populate(engine, rows, deleted_ratio):
+    table = BenchIndexes.__table__
+    now = datetime.now(tz=pytz.UTC)
+    batch = []
+    for i in range(rows):
+        created = now - timedelta(seconds=rows - i)
+        deleted = created if random.random() < deleted_ratio else None
+        batch.append({"title": "row %s" % i, "created": created, "deleted": deleted})
+        if len(batch) == 10000:
+            engine.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        engine.execute(table.insert(), batch)
+    engine.execute("ANALYZE bench_indexes")
+
+
+def measure(engine, params, repeat):
+    result = {}
+    for name, query in QUERIES.items():
+        plan = engine.execute(sa.text("EXPLAIN " + query), params).fetchall()
+        start = time.perf_counter()
+        for i in range(repeat):
+            engine.execute(sa.text(query), params).fetchall()
+        elapsed = (time.perf_counter() - start) / repeat * 1000
+        result[name] = (elapsed, plan[0][0])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dburl", required=True)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--deleted-ratio", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = sa.create_engine(args.dburl)
+    table = BenchIndexes.__table__
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    try:
+        populate(engine, args.rows, args.deleted_ratio)
+        row = engine.execute(
+            "SELECT created, id FROM bench_indexes ORDER BY id LIMIT 1 OFFSET %s"
+            % (args.rows // 2)
+        ).fetchone()
+        params = {"created": row[0], "id": row[1]}
+
+        with_index = measure(engine, params, args.repeat)
+        engine.execute("DROP INDEX ix_bench_indexes_created_id_live")
+        engine.execute("ANALYZE bench_indexes")
+        without_index = measure(engine, params, args.repeat)
+
+        for name in QUERIES.keys():
+            for label, result in [
+                ("plain", without_index),
+                ("partial", with_index),
+            ]:
+                elapsed, plan = result[name]
+                print("%-7s %-8s %8.2f ms  %s" % (name, label, elapsed, plan))
+    finally:
+        table.drop(engine, checkfirst=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Measure login throughput of password hashers with concurrent clients.
+
+Each client thread verifies a password through ``PasswordManager``, as
+``UserSQLStorage.validate`` does, then API key validation is measured with
+and without the verified credential cache::
+
+    python benchmarks/bench_login.py --clients 16 --logins 200 --workers 2
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from morpfw.authn.pas.passwordhash import (
+    PasswordManager,
+    PBKDF2SHA256Hasher,
+    ScryptHasher,
+    SHA256Hasher,
+    VerifiedCache,
+)
+
+
+def run(clients, count, func):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(lambda i: func(), range(count)))
+    assert all(results)
+    return time.perf_counter() - start
+
+
+def bench_hashers(args):
+    hashers = [
+        SHA256Hasher(),
+        PBKDF2SHA256Hasher(iterations=args.iterations),
+        ScryptHasher(n=args.n),
+    ]
+    for hasher in hashers:
+        manager = PasswordManager(hasher, workers=args.workers)
+        encoded = hasher.encode("password")
+
+        def login():
+            return manager.verify_and_update("password", encoded)[0]
+
+        elapsed = run(args.clients, args.logins, login)
+        print(
+            "%-14s %8.1f logins/s  %7.2f ms/login"
+            % (hasher.algorithm, args.logins / elapsed, elapsed / args.logins * 1000)
+        )
+        manager.executor.shutdown()
+
+
+def bench_apikey(args):
+    hasher = PBKDF2SHA256Hasher(iterations=args.iterations)
+    manager = PasswordManager(hasher, workers=args.workers)
+    encoded = hasher.encode("secret")
+    for ttl in [0, 60]:
+        cache = VerifiedCache()
+
+        def validate():
+            if ttl and cache.get("identity", "secret") is not None:
+                return True
+            valid = manager.verify_and_update("secret", encoded)[0]
+            if valid and ttl:
+                cache.add("identity", "secret", "userid", ttl)
+            return valid
+
+        elapsed = run(args.clients, args.logins, validate)
+        print(
+            "apikey ttl=%-3s %8.1f keys/s    %7.2f ms/key   %d cache hits"
+            % (ttl, args.logins / elapsed, elapsed / args.logins * 1000, cache.hits)
+        )
+    manager.executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--iterations", type=int, default=600000)
+    parser.add_argument("--n", type=int, default=16384)
+    args = parser.parse_args()
+    bench_hashers(args)
+    bench_apikey(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Measure ``+search`` throughput at ``limit=100`` on memory storage.
+
+Compares the fast path JSON serializer against serializing through
+colander (``morpfw.crud.json.fastpath: false``)::
+
+    python benchmarks/bench_search.py --objects 1000 --requests 50
+"""
+
+import argparse
+import os
+import time
+
+import morepath
+import morpfw
+from morpfw.cli.cli import load_settings
+from morpfw.request import request_factory
+from morpfw.tests.crud_test import test_memorystorage
+from webtest import TestApp as Client
+
+SETTINGS = os.path.join(
+    os.path.dirname(test_memorystorage.__file__), "test_memorystorage-settings.yml"
+)
+
+
+def get_client():
+    request = request_factory(load_settings(SETTINGS), scan=False)
+    c = Client(request.environ["morpfw.wsgi.app"])
+    c.authorization = ("Basic", ("admin", "admin"))
+    c.mfw_request = request
+    return c
+
+
+def set_fastpath(client, enabled):
+    config = client.mfw_request.app.settings.configuration.__dict__
+    config["morpfw.crud.json.fastpath"] = enabled
+
+
+def populate(client, count):
+    for i in range(count):
+        client.post_json(
+            "/pages/",
+            {"title": "page%s" % i, "body": "body of page %s" % i, "value": i},
+        )
+
+
+def run(client, count):
+    start = time.perf_counter()
+    for i in range(count):
+        r = client.get("/pages/+search", {"limit": 100})
+        assert len(r.json["results"]) == 100
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--objects", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    morepath.scan(morpfw)
+    client = get_client()
+    populate(client, args.objects)
+    for fastpath in [False, True]:
+        set_fastpath(client, fastpath)
+        run(client, 2)
+        elapsed = run(client, args.requests)
+        print(
+            "fastpath=%-5s %6.1f req/s (%.1f ms/req)"
+            % (fastpath, args.requests / elapsed, elapsed / args.requests * 1000)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
-import hashlib
 import secrets
 from uuid import uuid4
 
 import rulez
+import transaction
 from morpfw.crud import Collection, Model, Schema
+from morpfw.crud import signals as crudsignal
 
 from ..app import App
+from ..passwordhash import (
+    apikey_cache_ttl,
+    get_apikey_cache,
+    hash_password,
+    verify_password,
+)
 from .schema import APIKeySchema
 
 
@@ -19,15 +26,27 @@ class APIKeyModel(Model):
 
     def generate_secret(self):
         api_secret = secrets.token_urlsafe(32)
-        pwhash = hashlib.sha256(api_secret.encode("utf-8")).hexdigest()
+        pwhash = hash_password(self.request.app, api_secret)
         self.update({"api_secret": pwhash})
         return api_secret
 
     def validate(self, api_secret):
-        pwhash = hashlib.sha256(api_secret.encode("utf-8")).hexdigest()
-        if pwhash == self["api_secret"]:
+        """Verify ``api_secret``. Verified secrets are remembered for
+        ``morpfw.authn.apikey_cache_ttl`` seconds so that clients sending
+        the key on every request do not pay for key derivation each time"""
+        app = self.request.app
+        cache = get_apikey_cache(app)
+        identity = self["api_identity"]
+        if cache is not None and cache.get(identity, api_secret) == self["userid"]:
             return True
-        return False
+        valid, pwhash = verify_password(app, api_secret, self["api_secret"])
+        if not valid:
+            return False
+        if pwhash is not None:
+            self.data["api_secret"] = pwhash
+        if cache is not None:
+            cache.add(identity, api_secret, self["userid"], apikey_cache_ttl(app))
+        return True
 
     def user(self):
         users = self.request.get_collection("morpfw.pas.user")
@@ -41,13 +60,35 @@ class APIKeyCollection(Collection):
     def search(self, query=None, *args, **kwargs):
         if kwargs.get("secure", True):
             if query:
-                rulez.and_(rulez.field["userid"] == self.request.identity.userid, query)
+                query = rulez.and_(
+                    rulez.field["userid"] == self.request.identity.userid, query
+                )
             else:
                 query = rulez.field["userid"] == self.request.identity.userid
         return super(APIKeyCollection, self).search(query, *args, **kwargs)
 
     def get_by_identity(self, identity):
-        res = self.search(rulez.field("api_identity") == identity)
-        if res:
-            return res[0]
-        return None
+        """Return API key of ``identity`` regardless of its owner, or
+        ``None``"""
+        return self.storage.get_by_identity(self, identity)
+
+
+def revoke_cached_apikey(app, api_identity):
+    """Drop verified secret of ``api_identity`` from the cache of ``app``,
+    now and after the transaction ends so that a secret verified
+    concurrently before the change is committed is not kept"""
+    cache = get_apikey_cache(app)
+    if cache is None:
+        return
+    cache.revoke(api_identity)
+    transaction.get().addAfterCommitHook(lambda success: cache.revoke(api_identity))
+
+
+@App.subscribe(signal=crudsignal.OBJECT_UPDATED, model=APIKeyModel)
+def revoke_updated_apikey(app, request, obj, signal):
+    revoke_cached_apikey(app, obj["api_identity"])
+
+
+@App.subscribe(signal=crudsignal.OBJECT_TOBEDELETED, model=APIKeyModel)
+def revoke_deleted_apikey(app, request, obj, signal):
+    revoke_cached_apikey(app, obj["api_identity"])
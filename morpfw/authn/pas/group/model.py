@@ -1,11 +1,13 @@
 import rulez
 from morpfw.crud import Collection, Model, Schema
 from morpfw.crud import errors as cruderrors
+from morpfw.crud import signals as crudsignal
 
 from .. import exc
 from ..app import App
 from ..exc import GroupExistsError
 from ..model import NAME_PATTERN
+from ..principal import invalidate_principal
 from .schema import GroupSchema, MemberSchema
 
 DEFAULT_VALID_ROLES = ["member", "administrator"]
@@ -29,11 +31,11 @@ class GroupModel(Model):
         return self.storage.get_user_by_username(self, username)
 
     def members(self):
-        members = self.storage.get_members(self, self.identifier)
-        active_members = [
-            member for member in members if member.data.get("state") == "active"
-        ]
-        return active_members
+        return self.storage.get_members(self, self.identifier, states=["active"])
+
+    def members_roles(self):
+        """Return list of ``(member, roles)`` of active members"""
+        return self.storage.get_members_roles(self, self.identifier, states=["active"])
 
     def children(self):
         col = GroupCollection(self.request, self.storage)
@@ -42,8 +44,7 @@ class GroupModel(Model):
 
     def add_members(self, userids):
         self.storage.add_group_members(self, self.identifier, userids)
-        for userid in userids:
-            self.storage.grant_group_user_role(self, self.identifier, userid, "member")
+        self.storage.grant_group_users_role(self, self.identifier, userids, "member")
 
     def remove_members(self, userids):
         self.storage.remove_group_members(self, self.identifier, userids)
@@ -74,3 +75,14 @@ class GroupModel(Model):
         for m in self.members():
             links.append({"rel": "member", "href": self.request.link(m)})
         return links
+
+
+@App.subscribe(signal=crudsignal.OBJECT_UPDATED, model=GroupModel)
+def invalidate_updated_group_principals(app, request, obj, signal):
+    # group name seen by members may have changed
+    invalidate_principal(request)
+
+
+@App.subscribe(signal=crudsignal.OBJECT_TOBEDELETED, model=GroupModel)
+def invalidate_deleted_group_principals(app, request, obj, signal):
+    invalidate_principal(request)
@@ -13,16 +13,15 @@ from .model import GroupCollection, GroupModel, GroupSchema, MemberSchema
 @App.json(model=GroupModel, name="members", permission=permission.View)
 def list_members(context, request):
     """Return the list of users in the group."""
-    members = context.members()
     return {
         "users": [
             {
                 "username": m.data["username"],
                 "userid": m.userid,
-                "roles": context.get_member_roles(m.userid),
+                "roles": roles,
                 "links": [rellink(m, request)],
             }
-            for m in members
+            for m, roles in context.members_roles()
         ]
     }
 
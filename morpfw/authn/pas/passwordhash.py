@@ -0,0 +1,362 @@
+"""
+Password hashing.
+
+Passwords and API key secrets are stored as ``<algorithm>$<parameters>``
+strings produced by a :class:`PasswordHasher` registered in ``HASHERS``.
+The hasher used for new hashes is configured through
+``morpfw.authn.password_hasher`` with constructor arguments in
+``morpfw.authn.password_hasher_options``, eg::
+
+    morpfw.authn.password_hasher: scrypt
+    morpfw.authn.password_hasher_options:
+      n: 32768
+
+Hashes from another hasher or with other work factors are still verified,
+and replaced on the next successful login. Legacy unsalted ``sha256``
+hexdigests are verified by :class:`SHA256Hasher`.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+#: default hasher for new hashes
+DEFAULT_HASHER = "pbkdf2_sha256"
+
+#: default number of threads computing key derivations, configurable through
+#: ``morpfw.authn.password_hash_workers``
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+#: default number of seconds a verified API key secret is remembered,
+#: configurable through ``morpfw.authn.apikey_cache_ttl``. ``0`` disables
+DEFAULT_APIKEY_CACHE_TTL = 60
+
+HASHERS: dict = {}
+
+
+def register_hasher(hasher_class):
+    """Register ``hasher_class`` under its ``algorithm`` name"""
+    HASHERS[hasher_class.algorithm] = hasher_class
+    return hasher_class
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data):
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+class PasswordHasher(object):
+    """Base class of password hashers"""
+
+    algorithm: str = ""
+
+    #: whether hashing is slow enough to be run in the hashing thread pool
+    expensive = True
+
+    def encode(self, password: str, salt: bytes = None) -> str:
+        raise NotImplementedError
+
+    def verify(self, password: str, encoded: str) -> bool:
+        raise NotImplementedError
+
+    def needs_rehash(self, encoded: str) -> bool:
+        """Whether ``encoded`` was made with other work factors"""
+        return False
+
+
+@register_hasher
+class PBKDF2SHA256Hasher(PasswordHasher):
+
+    algorithm = "pbkdf2_sha256"
+
+    def __init__(self, iterations=600000):
+        self.iterations = int(iterations)
+
+    def _derive(self, password, salt, iterations):
+        return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+    def encode(self, password, salt=None):
+        salt = salt or secrets.token_bytes(16)
+        key = self._derive(password, salt, self.iterations)
+        return "%s$%d$%s$%s" % (
+            self.algorithm,
+            self.iterations,
+            _b64encode(salt),
+            _b64encode(key),
+        )
+
+    def verify(self, password, encoded):
+        algorithm, iterations, salt, key = encoded.split("$")
+        derived = self._derive(password, _b64decode(salt), int(iterations))
+        return hmac.compare_digest(derived, _b64decode(key))
+
+    def needs_rehash(self, encoded):
+        return int(encoded.split("$")[1]) != self.iterations
+
+
+@register_hasher
+class ScryptHasher(PasswordHasher):
+
+    algorithm = "scrypt"
+
+    def __init__(self, n=16384, r=8, p=1):
+        self.n = int(n)
+        self.r = int(r)
+        self.p = int(p)
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(
+            password.encode("utf-8"),
+            salt=salt,
+            n=n,
+            r=r,
+            p=p,
+            maxmem=256 * n * r * p + (1 << 20),
+            dklen=32,
+        )
+
+    def encode(self, password, salt=None):
+        salt = salt or secrets.token_bytes(16)
+        key = self._derive(password, salt, self.n, self.r, self.p)
+        return "%s$%d$%d$%d$%s$%s" % (
+            self.algorithm,
+            self.n,
+            self.r,
+            self.p,
+            _b64encode(salt),
+            _b64encode(key),
+        )
+
+    def verify(self, password, encoded):
+        algorithm, n, r, p, salt, key = encoded.split("$")
+        derived = self._derive(password, _b64decode(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(derived, _b64decode(key))
+
+    def needs_rehash(self, encoded):
+        params = [int(v) for v in encoded.split("$")[1:4]]
+        return params != [self.n, self.r, self.p]
+
+
+@register_hasher
+class SHA256Hasher(PasswordHasher):
+    """Unsalted sha256 hexdigest, kept to verify hashes stored by earlier
+    versions. Should not be used for new hashes"""
+
+    algorithm = "sha256"
+    expensive = False
+
+    def encode(self, password, salt=None):
+        return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(self.encode(password), encoded)
+
+
+def identify_hasher(encoded: str) -> PasswordHasher:
+    """Return hasher which produced ``encoded``"""
+    if "$" not in encoded:
+        return HASHERS[SHA256Hasher.algorithm]()
+    algorithm = encoded.split("$", 1)[0]
+    if algorithm not in HASHERS:
+        raise ValueError("Unknown password hash algorithm %s" % algorithm)
+    return HASHERS[algorithm]()
+
+
+_stats = {
+    "hashes": 0,
+    "verifications": 0,
+    "failures": 0,
+    "rehashes": 0,
+    "seconds": 0.0,
+}
+_stats_lock = threading.Lock()
+
+
+def _record(key, value=1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+def stats():
+    """Return hashing counters and total seconds spent hashing, including
+    waiting for a thread of the hashing pool"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for k in _stats.keys():
+            _stats[k] = 0
+
+
+class PasswordManager(object):
+    """
+    Hash and verify passwords with ``hasher``.
+
+    Expensive key derivations run in a thread pool of ``workers`` threads,
+    the calling thread waits for the result. This bounds the CPU spent on
+    hashing during login storms so that other requests keep being served.
+    """
+
+    def __init__(self, hasher: PasswordHasher, workers: int = DEFAULT_WORKERS):
+        self.hasher = hasher
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="morpfw-passwordhash"
+        )
+
+    def _run(self, hasher, func, *args):
+        start = time.perf_counter()
+        if hasher.expensive:
+            result = self.executor.submit(func, *args).result()
+        else:
+            result = func(*args)
+        _record("seconds", time.perf_counter() - start)
+        return result
+
+    def hash(self, password: str) -> str:
+        _record("hashes")
+        return self._run(self.hasher, self.hasher.encode, password)
+
+    def verify_and_update(self, password: str, encoded: str):
+        """
+        Verify ``password`` against ``encoded``.
+
+        Returns ``(valid, new_encoded)`` where ``new_encoded`` is a new hash
+        to store when ``encoded`` was made by another hasher or with other
+        work factors, or ``None``.
+        """
+        if not encoded or password is None:
+            return False, None
+        hasher = identify_hasher(encoded)
+        _record("verifications")
+        if not self._run(hasher, hasher.verify, password, encoded):
+            _record("failures")
+            return False, None
+        migrate = hasher.algorithm != self.hasher.algorithm
+        if migrate or self.hasher.needs_rehash(encoded):
+            _record("rehashes")
+            return True, self.hash(password)
+        return True, None
+
+
+_managers: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_managers_lock = threading.Lock()
+
+
+def get_password_manager(app) -> PasswordManager:
+    """Return :class:`PasswordManager` configured for ``app``"""
+    manager = _managers.get(app, None)
+    if manager is not None:
+        return manager
+    with _managers_lock:
+        manager = _managers.get(app, None)
+        if manager is None:
+            algorithm = app.get_config("morpfw.authn.password_hasher", DEFAULT_HASHER)
+            options = app.get_config("morpfw.authn.password_hasher_options", None)
+            workers = app.get_config(
+                "morpfw.authn.password_hash_workers", DEFAULT_WORKERS
+            )
+            manager = PasswordManager(HASHERS[algorithm](**(options or {})), workers)
+            _managers[app] = manager
+    return manager
+
+
+def hash_password(app, password: str) -> str:
+    return get_password_manager(app).hash(password)
+
+
+def verify_password(app, password: str, encoded: str):
+    """Verify ``password``, see :meth:`PasswordManager.verify_and_update`"""
+    return get_password_manager(app).verify_and_update(password, encoded)
+
+
+class VerifiedCache(object):
+    """
+    Process local cache of recently verified credentials.
+
+    Entries are stored by credential name, eg: API key identity, with a
+    keyed ``blake2b`` digest of the secret using a key generated per
+    process, so that the cache does not hold secrets and a verified secret
+    is recognized without running the key derivation again. Entries of a
+    credential are dropped with :meth:`revoke` when it changes.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._key = secrets.token_bytes(32)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, name, secret):
+        data = ("%s\0%s" % (name, secret)).encode("utf-8")
+        return hashlib.blake2b(data, key=self._key, digest_size=32).digest()
+
+    def get(self, name, secret):
+        """Return value stored for ``name`` if ``secret`` is the verified
+        secret and the entry has not expired, else ``None``"""
+        digest = self._digest(name, secret)
+        with self._lock:
+            entry = self._entries.get(name, None)
+            if entry is not None and entry[2] <= time.monotonic():
+                del self._entries[name]
+                entry = None
+            if entry is not None and hmac.compare_digest(entry[0], digest):
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def add(self, name, secret, value, ttl):
+        """Remember ``secret`` of ``name`` as verified for ``ttl`` seconds"""
+        entry = (self._digest(name, secret), value, time.monotonic() + ttl)
+        with self._lock:
+            self._entries[name] = entry
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def revoke(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_apikey_caches: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_apikey_caches_lock = threading.Lock()
+
+
+def apikey_cache_ttl(app):
+    return app.get_config("morpfw.authn.apikey_cache_ttl", DEFAULT_APIKEY_CACHE_TTL)
+
+
+def get_apikey_cache(app):
+    """Return :class:`VerifiedCache` of API key secrets verified by
+    ``app``, by ``api_identity`` with the key userid as value, or ``None``
+    when disabled through ``morpfw.authn.apikey_cache_ttl``"""
+    if not apikey_cache_ttl(app):
+        return None
+    cache = _apikey_caches.get(app, None)
+    if cache is not None:
+        return cache
+    with _apikey_caches_lock:
+        cache = _apikey_caches.get(app, None)
+        if cache is None:
+            cache = VerifiedCache()
+            _apikey_caches[app] = cache
+    return cache
@@ -1,6 +1,5 @@
 import morepath
 import pytz
-import rulez
 from more.jwtauth import JWTIdentityPolicy
 from morepath import NO_IDENTITY
 
@@ -10,6 +9,7 @@ from ..base import AuthnPolicy as BaseAuthnPolicy
 from .apikey.model import APIKeyModel, APIKeySchema
 from .app import App as BaseAuthApp
 from .group.model import GroupModel, GroupSchema
+from .passwordhash import get_apikey_cache
 from .path import get_apikey_collection, get_user_collection
 from .storage.memorystorage import (
     APIKeyMemoryStorage,
@@ -39,12 +39,18 @@ class JWTWithAPIKeyIdentityPolicy(JWTIdentityPolicy):
         api_key = request.headers.get("X-API-KEY", None)
         if api_key:
             api_identity, api_secret = api_key.split(".")
-            apikeys = get_apikey_collection(request)
-            keys = apikeys.search(
-                rulez.field["api_identity"] == api_identity, secure=False
-            )
-            if keys and keys[0].data["api_secret"] == api_secret:
-                userid = keys[0].data["userid"]
+            # verified keys are served from the cache of the app without
+            # querying the storage
+            userid = None
+            cache = get_apikey_cache(request.app)
+            if cache is not None:
+                userid = cache.get(api_identity, api_secret)
+            if userid is None:
+                apikeys = get_apikey_collection(request)
+                key = apikeys.get_by_identity(api_identity)
+                if key is not None and key.validate(api_secret):
+                    userid = key.data["userid"]
+            if userid is not None:
                 return Identity(request=request, userid=userid)
         identity = super(JWTWithAPIKeyIdentityPolicy, self).identify(request)
         if isinstance(identity, morepath.Identity):
@@ -0,0 +1,120 @@
+import transaction
+
+from ...memoizer import _nomemoize, _qualname, get_backend
+
+#: default number of seconds a loaded principal is shared across requests,
+#: configurable through ``morpfw.authz.principal_ttl``
+DEFAULT_TTL = 30
+
+
+class Principal(object):
+    """User of an identity with its groups and roles, as seen by authz rules"""
+
+    def __init__(self, userid, uuid, is_administrator, group_roles):
+        self.userid = userid
+        self.uuid = uuid
+        self.is_administrator = is_administrator
+        self.group_roles = group_roles
+
+    @property
+    def groupnames(self):
+        return list(self.group_roles.keys())
+
+    def roles(self, groupname="__default__"):
+        return self.group_roles.get(groupname, [])
+
+    def __repr__(self):
+        return "<Principal %s %s>" % (self.userid, self.group_roles)
+
+
+def _cache_key(app, userid):
+    return "morpfw.principal:%s:%s" % (_qualname(app.__class__), userid)
+
+
+def _version_key(app, userid=None):
+    key = "morpfw.principal.version:%s" % _qualname(app.__class__)
+    if userid is not None:
+        key += ":%s" % userid
+    return key
+
+
+def load_principal(request, userid):
+    """Load principal of ``userid`` from the user storage, bypassing caches"""
+    users = request.get_collection("morpfw.pas.user")
+    user = users.get_by_userid(userid)
+    if user is None:
+        return None
+    return Principal(
+        userid, user.uuid, bool(user["is_administrator"]), user.group_roles()
+    )
+
+
+def get_principal(request, userid=None):
+    """
+    Return :class:`Principal` of ``userid``, defaulting to the identity of
+    ``request``, or ``None`` if the user does not exist.
+
+    Principals are cached for the request, and in the application memoize
+    backend for ``morpfw.authz.principal_ttl`` seconds. Membership and
+    role changes drop the cached principals, see :func:`invalidate_principal`.
+    """
+    if userid is None:
+        userid = request.identity.userid
+    cache = request.environ.setdefault("morpfw.cache.principal", {})
+    if userid in cache:
+        return cache[userid]
+
+    if _nomemoize(request):
+        principal = load_principal(request, userid)
+    else:
+        app = request.app
+        backend = get_backend(app)
+        version = [
+            backend.version(_version_key(app)),
+            backend.version(_version_key(app, userid)),
+        ]
+        entry = backend.get(_cache_key(app, userid))
+        if entry is not None and entry["version"] == version:
+            principal = entry["principal"]
+        else:
+            principal = load_principal(request, userid)
+            if principal is not None:
+                ttl = app.get_config("morpfw.authz.principal_ttl", DEFAULT_TTL)
+                backend.set(
+                    _cache_key(app, userid),
+                    {"principal": principal, "version": version},
+                    ttl=ttl,
+                )
+    cache[userid] = principal
+    return principal
+
+
+def invalidate_principal(request, userids=None):
+    """
+    Drop cached principals of ``userids``, or of every user if ``userids``
+    is ``None``. Cached principals are dropped again after the transaction
+    commits, so that other requests do not keep principals loaded before
+    the commit.
+    """
+    cache = request.environ.get("morpfw.cache.principal", None)
+    app = request.app
+    if userids is None:
+        keys = [_version_key(app)]
+        if cache:
+            cache.clear()
+    else:
+        keys = []
+        for userid in set(userids):
+            keys.append(_version_key(app, userid))
+            if cache:
+                cache.pop(userid, None)
+    if not keys:
+        return
+    backend = get_backend(app)
+
+    def bump():
+        for key in keys:
+            backend.bump(key)
+
+    bump()
+    transaction.get().addAfterCommitHook(lambda success: success and bump())
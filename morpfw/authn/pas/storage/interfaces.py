@@ -1,6 +1,9 @@
 import abc
+
+import rulez
+
 from ....interfaces import IModel, IStorageBase
-from typing import Optional, Union, List, Sequence
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 
 class IUserModel(IModel):
@@ -11,6 +14,10 @@ class IGroupModel(IModel):
     pass
 
 
+class IAPIKeyModel(IModel):
+    pass
+
+
 class IUserStorage(IStorageBase):
     @abc.abstractmethod
     def create(self, collection, data) -> IUserModel:
@@ -81,6 +88,15 @@ class IUserStorage(IStorageBase):
         """get groups which the userid is a member of"""
         raise NotImplementedError
 
+    def get_user_group_roles(self, collection, userid: str) -> Dict[str, List[str]]:
+        """get ``{groupname: [roles]}`` of groups which the userid is a member of.
+
+        Storages should override this with a single query"""
+        result = {}
+        for g in self.get_user_groups(collection, userid):
+            result[g["groupname"]] = g.get_member_roles(userid)
+        return result
+
     @abc.abstractmethod
     def validate(self, collection, userid: str, password: str) -> bool:
         """validate userid's password"""
@@ -143,10 +159,24 @@ class IGroupStorage(IStorageBase):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def get_members(self, groupname: str) -> List[IUserModel]:
-        """get list of members of specified group"""
+    def get_members(
+        self, groupname: str, states: Optional[List[str]] = None
+    ) -> List[IUserModel]:
+        """get list of members of specified group, optionally only members
+        in one of ``states``"""
         raise NotImplementedError
 
+    def get_members_roles(
+        self, collection, groupid: str, states: Optional[List[str]] = None
+    ) -> List[Tuple[IUserModel, List[str]]]:
+        """get list of ``(member, roles)`` of specified group.
+
+        Storages should override this with a single query"""
+        return [
+            (m, self.get_group_user_roles(collection, groupid, m.userid))
+            for m in self.get_members(collection, groupid, states=states)
+        ]
+
     @abc.abstractmethod
     def add_group_members(self, groupname: str, userids: List[str]):
         """add userids into a group"""
@@ -167,7 +197,29 @@ class IGroupStorage(IStorageBase):
         """grant userid role in group"""
         raise NotImplementedError
 
+    def grant_group_users_role(
+        self, collection, groupid: str, userids: Sequence[str], rolename: str
+    ):
+        """grant role in group to every userid.
+
+        Storages should override this with a single bulk operation"""
+        for userid in userids:
+            self.grant_group_user_role(collection, groupid, userid, rolename)
+
     @abc.abstractmethod
     def revoke_group_user_role(self, groupname: str, userid: str, rolename: str):
         """revoke userid role in group"""
         raise NotImplementedError
+
+
+class IAPIKeyStorage(IStorageBase):
+    def get_by_identity(self, collection, identity: str) -> Optional[IAPIKeyModel]:
+        """get API key by ``api_identity``, regardless of its owner.
+
+        Storages should override this with an indexed lookup"""
+        result = self.search(
+            collection, rulez.field["api_identity"] == identity, limit=1
+        )
+        if result:
+            return result[0]
+        return None
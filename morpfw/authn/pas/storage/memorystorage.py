@@ -6,8 +6,9 @@ from .. import exc
 from ..apikey.model import APIKeyModel, APIKeySchema
 from ..app import App
 from ..group.model import GroupCollection, GroupModel, GroupSchema
+from ..principal import invalidate_principal
 from ..user.model import UserCollection, UserModel, UserSchema
-from .interfaces import IGroupStorage, IUserStorage
+from .interfaces import IAPIKeyStorage, IGroupStorage, IUserStorage
 
 DB: dict = {"users": {}, "groups": {}, "rolemap": {}}
 
@@ -50,7 +51,7 @@ class UserMemoryStorage(MemoryStorage, IUserStorage):
         return user.data["password"] == password
 
 
-class APIKeyMemoryStorage(MemoryStorage):
+class APIKeyMemoryStorage(MemoryStorage, IAPIKeyStorage):
     model = APIKeyModel
 
 
@@ -80,7 +81,7 @@ class GroupMemoryStorage(MemoryStorage, IGroupStorage):
                 res.append(group)
         return res
 
-    def get_members(self, collection, groupid):
+    def get_members(self, collection, groupid, states=None):
         group = self.get(collection, groupid)
         userstorage = self.request.app.get_storage(UserModel, self.request)
         usercol = UserCollection(self.request, userstorage)
@@ -89,28 +90,34 @@ class GroupMemoryStorage(MemoryStorage, IGroupStorage):
         attrs = group.data["xattrs"]
         attrs.setdefault("members", [])
         for m in group.data["xattrs"].get("members"):
-            res.append(userstorage.get_by_userid(usercol, m))
+            user = userstorage.get_by_userid(usercol, m)
+            if states is not None and user.data.get("state") not in states:
+                continue
+            res.append(user)
         return res
 
     def add_group_members(self, collection, groupid, userids):
+        invalidate_principal(self.request, userids)
         group = self.get(collection, groupid)
         group.data.setdefault("xattrs", {})
         attrs = group.data["xattrs"]
         attrs.setdefault("members", [])
+        existing = set(attrs["members"])
         for u in userids:
             assert u is not None
-            if u not in attrs["members"]:
+            if u not in existing:
                 attrs["members"].append(u)
+                existing.add(u)
         group.data["xattrs"] = attrs
 
     def remove_group_members(self, collection, groupid, userids):
+        invalidate_principal(self.request, userids)
         group = self.get(collection, groupid)
         group.data.setdefault("xattrs", {})
         attrs = group.data["xattrs"]
         attrs.setdefault("members", [])
-        for u in userids:
-            if u in attrs["members"]:
-                attrs["members"].remove(u)
+        removed = set(userids)
+        attrs["members"] = [u for u in attrs["members"] if u not in removed]
         group.data["xattrs"] = attrs
 
     def get_group_user_roles(self, collection, groupid, userid):
@@ -120,13 +127,23 @@ class GroupMemoryStorage(MemoryStorage, IGroupStorage):
         return rolemap[groupid][userid]
 
     def grant_group_user_role(self, collection, groupid, userid, rolename):
+        invalidate_principal(self.request, [userid])
         rolemap = DB["rolemap"]
         rolemap.setdefault(groupid, {})
         rolemap[groupid].setdefault(userid, [])
         if rolename not in rolemap[groupid][userid]:
             rolemap[groupid][userid].append(rolename)
 
+    def grant_group_users_role(self, collection, groupid, userids, rolename):
+        invalidate_principal(self.request, userids)
+        rolemap = DB["rolemap"].setdefault(groupid, {})
+        for userid in userids:
+            roles = rolemap.setdefault(userid, [])
+            if rolename not in roles:
+                roles.append(rolename)
+
     def revoke_group_user_role(self, collection, groupid, userid, rolename):
+        invalidate_principal(self.request, [userid])
         rolemap = DB["rolemap"]
         rolemap.setdefault(groupid, {})
         rolemap[groupid].setdefault(userid, [])
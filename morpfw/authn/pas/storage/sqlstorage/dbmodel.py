@@ -1,6 +1,7 @@
 import sqlalchemy as sa
 import sqlalchemy.orm as saorm
 import sqlalchemy_jsonfield as sajson
+from morpfw.crud.schema import Index
 from morpfw.crud.storage.sqlstorage import GUID, Base
 from sqlalchemy.orm import relationship
 
@@ -16,6 +17,7 @@ class User(Base):
     nonce = sa.Column(sa.String(length=24))
     timezone = sa.Column(sa.String(length=124))
     is_administrator = sa.Column(sa.Boolean())
+    memberships = relationship("Membership", back_populates="user")
 
 
 class APIKey(Base):
@@ -27,6 +29,11 @@ class APIKey(Base):
     api_identity = sa.Column(sa.String(length=64))
     api_secret = sa.Column(sa.String(length=128))
 
+    __indexes__ = [
+        Index("created", "id", live=True),
+        Index("api_identity", unique=True, live=True),
+    ]
+
 
 class Group(Base):
 
@@ -34,7 +41,7 @@ class Group(Base):
 
     parent = sa.Column(sa.String(length=256))
     groupname = sa.Column(sa.String(length=256))
-    memberships = relationship("Membership", cascade="all")
+    memberships = relationship("Membership", cascade="all", back_populates="group")
 
 
 class Membership(Base):
@@ -43,9 +50,17 @@ class Membership(Base):
 
     group_id = sa.Column(sa.ForeignKey("authmanager_groups.id"))
     user_id = sa.Column(sa.ForeignKey("authmanager_users.id"))
-    sa.UniqueConstraint("group_id", "user_id", "deleted")
 
-    roles_assignment = relationship("RoleAssignment", cascade="all")
+    __indexes__ = [
+        Index("created", "id", live=True),
+        Index("group_id", "user_id", unique=True, live=True),
+    ]
+
+    group = relationship("Group", back_populates="memberships")
+    user = relationship("User", back_populates="memberships")
+    roles_assignment = relationship(
+        "RoleAssignment", cascade="all", back_populates="membership"
+    )
 
 
 class RoleAssignment(Base):
@@ -54,4 +69,9 @@ class RoleAssignment(Base):
 
     membership_id = sa.Column(sa.ForeignKey("authmanager_membership.id"))
     rolename = sa.Column(sa.String)
-    sa.UniqueConstraint("membership_id", "role_id", "deleted")
+    membership = relationship("Membership", back_populates="roles_assignment")
+
+    __indexes__ = [
+        Index("created", "id", live=True),
+        Index("membership_id", "rolename", unique=True, live=True),
+    ]
@@ -1,6 +1,9 @@
-import hashlib
+import uuid
 
 import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql import select
+from zope.sqlalchemy import mark_changed
 from morpfw.crud import errors as cruderrors
 from morpfw.crud.storage.sqlstorage import SQLStorage
 
@@ -8,13 +11,17 @@ from ... import exc
 from ...apikey.model import APIKeyModel, APIKeySchema
 from ...app import App
 from ...group.model import GroupCollection, GroupModel, GroupSchema
+from ...passwordhash import hash_password, verify_password
+from ...principal import invalidate_principal
 from ...user.model import UserCollection, UserModel, UserSchema
-from ..interfaces import IGroupStorage, IUserStorage
+from ..interfaces import IAPIKeyStorage, IGroupStorage, IUserStorage
 from . import dbmodel as db
 
 
-def hash(data):
-    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
 
 
 class UserSQLStorage(SQLStorage, IUserStorage):
@@ -22,7 +29,7 @@ class UserSQLStorage(SQLStorage, IUserStorage):
     orm_model = db.User
 
     def create(self, collection, data):
-        data["password"] = hash(data["password"])
+        data["password"] = hash_password(self.app, data["password"])
         return super(UserSQLStorage, self).create(collection, data)
 
     def get_userid(self, model):
@@ -59,43 +66,73 @@ class UserSQLStorage(SQLStorage, IUserStorage):
 
     def change_password(self, collection, userid, new_password):
         u = self.get_by_userid(collection, userid)
-        u.data["password"] = hash(new_password)
+        u.data["password"] = hash_password(self.app, new_password)
 
     def get_user_groups(self, collection, userid):
         u = self.get_by_userid(collection, userid, as_model=False)
         q = (
-            self.session.query(db.Membership)
-            .join(db.Group)
+            self.session.query(db.Group)
+            .join(db.Membership)
             .filter(sa.and_(db.Membership.user_id == u.id, db.Group.deleted.is_(None)))
         )
-        membership = q.all()
         groupstorage = self.request.app.get_storage(GroupModel, self.request)
         gcol = GroupCollection(self.request, groupstorage)
-        res = [groupstorage.get_by_id(gcol, m.group_id) for m in membership]
-        filtered = [m for m in res if not m.data["deleted"]]
-        return filtered
+        return [groupstorage.model(self.request, gcol, g) for g in q.all()]
+
+    def get_user_group_roles(self, collection, userid):
+        q = (
+            self.session.query(db.Group.groupname, db.RoleAssignment.rolename)
+            .select_from(db.Membership)
+            .join(db.Membership.group)
+            .join(db.Membership.user)
+            .outerjoin(db.Membership.roles_assignment)
+            .filter(sa.and_(db.User.uuid == userid, db.Group.deleted.is_(None)))
+            .order_by(db.Group.id, db.RoleAssignment.id)
+        )
+        result = {}
+        for groupname, rolename in q.all():
+            roles = result.setdefault(groupname, [])
+            if rolename is not None:
+                roles.append(rolename)
+        return result
 
     def validate(self, collection, userid, password):
         u = self.get_by_userid(collection, userid)
-        return u.data["password"] == hash(password)
+        valid, pwhash = verify_password(self.app, password, u.data["password"])
+        if pwhash is not None:
+            # hash made by another hasher or work factor, migrate on login
+            u.data["password"] = pwhash
+        return valid
 
-    def vacuum(self):
-        roleassignment_delete = db.RoleAssignment.__table__.delete().where(
-            db.User.deleted.isnot(None)
+    def _vacuum_rows(self, ids):
+        memberships = select([db.Membership.id]).where(db.Membership.user_id.in_(ids))
+        self.session.execute(
+            db.RoleAssignment.__table__.delete().where(
+                db.RoleAssignment.membership_id.in_(memberships)
+            )
         )
-
-        membership_delete = db.Membership.__table__.delete().where(
-            db.User.deleted.isnot(None)
+        self.session.execute(
+            db.Membership.__table__.delete().where(db.Membership.user_id.in_(ids))
         )
-        self.session.execute(roleassignment_delete)
-        self.session.execute(membership_delete)
-        return super().vacuum()
+        super()._vacuum_rows(ids)
 
 
-class APIKeySQLStorage(SQLStorage):
+class APIKeySQLStorage(SQLStorage, IAPIKeyStorage):
     model = APIKeyModel
     orm_model = db.APIKey
 
+    def get_by_identity(self, collection, identity):
+        k = (
+            self.session.query(db.APIKey)
+            .filter(
+                sa.and_(db.APIKey.api_identity == identity, db.APIKey.deleted.is_(None))
+            )
+            .first()
+        )
+        if not k:
+            return None
+        return self.model(self.request, collection, k)
+
 
 class GroupSQLStorage(SQLStorage, IGroupStorage):
     model = GroupModel
@@ -111,18 +148,23 @@ class GroupSQLStorage(SQLStorage, IGroupStorage):
         user_collection = UserCollection(self.request, user_storage)
         return user_storage.get_by_username(user_collection, username, as_model)
 
-    def get_members(self, collection, groupid):
-        q = (
-            self.session.query(db.User)
-            .join(db.Membership)
-            .join(db.Group)
-            .filter(
-                sa.and_(
-                    db.Group.uuid == groupid,
-                    db.Group.deleted.is_(None),
-                    db.User.deleted.is_(None),
-                )
-            )
+    def _members_query(self, query, groupid, states=None):
+        condition = [
+            db.Group.uuid == groupid,
+            db.Group.deleted.is_(None),
+            db.User.deleted.is_(None),
+        ]
+        if states is not None:
+            condition.append(db.User.state.in_(states))
+        return (
+            query.join(db.Membership.group)
+            .join(db.Membership.user)
+            .filter(sa.and_(*condition))
+        )
+
+    def get_members(self, collection, groupid, states=None):
+        q = self._members_query(
+            self.session.query(db.User).select_from(db.Membership), groupid, states
         )
         members = []
         user_storage = self.app.get_storage(UserModel, self.request)
@@ -132,63 +174,115 @@ class GroupSQLStorage(SQLStorage, IGroupStorage):
             members.append(user_storage.model(self.request, user_collection, m))
         return members
 
-    def add_group_members(self, collection, groupid, userids):
-        # FIXME: not using sqlalchemy relations might impact performance
-        g = (
-            self.session.query(db.Group)
+    def get_members_roles(self, collection, groupid, states=None):
+        q = self._members_query(
+            self.session.query(db.User, db.RoleAssignment.rolename).select_from(
+                db.Membership
+            ),
+            groupid,
+            states,
+        )
+        q = q.outerjoin(db.Membership.roles_assignment).order_by(
+            db.Membership.id, db.RoleAssignment.id
+        )
+        user_storage = self.app.get_storage(UserModel, self.request)
+        user_collection = UserCollection(self.request, user_storage)
+        result = []
+        members = {}
+        for u, rolename in q.all():
+            if u.id not in members:
+                m = user_storage.model(self.request, user_collection, u)
+                members[u.id] = (m, [])
+                result.append(members[u.id])
+            if rolename is not None:
+                members[u.id][1].append(rolename)
+        return result
+
+    def _get_group_id(self, groupid):
+        return (
+            self.session.query(db.Group.id)
             .filter(sa.and_(db.Group.uuid == groupid, db.Group.deleted.is_(None)))
-            .first()
+            .scalar()
         )
-        if not g:
-            raise ValueError("Group Does Not Exist %s" % groupid)
-        gid = g.id
+
+    def _get_user_ids(self, userids):
+        """Resolve ``userids`` into a dictionary of userid to user row id,
+        with one ``IN`` query per ``bulk_batch_size`` userids"""
+        userids = list(dict.fromkeys(userids))
+        found = {}
+        for batch in _chunks(userids, self.bulk_batch_size):
+            q = self.session.query(db.User.uuid, db.User.id).filter(
+                db.User.uuid.in_(batch)
+            )
+            found.update(q.all())
+        result = {}
         for userid in userids:
-            u = self.get_user_by_userid(collection, userid, as_model=False)
-            uid = u.id
-            e = (
-                self.session.query(db.Membership)
-                .join(db.Group)
-                .filter(
-                    sa.and_(
-                        db.Membership.group_id == gid,
-                        db.Membership.user_id == uid,
-                        db.Group.deleted.is_(None),
-                    )
-                )
-                .first()
+            try:
+                uid = found.get(uuid.UUID(str(userid)), None)
+            except ValueError:
+                uid = None
+            if uid is None:
+                raise exc.UserDoesNotExistsError(userid)
+            result[userid] = uid
+        return result
+
+    def _get_memberships(self, gid, uids):
+        """Return dictionary of user row id to membership row id of ``uids``
+        in group row ``gid``"""
+        result = {}
+        for batch in _chunks(uids, self.bulk_batch_size):
+            q = self.session.query(db.Membership.user_id, db.Membership.id).filter(
+                sa.and_(db.Membership.group_id == gid, db.Membership.user_id.in_(batch))
             )
-            if not e:
-                m = db.Membership()
-                m.group_id = gid
-                m.user_id = uid
-                self.session.add(m)
+            result.update(q.all())
+        return result
 
-    def remove_group_members(self, collection, groupid, userids):
-        g = (
-            self.session.query(db.Group)
-            .filter(sa.and_(db.Group.uuid == groupid, db.Group.deleted.is_(None)))
-            .first()
+    def _insert_missing(self, orm_model, rows):
+        """Insert ``rows`` with one executemany ``INSERT`` per
+        ``bulk_batch_size`` rows. On PostgreSQL rows conflicting with an
+        unique index, inserted by a concurrent transaction, are skipped"""
+        if not rows:
+            return
+        table = orm_model.__table__
+        if self.session.get_bind().dialect.name == "postgresql":
+            stmt = pg_insert(table).on_conflict_do_nothing()
+        else:
+            stmt = table.insert()
+        for batch in _chunks(rows, self.bulk_batch_size):
+            self.session.execute(stmt, batch)
+        mark_changed(self.session())
+
+    def add_group_members(self, collection, groupid, userids):
+        invalidate_principal(self.request, userids)
+        gid = self._get_group_id(groupid)
+        if gid is None:
+            raise ValueError("Group Does Not Exist %s" % groupid)
+        uids = list(dict.fromkeys(self._get_user_ids(userids).values()))
+        existing = self._get_memberships(gid, uids)
+        self._insert_missing(
+            db.Membership,
+            [{"group_id": gid, "user_id": uid} for uid in uids if uid not in existing],
         )
-        if not g:
+
+    def remove_group_members(self, collection, groupid, userids):
+        invalidate_principal(self.request, userids)
+        gid = self._get_group_id(groupid)
+        if gid is None:
             raise exc.GroupDoesNotExistsError(groupid)
-        gid = g.id
-        for userid in userids:
-            u = self.get_user_by_userid(collection, userid, as_model=False)
-            uid = u.id
-            members = (
-                self.session.query(db.Membership)
-                .join(db.Group)
-                .filter(
-                    sa.and_(
-                        db.Membership.group_id == gid,
-                        db.Membership.user_id == uid,
-                        db.Group.deleted.is_(None),
+        uids = set(self._get_user_ids(userids).values())
+        for batch in _chunks(uids, self.bulk_batch_size):
+            condition = sa.and_(
+                db.Membership.group_id == gid, db.Membership.user_id.in_(batch)
+            )
+            self.session.execute(
+                db.RoleAssignment.__table__.delete().where(
+                    db.RoleAssignment.membership_id.in_(
+                        select([db.Membership.id]).where(condition)
                     )
                 )
-                .all()
             )
-            for m in members:
-                self.session.delete(m)
+            self.session.execute(db.Membership.__table__.delete().where(condition))
+        mark_changed(self.session())
 
     def get_group_user_roles(self, collection, groupid, userid):
         g = (
@@ -229,46 +323,39 @@ class GroupSQLStorage(SQLStorage, IGroupStorage):
         return self.model(self.request, collection, g)
 
     def grant_group_user_role(self, collection, groupid, userid, rolename):
-        g = (
-            self.session.query(db.Group)
-            .filter(sa.and_(db.Group.uuid == groupid, db.Group.deleted.is_(None)))
-            .first()
-        )
-        if not g:
+        self.grant_group_users_role(collection, groupid, [userid], rolename)
+
+    def grant_group_users_role(self, collection, groupid, userids, rolename):
+        invalidate_principal(self.request, userids)
+        gid = self._get_group_id(groupid)
+        if gid is None:
             raise exc.GroupDoesNotExistsError(groupid)
-        gid = g.id
-        u = self.get_user_by_userid(collection, userid, as_model=False)
-        uid = u.id
-        m = (
-            self.session.query(db.Membership)
-            .join(db.Group)
-            .filter(
+        uids = self._get_user_ids(userids)
+        memberships = self._get_memberships(gid, set(uids.values()))
+        for userid, uid in uids.items():
+            if uid not in memberships:
+                raise exc.MembershipError(userid, groupid)
+        mids = list(dict.fromkeys(memberships[uid] for uid in uids.values()))
+        existing = set()
+        for batch in _chunks(mids, self.bulk_batch_size):
+            q = self.session.query(db.RoleAssignment.membership_id).filter(
                 sa.and_(
-                    db.Membership.group_id == gid,
-                    db.Membership.user_id == uid,
-                    db.Group.deleted.is_(None),
+                    db.RoleAssignment.membership_id.in_(batch),
+                    db.RoleAssignment.rolename == rolename,
                 )
             )
-            .first()
-        )
-        if not m:
-            raise exc.MembershipError(userid, groupid)
-        ra = (
-            self.session.query(db.RoleAssignment)
-            .filter(
-                db.RoleAssignment.membership_id == m.id,
-                db.RoleAssignment.rolename == rolename,
-            )
-            .first()
+            existing.update(mid for (mid,) in q.all())
+        self._insert_missing(
+            db.RoleAssignment,
+            [
+                {"membership_id": mid, "rolename": rolename}
+                for mid in mids
+                if mid not in existing
+            ],
         )
-        if ra:
-            return
-        r = db.RoleAssignment()
-        r.membership_id = m.id
-        r.rolename = rolename
-        self.session.add(r)
 
     def revoke_group_user_role(self, collection, groupid, userid, rolename):
+        invalidate_principal(self.request, [userid])
         g = (
             self.session.query(db.Group)
             .filter(sa.and_(db.Group.uuid == groupid, db.Group.deleted.is_(None)))
@@ -304,13 +391,14 @@ class GroupSQLStorage(SQLStorage, IGroupStorage):
         if ra:
             self.session.delete(ra)
 
-    def vacuum(self):
-        roleassignment_delete = db.RoleAssignment.__table__.delete().where(
-            db.Group.deleted.isnot(None)
+    def _vacuum_rows(self, ids):
+        memberships = select([db.Membership.id]).where(db.Membership.group_id.in_(ids))
+        self.session.execute(
+            db.RoleAssignment.__table__.delete().where(
+                db.RoleAssignment.membership_id.in_(memberships)
+            )
         )
-        membership_delete = db.Membership.__table__.delete().where(
-            db.Group.deleted.isnot(None)
+        self.session.execute(
+            db.Membership.__table__.delete().where(db.Membership.group_id.in_(ids))
         )
-        self.session.execute(roleassignment_delete)
-        self.session.execute(membership_delete)
-        return super().vacuum()
+        super()._vacuum_rows(ids)
@@ -19,6 +19,7 @@ from ..exc import UserExistsError
 from ..group.model import GroupCollection, GroupModel, GroupSchema
 from ..group.path import get_group_collection
 from ..model import EMAIL_PATTERN, NAME_PATTERN
+from ..principal import invalidate_principal
 from ..utils import has_role
 from .schema import LoginSchema, RegistrationSchema, UserSchema
 
@@ -84,10 +85,7 @@ class UserModel(Model):
         return self.storage.get_user_groups(self.collection, self.userid)
 
     def group_roles(self):
-        group_roles = {}
-        for g in self.groups():
-            group_roles[g.data["groupname"]] = g.get_member_roles(self.userid)
-        return group_roles
+        return self.storage.get_user_group_roles(self.collection, self.userid)
 
     def timezone(self):
         tz = self["timezone"] or "UTC"
@@ -132,5 +130,15 @@ def add_user_to_default_group(app, request, obj, signal):
     g.add_members([obj.userid])
 
 
+@App.subscribe(signal=crudsignal.OBJECT_UPDATED, model=UserModel)
+def invalidate_updated_user_principal(app, request, obj, signal):
+    invalidate_principal(request, [obj.userid])
+
+
+@App.subscribe(signal=crudsignal.OBJECT_TOBEDELETED, model=UserModel)
+def invalidate_deleted_user_principal(app, request, obj, signal):
+    invalidate_principal(request, [obj.userid])
+
+
 class CurrentUserModel(UserModel):
     pass
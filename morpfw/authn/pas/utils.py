@@ -1,6 +1,6 @@
 import re
 
-from .group.path import get_group_collection
+from .principal import get_principal
 
 UUID_REGEX = re.compile(r"^([a-f0-9]){32}$")
 
@@ -19,17 +19,12 @@ def has_role(request, role, userid=None, groupname="__default__"):
         # FIXME: this is a workaround hack with PAS
         # it should check for which authentication plugin being used
         if userid and UUID_REGEX.match(userid):
-            users = request.get_collection("morpfw.pas.user")
-            user = users.get_by_userid(userid)
-            if user and user["is_administrator"]:
+            principal = get_principal(request, userid)
+            if principal and principal.is_administrator:
                 return True
             return False
 
-    group_col = get_group_collection(request)
-    defgroup = group_col.get_by_groupname(groupname)
-    if not userid:
-        userid = request.identity.userid
-    roles = defgroup.get_member_roles(userid)
-    users = request.get_collection("morpfw.pas.user")
-    user = users.get_by_userid(userid)
-    return role in roles
+    principal = get_principal(request, userid or request.identity.userid)
+    if principal is None:
+        return False
+    return role in principal.roles(groupname)
@@ -1,4 +1,5 @@
 from ...app import BaseApp as App
+from ...authn.pas.principal import get_principal
 from ...crud import permission as crudperms
 from ...crud.model import Collection, Model
 from ...permission import All
@@ -6,13 +7,13 @@ from ...permission import All
 
 @App.authz_rule(name="morpfw.readonly")
 def group_policy(groupname, identity, model, permission):
-    request = model.request
-    users = request.get_collection("morpfw.pas.user")
-    user = users.get_by_userid(identity.userid)
-    if user["is_administrator"]:
+    principal = get_principal(model.request, identity.userid)
+    if principal is None:
+        return False
+    if principal.is_administrator:
         return True
 
-    if groupname not in [g["groupname"] for g in user.groups()]:
+    if groupname not in principal.groupnames:
         return False
 
     if isinstance(model, Collection):
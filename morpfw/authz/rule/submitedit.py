@@ -1,4 +1,7 @@
+import rulez
+
 from ...app import BaseApp as App
+from ...authn.pas.principal import get_principal
 from ...crud import permission as crudperms
 from ...crud.model import Collection, Model
 from ...permission import All
@@ -6,13 +9,13 @@ from ...permission import All
 
 @App.authz_rule(name="morpfw.submit-edit")
 def group_policy(groupname, identity, model, permission):
-    request = model.request
-    users = request.get_collection("morpfw.pas.user")
-    user = users.get_by_userid(identity.userid)
-    if user["is_administrator"]:
+    principal = get_principal(model.request, identity.userid)
+    if principal is None:
+        return False
+    if principal.is_administrator:
         return True
 
-    if groupname not in [g["groupname"] for g in user.groups()]:
+    if groupname not in principal.groupnames:
         return False
 
     if isinstance(model, Collection):
@@ -23,7 +26,7 @@ def group_policy(groupname, identity, model, permission):
         if issubclass(permission, crudperms.Create):
             return True
     elif isinstance(model, Model):
-        if model["creator"] != user.uuid:
+        if model["creator"] != principal.uuid:
             return False
 
         if issubclass(permission, crudperms.All):
@@ -33,3 +36,8 @@ def group_policy(groupname, identity, model, permission):
             return True
     return False
 
+
+@App.authz_rule_filter(name="morpfw.submit-edit")
+def search_filter(groupname, identity, collection):
+    principal = get_principal(collection.request, identity.userid)
+    return rulez.field["creator"] == principal.uuid
@@ -3,11 +3,14 @@ import importlib
 import os
 import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from configparser import RawConfigParser
+from datetime import timedelta
 
 import click
 import morpfw
 import reg
+import transaction
 from alembic.config import CommandLine as AlembicCLI
 from alembic.config import Config as AlembicCfg
 from alembic.config import main as alembic_main
@@ -85,24 +88,98 @@ def resetdb(ctx):
         drop_all(request)
 
 
+def parse_duration(value):
+    """Parse durations such as ``30d``, ``12h``, ``15m`` or ``90s`` into a
+    ``timedelta``. Plain numbers are days"""
+    units = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+    value = value.strip()
+    unit = "d"
+    if value and value[-1] in units:
+        value, unit = value[:-1], value[-1]
+    try:
+        return timedelta(**{units[unit]: float(value)})
+    except ValueError:
+        raise click.BadParameter("Invalid duration %s" % value)
+
+
+def vacuum_type(typeinfo, batch_size=None, older_than=None, dry_run=False):
+    storage = typeinfo.get_storage()
+    iter_vacuum = getattr(storage, "iter_vacuum", None)
+    if iter_vacuum is None:
+        vacuum_f = getattr(storage, "vacuum", None)
+        if vacuum_f is None or dry_run:
+            return None
+        return vacuum_f()
+
+    name = typeinfo["name"]
+    total = storage.vacuum_count(older_than=older_than)
+    if not total:
+        return 0
+    affected = 0
+    for count in iter_vacuum(
+        batch_size=batch_size, older_than=older_than, dry_run=dry_run
+    ):
+        affected += count
+        if not dry_run:
+            # commit per batch to keep locks short
+            transaction.commit()
+        print("Vacuuming %s: %s/%s" % (name, affected, total))
+    return affected
+
+
 @cli.command(help="Vacuum database")
+@click.option("--batch-size", type=int, default=None, help="Rows removed per batch")
+@click.option(
+    "--older-than",
+    default=None,
+    help="Only remove records deleted before this duration (eg: 30d, 12h)",
+)
+@click.option(
+    "--dry-run", is_flag=True, help="Report affected records without removing them"
+)
+@click.option("-j", "--jobs", type=int, default=1, help="Types vacuumed in parallel")
 @click.pass_context
-def vacuum(ctx):
+def vacuum(ctx, batch_size, older_than, dry_run, jobs):
     param = load(ctx.obj["settings"])
 
     settings = param["settings"]
+    if older_than is not None:
+        older_than = parse_duration(older_than)
 
     with morpfw.request_factory(settings) as request:
 
         types = request.app.config.type_registry.get_typeinfos(request)
-        for typeinfo in types.values():
-
-            collection = request.get_collection(typeinfo["name"])
-            vacuum_f = getattr(collection.storage, "vacuum", None)
-            if vacuum_f:
-                print("Vacuuming %s" % typeinfo["name"])
-                items = vacuum_f()
-                print("%s record(s) affected" % items)
+
+        def run(name):
+            # each worker thread gets its own transaction and db session
+            environ = dict(request.environ)
+            environ.pop("morpfw.memoize", None)
+            req = request.app.request_class(app=request.app, environ=environ)
+            transaction.begin()
+            try:
+                typeinfo = req.get_typeinfo(name)
+                items = vacuum_type(
+                    typeinfo,
+                    batch_size=batch_size,
+                    older_than=older_than,
+                    dry_run=dry_run,
+                )
+                transaction.commit()
+            except:  # noqa
+                transaction.abort()
+                raise
+            finally:
+                req.clear_db_session()
+            return name, items
+
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            for name, items in executor.map(run, types.keys()):
+                if items is None:
+                    continue
+                if dry_run:
+                    print("%s: %s record(s) to be removed" % (name, items))
+                else:
+                    print("%s: %s record(s) affected" % (name, items))
 
 
 @cli.command(
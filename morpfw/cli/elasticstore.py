@@ -15,9 +15,9 @@ def update_esindex(ctx):
 
         types = request.app.config.type_registry.get_typeinfos(request)
         for typeinfo in types.values():
-            collection = request.get_collection(typeinfo["name"])
-            storage = collection.storage
+            storage = typeinfo.get_storage()
             if isinstance(storage, morpfw.ElasticSearchStorage):
+                collection = typeinfo.get_collection()
                 print("Creating index %s .. " % storage.index_name, end="")
                 if storage.create_index(collection):
                     print("OK")
@@ -44,8 +44,7 @@ def reset_esindex(ctx):
         types = request.app.config.type_registry.get_typeinfos(request)
         client = request.get_es_client()
         for typeinfo in types.values():
-            collection = request.get_collection(typeinfo["name"])
-            storage = collection.storage
+            storage = typeinfo.get_storage()
             if isinstance(storage, morpfw.ElasticSearchStorage):
                 print("Deleting index %s .. " % storage.index_name, end="")
                 client.indices.delete(storage.index_name)
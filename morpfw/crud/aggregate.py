@@ -0,0 +1,292 @@
+import math
+import statistics
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytz
+from dateutil.parser import parse as parse_date
+
+from .errors import UnprocessableError
+
+#: functions which extract a part of a datetime, result is an integer
+PART_FUNCTIONS = {"year": "year", "month": "month", "day": "day"}
+
+#: functions which group datetimes into time buckets, as
+#: ``(unit, step, output format)``. ``None`` format outputs ISO 8601
+BUCKET_FUNCTIONS = {
+    "date": ("day", 1, "%Y-%m-%d"),
+    "hourly": ("hour", 1, "%Y-%m-%d %H:00 %Z"),
+    "interval_1m": ("minute", 1, "%Y-%m-%dT%H:%M%z"),
+    "interval_15m": ("minute", 15, "%Y-%m-%dT%H:%M%z"),
+    "interval_30m": ("minute", 30, "%Y-%m-%dT%H:%M%z"),
+    "interval_1h": ("hour", 1, "%Y-%m-%dT%H:%M%z"),
+    "date_trunc": (None, 1, None),
+}
+
+BUCKET_UNITS = ["minute", "hour", "day", "week", "month", "quarter", "year"]
+
+METRIC_FUNCTIONS = [
+    "count",
+    "count_distinct",
+    "sum",
+    "avg",
+    "min",
+    "max",
+    "stddev",
+    "percentile",
+    "median",
+]
+
+
+class Dimension(object):
+    """
+    Group by key of an aggregate.
+
+    ``function`` is ``None`` when grouping by the raw ``field`` value, a
+    key of ``PART_FUNCTIONS`` or a key of ``BUCKET_FUNCTIONS``
+    """
+
+    def __init__(self, key, field, function=None, unit=None, timezone=None):
+        self.key = key
+        self.field = field
+        self.function = function
+        self.timezone = timezone
+        self.step = 1
+        self.output_format = None
+        if function in BUCKET_FUNCTIONS:
+            default_unit, self.step, self.output_format = BUCKET_FUNCTIONS[function]
+            unit = default_unit or unit
+            if unit not in BUCKET_UNITS:
+                raise UnprocessableError("Invalid time bucket unit %s" % unit)
+        self.unit = unit
+        try:
+            self.tz = pytz.timezone(timezone or "UTC")
+        except pytz.UnknownTimeZoneError:
+            raise UnprocessableError("Unknown timezone %s" % timezone)
+
+    @property
+    def is_part(self):
+        return self.function in PART_FUNCTIONS
+
+    @property
+    def is_bucket(self):
+        return self.function in BUCKET_FUNCTIONS
+
+    def _localize(self, value):
+        if isinstance(value, str):
+            value = parse_date(value)
+        if value.tzinfo is None:
+            value = pytz.UTC.localize(value)
+        return value.astimezone(self.tz)
+
+    def bucket(self, value):
+        """Compute the group key of ``value`` in python"""
+        if value is None or self.function is None:
+            return value
+        local = self._localize(value)
+        if self.is_part:
+            return getattr(local, PART_FUNCTIONS[self.function])
+        local = local.replace(second=0, microsecond=0, tzinfo=None)
+        if self.unit == "minute":
+            local = local.replace(minute=local.minute - local.minute % self.step)
+        else:
+            local = local.replace(minute=0)
+            if self.unit != "hour":
+                local = local.replace(hour=0)
+            if self.unit == "week":
+                local = local - timedelta(days=local.weekday())
+            elif self.unit == "month":
+                local = local.replace(day=1)
+            elif self.unit == "quarter":
+                local = local.replace(day=1, month=(local.month - 1) // 3 * 3 + 1)
+            elif self.unit == "year":
+                local = local.replace(day=1, month=1)
+        return self.tz.localize(local)
+
+    def format(self, value):
+        """Convert group key computed by a storage into the output value.
+
+        Time buckets may be given as datetime or epoch milliseconds"""
+        if value is None or self.function is None:
+            return format_value(value)
+        if self.is_part:
+            return int(value)
+        if isinstance(value, (int, float)):
+            value = datetime.fromtimestamp(value / 1000, tz=pytz.UTC)
+        value = self._localize(value)
+        if self.output_format:
+            return value.strftime(self.output_format)
+        return value.isoformat()
+
+
+class Metric(object):
+    """Aggregated value of an aggregate"""
+
+    def __init__(self, key, field, function, percentile=None):
+        self.key = key
+        self.field = field
+        self.function = function
+        if function == "median":
+            percentile = 0.5
+        if function in ["percentile", "median"]:
+            try:
+                percentile = float(percentile)
+            except (TypeError, ValueError):
+                raise UnprocessableError("Invalid percentile %s" % percentile)
+            if not 0 <= percentile <= 1:
+                raise UnprocessableError("Percentile must be between 0 and 1")
+        self.percentile = percentile
+
+    def compute(self, values):
+        """Compute the metric in python from the non null ``values``"""
+        f = self.function
+        if f == "count":
+            return len(values)
+        if f == "count_distinct":
+            return len(set(values))
+        if not values:
+            return None
+        if f == "sum":
+            return sum(values)
+        if f == "avg":
+            return statistics.mean(values)
+        if f == "min":
+            return min(values)
+        if f == "max":
+            return max(values)
+        if f == "stddev":
+            if len(values) < 2:
+                return None
+            return statistics.stdev(values)
+        # linear interpolation, same as percentile_cont
+        values = sorted(values)
+        pos = (len(values) - 1) * self.percentile
+        lower = math.floor(pos)
+        upper = math.ceil(pos)
+        if lower == upper:
+            return values[int(pos)]
+        return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+
+def format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return value.hex
+    return value
+
+
+class AggregatePlan(object):
+    """
+    Aggregate ``group`` specification parsed into dimensions and metrics.
+
+    ``group`` is a dictionary of output key to either a field name, which
+    groups by the field value, or a dictionary with ``function`` and
+    ``field``. Time functions accept an optional ``timezone``,
+    ``date_trunc`` requires a ``unit`` and ``percentile`` requires a
+    ``percentile`` between 0 and 1.
+
+    Storages compile the plan into their query language and use
+    :meth:`format_row` and :meth:`finalize` so that results match across
+    storages. :meth:`aggregate` computes the aggregate in python over a
+    list of records.
+    """
+
+    def __init__(self, group):
+        self.dimensions = []
+        self.metrics = []
+        for key, spec in group.items():
+            if isinstance(spec, str):
+                self.dimensions.append(Dimension(key, spec))
+                continue
+            function = spec.get("function", None)
+            field = spec.get("field", None)
+            if not field:
+                raise UnprocessableError("Missing field for %s" % key)
+            if function in PART_FUNCTIONS or function in BUCKET_FUNCTIONS:
+                self.dimensions.append(
+                    Dimension(
+                        key,
+                        field,
+                        function,
+                        unit=spec.get("unit", None),
+                        timezone=spec.get("timezone", None),
+                    )
+                )
+            elif function in METRIC_FUNCTIONS:
+                self.metrics.append(
+                    Metric(key, field, function, spec.get("percentile", None))
+                )
+            else:
+                raise UnprocessableError("Unknown function %s" % function)
+
+    @property
+    def fields(self):
+        result = []
+        for item in self.dimensions + self.metrics:
+            if item.field not in result:
+                result.append(item.field)
+        return result
+
+    def format_row(self, row):
+        result = {}
+        dimensions = dict((d.key, d) for d in self.dimensions)
+        for k, v in row.items():
+            if k in dimensions:
+                result[k] = dimensions[k].format(v)
+            else:
+                result[k] = format_value(v)
+        return result
+
+    def finalize(self, rows, order_by=None, limit=None):
+        """Apply ``order_by`` and ``limit`` on formatted rows"""
+        if order_by is not None:
+            key, direction = order_by
+            if direction not in ["asc", "desc"]:
+                raise KeyError(direction)
+            # nulls sort last in ascending order, same as postgresql
+            rows = sorted(
+                rows,
+                key=lambda r: (r.get(key) is None, r.get(key)),
+                reverse=(direction == "desc"),
+            )
+        if limit is not None:
+            rows = rows[: int(limit)]
+        return rows
+
+    def aggregate(self, records, order_by=None, limit=None):
+        """Compute aggregate over ``records``, a list of dictionaries.
+
+        Values are extracted into per field columns, dimension columns are
+        bucketed once and rows are grouped by index over the columns"""
+        columns = {}
+        for field in self.fields:
+            columns[field] = [r.get(field, None) for r in records]
+        return self.aggregate_columns(columns, len(records), order_by, limit)
+
+    def aggregate_columns(self, columns, size, order_by=None, limit=None):
+        """Compute aggregate over ``columns``, a dictionary of field name to
+        list of ``size`` values"""
+        keys = [
+            [d.bucket(v) for v in columns[d.field]] if d.function else columns[d.field]
+            for d in self.dimensions
+        ]
+        groups = {}
+        if keys:
+            for idx, key in enumerate(zip(*keys)):
+                groups.setdefault(key, []).append(idx)
+        else:
+            groups[()] = list(range(size))
+
+        rows = []
+        for key, indexes in groups.items():
+            row = dict((d.key, v) for d, v in zip(self.dimensions, key))
+            for m in self.metrics:
+                column = columns[m.field]
+                values = [column[i] for i in indexes if column[i] is not None]
+                row[m.key] = m.compute(values)
+            rows.append(self.format_row(row))
+        return self.finalize(rows, order_by, limit)
@@ -10,21 +10,53 @@ from ..model import Collection
 class AggregateProvider(IAggregateProvider):
 
     field_pattern = re.compile(r"(\w+):(\w+)")
-    function_pattern = re.compile(r"(\w+):([\_\w]+)\((\w+)\)")
+    function_pattern = re.compile(r"(\w+):([\_\w]+)\(([^)]*)\)")
 
     def __init__(self, context: Collection):
         self.context = context
         self.storage = context.storage
         self.request = context.request
 
+    def _tokenize(self, qs):
+        # split on commas which are not within function arguments
+        tokens = []
+        depth = 0
+        current = ""
+        for c in qs.strip():
+            if c == "," and depth == 0:
+                tokens.append(current.strip())
+                current = ""
+                continue
+            if c == "(":
+                depth += 1
+            elif c == ")":
+                depth -= 1
+            current += c
+        tokens.append(current.strip())
+        return tokens
+
+    def _function_spec(self, function, args):
+        args = [a.strip() for a in args.split(",")]
+        spec = {"function": function, "field": args[0]}
+        params = args[1:]
+        if function == "percentile":
+            names = ["percentile"]
+        elif function == "date_trunc":
+            names = ["unit", "timezone"]
+        else:
+            names = ["timezone"]
+        if len(params) > len(names):
+            raise ValueError(args)
+        spec.update(dict(zip(names, params)))
+        return spec
+
     def _parse(self, qs):
-        tokens = [ss.strip() for ss in qs.strip().split(",")]
         result = []
-        for t in tokens:
+        for t in self._tokenize(qs):
             m = self.function_pattern.match(t)
             if m:
                 g = m.groups()
-                result.append((g[0], {"function": g[1], "field": g[2]}))
+                result.append((g[0], self._function_spec(g[1], g[2])))
                 continue
             m = self.field_pattern.match(t)
             if m:
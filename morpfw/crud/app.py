@@ -8,7 +8,9 @@ from more.jsonschema import JsonSchemaApp
 from more.signals import SignalApp
 from sqlalchemy.orm import sessionmaker
 
+from .. import memoizer
 from . import component as actions
+from . import jsonserializer, schemacache
 from . import signals as signals
 from .blobstorage.base import NullBlobStorage
 from .model import Model
@@ -36,6 +38,17 @@ class App(JsonSchemaApp, signals.SignalApp):
     typeinfo = dectate.directive(actions.TypeInfoFactoryAction)
     metalink = dectate.directive(actions.MetalinkAction)
     authz_rule = dectate.directive(actions.AuthzRuleAction)
+    authz_rule_filter = dectate.directive(actions.AuthzRuleFilterAction)
+    search_filter = dectate.directive(actions.SearchFilterAction)
+
+    @classmethod
+    def commit(cls):
+        result = super().commit()
+        # schemas might have been redefined, drop schemas compiled earlier
+        schemacache.clear()
+        jsonserializer.clear()
+        memoizer.clear_backends()
+        return result
 
     def get_storage(self, model, request):
         blobstorage = self.get_blobstorage(model, request)
@@ -88,6 +101,16 @@ class App(JsonSchemaApp, signals.SignalApp):
     def get_authz_rule(self, name):
         raise NotImplementedError(name)
 
+    @reg.dispatch(reg.match_key("name"))
+    def get_authz_rule_filter(self, name):
+        return None
+
+    @reg.dispatch_method(
+        reg.match_instance("model", lambda self, context, identity: context)
+    )
+    def get_search_filter(self, context, identity):
+        return None
+
     @reg.dispatch_method(
         reg.match_class("schema", lambda self, schema, obj, storage: schema),
         reg.match_instance("obj"),
@@ -56,7 +56,8 @@ class Blob(IBlob):
 
 
 class BlobStorage(IBlobStorage):
-    pass
+    def get_many(self, uuids: typing.List[str]) -> typing.List[typing.Optional[Blob]]:
+        return [self.get(uuid) for uuid in uuids]
 
 
 class NullBlobStorage(BlobStorage):
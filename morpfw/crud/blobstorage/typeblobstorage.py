@@ -149,12 +149,7 @@ class TypeBlobStorage(BlobStorage):
         }
         return TypeBlob(obj, **meta)
 
-    def get(self, uuid: str) -> typing.Optional[TypeBlob]:
-        col = self.request.get_collection(self.type_name)
-        obj = col.get(uuid)
-        if not obj:
-            return None
-
+    def _blob(self, obj) -> TypeBlob:
         meta = {
             "uuid": obj.uuid,
             "filename": obj["filename"],
@@ -164,6 +159,19 @@ class TypeBlobStorage(BlobStorage):
         }
         return TypeBlob(obj, **meta)
 
+    def get(self, uuid: str) -> typing.Optional[TypeBlob]:
+        col = self.request.get_collection(self.type_name)
+        obj = col.get(uuid)
+        if not obj:
+            return None
+        return self._blob(obj)
+
+    def get_many(
+        self, uuids: typing.List[str]
+    ) -> typing.List[typing.Optional[TypeBlob]]:
+        col = self.request.get_collection(self.type_name)
+        return [self._blob(obj) if obj else None for obj in col.get_many(uuids)]
+
     def delete(self, uuid: str):
         col = self.request.get_collection(self.type_name)
         obj = col.get(uuid)
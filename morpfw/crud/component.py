@@ -314,3 +314,33 @@ class AuthzRuleAction(dectate.Action):
 
         app_class.get_authz_rule.register(reg.methodify(factory), name=self.name)
 
+
+class AuthzRuleFilterAction(dectate.Action):
+
+    app_class_arg = True
+
+    def __init__(self, name):
+        self.name = name
+
+    def identifier(self, app_class):
+        return self.name
+
+    def perform(self, obj, app_class):
+        def factory(name):
+            return obj
+
+        app_class.get_authz_rule_filter.register(reg.methodify(factory), name=self.name)
+
+
+class SearchFilterAction(dectate.Action):
+
+    app_class_arg = True
+
+    def __init__(self, model):
+        self.model = model
+
+    def identifier(self, app_class):
+        return (self.model,)
+
+    def perform(self, obj, app_class):
+        app_class.get_search_filter.register(reg.methodify(obj), model=self.model)
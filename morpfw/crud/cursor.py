@@ -0,0 +1,101 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from dateutil.parser import parse as parse_date
+
+from .errors import UnprocessableError
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "$datetime" in value:
+            return parse_date(value["$datetime"])
+        if "$date" in value:
+            return parse_date(value["$date"]).date()
+        if "$decimal" in value:
+            return Decimal(value["$decimal"])
+    return value
+
+
+class Cursor(object):
+    """
+    Keyset pagination position.
+
+    Results are ordered by ``order_by`` with ``key_field`` as tie breaker,
+    and the cursor points at the ``(value, key)`` of the last record seen.
+    A cursor without ``key`` points at the start of the result set.
+    ``direction`` is either ``'next'`` or ``'previous'``.
+
+    Null values sort last in ascending order and first in descending order.
+    """
+
+    def __init__(self, order_by, key_field, value=None, key=None, direction="next"):
+        field, order = order_by
+        if order not in ["asc", "desc"]:
+            raise UnprocessableError("Invalid order %s" % order)
+        if direction not in ["next", "previous"]:
+            raise UnprocessableError("Invalid cursor direction %s" % direction)
+        self.order_by = (field, order)
+        self.key_field = key_field
+        self.value = value
+        self.key = key
+        self.direction = direction
+
+    @property
+    def is_start(self):
+        return self.key is None
+
+    @property
+    def sort_order(self):
+        """Order to scan the storage in, previous pages are scanned backwards"""
+        order = self.order_by[1]
+        if self.direction == "previous":
+            return "desc" if order == "asc" else "asc"
+        return order
+
+    def encode(self) -> str:
+        payload = {
+            "o": list(self.order_by),
+            "f": self.key_field,
+            "v": _encode_value(self.value),
+            "k": _encode_value(self.key),
+            "d": self.direction,
+        }
+        raw = json.dumps(payload, separators=(",", ":")).encode("utf8")
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> "Cursor":
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            payload = json.loads(raw.decode("utf8"))
+            return cls(
+                payload["o"],
+                payload["f"],
+                value=_decode_value(payload["v"]),
+                key=_decode_value(payload["k"]),
+                direction=payload["d"],
+            )
+        except (ValueError, KeyError, TypeError):
+            raise UnprocessableError("Invalid cursor")
+
+    def __repr__(self):
+        return "<Cursor %s %s:%s after (%r, %r)>" % (
+            self.direction,
+            self.order_by[0],
+            self.order_by[1],
+            self.value,
+            self.key,
+        )
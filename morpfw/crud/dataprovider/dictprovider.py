@@ -2,11 +2,12 @@ import datetime
 from dataclasses import _MISSING_TYPE
 
 from dateutil.parser import parse as parse_date
-from inverter import dc2colanderjson
 from inverter.common import dataclass_check_type, dataclass_get_type
 
 from ...interfaces import IDataProvider, ISchema
+from .. import jsonserializer
 from ..app import App
+from ..storage.columnarstorage import ColumnarStorage, ColumnRow
 from ..storage.memorystorage import MemoryStorage
 from ..types import datestr
 
@@ -91,8 +92,9 @@ class DictProvider(IDataProvider):
         return result
 
     def as_json(self):
-        cschema = dc2colanderjson.convert(self.schema, request=self.storage.request)
-        return cschema().serialize(self.as_dict())
+        return jsonserializer.serialize(
+            self.storage.request, self.schema, self.as_dict()
+        )
 
 
 @App.dataprovider(schema=ISchema, obj=dict, storage=MemoryStorage)
@@ -100,6 +102,16 @@ def get_dataprovider(schema, obj, storage):
     return DictProvider(schema, obj, storage)
 
 
+@App.dataprovider(schema=ISchema, obj=dict, storage=ColumnarStorage)
+def get_columnar_dataprovider(schema, obj, storage):
+    return DictProvider(schema, obj, storage)
+
+
+@App.dataprovider(schema=ISchema, obj=ColumnRow, storage=ColumnarStorage)
+def get_columnrow_dataprovider(schema, obj, storage):
+    return DictProvider(schema, obj, storage)
+
+
 @App.jsonprovider(obj=DictProvider)
 def get_jsonprovider(obj):
     return obj.as_json()
@@ -9,11 +9,11 @@ import morepath
 import sqlalchemy as sa
 import sqlalchemy_jsonfield as sajson
 from dateutil.parser import parse as _parse_date
-from inverter import dc2colanderjson
 from inverter.common import dataclass_get_type
 from morpfw.authn.pas.policy import Identity
 
 from ...interfaces import IDataProvider, ISchema
+from .. import jsonserializer
 from ..app import App
 from ..storage.sqlstorage import GUID, Base, MappedTable, SQLStorage
 from ..types import datestr
@@ -143,9 +143,7 @@ class SQLAlchemyModelProvider(IDataProvider):
             if v is None and t["metadata"]["exclude_if_empty"]:
                 continue
             result[n] = v
-        cschema = dc2colanderjson.convert(self.schema, request=self.storage.request)
-        result = cschema().serialize(result)
-        return result
+        return jsonserializer.serialize(self.storage.request, self.schema, result)
 
 
 @App.dataprovider(schema=ISchema, obj=MappedTable, storage=SQLStorage)
@@ -0,0 +1,205 @@
+import copy
+import dataclasses
+import functools
+import threading
+from datetime import date, datetime
+
+import colander
+import pytz
+from inverter import dc2colanderjson
+from inverter.common import dataclass_get_type, is_dataclass_field
+
+from . import schemacache
+
+_marker = object()
+_fallback = object()
+
+_epoch_date = date(1970, 1, 1)
+
+_serializers: dict = {}
+_lock = threading.Lock()
+
+# field metadata which changes how a field is converted to colander
+COLANDER_METADATA = [
+    "colanderjson.field_factory",
+    "colander.field_factory",
+    "deform.widget",
+    "deform.widget_factory",
+]
+
+
+def _str(value):
+    if value is None or isinstance(value, str):
+        return value
+    return _fallback
+
+
+def _int(value):
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return int(value)
+    return _fallback
+
+
+def _float(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return _fallback
+
+
+def _bool(value):
+    return bool(value)
+
+
+def _date(value):
+    if value is None:
+        return None
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return (value - _epoch_date).days
+    return _fallback
+
+
+def _datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(value.astimezone(pytz.UTC).timestamp() * 1000)
+    return _fallback
+
+
+def _dict(value):
+    if value is None:
+        return {}
+    if isinstance(value, dict):
+        return dict(value)
+    return _fallback
+
+
+def _list(value):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return list(value)
+    return _fallback
+
+
+FAST_SERIALIZERS = {
+    str: _str,
+    int: _int,
+    float: _float,
+    bool: _bool,
+    date: _date,
+    datetime: _datetime,
+    dict: _dict,
+    list: _list,
+}
+
+
+def _none():
+    return None
+
+
+def _null():
+    return colander.null
+
+
+def _default_factory(prop, typ):
+    # mirrors how inverter computes colander node defaults, but returns a
+    # callable so that ``default_factory`` is evaluated for every object
+    if prop.default is not dataclasses.MISSING and prop.default is not None:
+        return functools.partial(copy.copy, prop.default)
+    if prop.default_factory is not dataclasses.MISSING:
+        return prop.default_factory
+    if typ == dict:
+        return dict
+    if typ == list:
+        return list
+    return _none
+
+
+class JSONSerializer(object):
+    """
+    Serializes dataprovider data of ``schema`` into the same JSON structure
+    as ``inverter.dc2colanderjson``, converting primitive fields directly
+    and only using colander for fields with custom colander types, widgets,
+    nested schemas, or values of unexpected type.
+    """
+
+    def __init__(self, schema, exclude_fields=None):
+        self.schema = schema
+        self.exclude_fields = sorted(exclude_fields or [])
+        self.fields = []
+        for name, prop in schema.__dataclass_fields__.items():
+            if name in self.exclude_fields:
+                continue
+            t = dataclass_get_type(prop)
+            func = FAST_SERIALIZERS.get(t["type"], None)
+            if is_dataclass_field(prop):
+                func = None
+            if any(k in t["metadata"] for k in COLANDER_METADATA):
+                func = None
+            if func is None and prop.default_factory is dataclasses.MISSING:
+                # let colander apply the node default
+                default = _null
+            else:
+                default = _default_factory(prop, t["type"])
+            self.fields.append((name, func, default))
+
+    def colander_schema(self, request, context=None):
+        cschema = schemacache.convert(
+            dc2colanderjson,
+            self.schema,
+            request=request,
+            exclude_fields=self.exclude_fields,
+        )
+        return cschema().bind(context=context, request=request)
+
+    def serialize(self, request, data, context=None):
+        result = {}
+        cs = None
+        for name, func, default in self.fields:
+            value = data.get(name, _marker)
+            if value is _marker:
+                value = default()
+            if func is not None:
+                out = func(value)
+                if out is not _fallback:
+                    result[name] = out
+                    continue
+            if cs is None:
+                cs = self.colander_schema(request, context)
+            result[name] = cs[name].serialize(value)
+        return result
+
+
+def get_serializer(schema, exclude_fields=None) -> JSONSerializer:
+    """Return process wide cached :class:`JSONSerializer` for ``schema``"""
+    key = (schema, tuple(sorted(exclude_fields or [])))
+    serializer = _serializers.get(key, None)
+    if serializer is None:
+        serializer = JSONSerializer(schema, exclude_fields)
+        with _lock:
+            _serializers[key] = serializer
+    return serializer
+
+
+def serialize(request, schema, data, exclude_fields=None, context=None):
+    """Serialize ``data`` of ``schema`` into JSON compatible dictionary.
+    Colander schemas are bound to ``context`` and ``request``"""
+    if not request.app.get_config("morpfw.crud.json.fastpath", True):
+        cschema = schemacache.convert(
+            dc2colanderjson, schema, request=request, exclude_fields=exclude_fields
+        )
+        cs = cschema().bind(context=context, request=request)
+        return cs.serialize(data)
+    serializer = get_serializer(schema, exclude_fields)
+    return serializer.serialize(request, data, context)
+
+
+def clear():
+    """Drop cached serializers"""
+    with _lock:
+        _serializers.clear()
@@ -21,10 +21,11 @@ from rulez import parse_dsl, validate_condition
 from transitions import Machine
 
 from ..interfaces import ICollection, IModel, IStorage
-from ..memoizer import requestmemoize
+from ..memoizer import memoize, requestmemoize
 from ..request import Request
-from . import permission, signals
+from . import jsonserializer, permission, schemacache, signals
 from .const import SEPARATOR
+from .cursor import Cursor
 from .errors import (
     AlreadyExistsError,
     BlobStorageNotImplementedError,
@@ -34,7 +35,13 @@ from .errors import (
     ValidationError,
 )
 from .log import logger
-from .relationship import BackReferenceResolver, ReferenceResolver
+from .relationship import (
+    BackReferenceResolver,
+    ReferenceResolver,
+    resolve_backreferences,
+    resolve_references,
+)
+from .searchstrategy import AdaptiveOverfetchStrategy
 
 ALLOWED_SEARCH_OPERATORS = [
     "and",
@@ -53,15 +60,25 @@ ALLOWED_SEARCH_OPERATORS = [
 _marker = object()
 
 
+def invalidate_request_cache(request):
+    """Drop request memoize cache and prefetched relations after a write"""
+    requestmemoize.invalidate(request)
+    request.environ.pop("morpfw.cache.relations", None)
+
+
 class Collection(ICollection):
 
     create_view_enabled = True
     search_view_enabled = True
+    export_view_enabled = True
     search_allow_queryobject = True
     aggregate_view_enabled = True
+    bulk_view_enabled = True
 
     exist_exc = AlreadyExistsError
 
+    secure_search_strategy = AdaptiveOverfetchStrategy
+
     @property
     def schema(self):
         raise NotImplementedError
@@ -97,66 +114,186 @@ class Collection(ICollection):
             # FIXME: what is this for again? o_O
             self.data = request.app.get_dataprovider(self.schema, data, self.storage)
 
-    def search(self, query=None, offset=0, limit=None, order_by=None, secure=False):
-        objs = self._search(query, offset, limit, order_by, secure)
-        if secure and limit:
-            nextpage = {
-                "query": query,
-                "offset": offset + limit,
-                "limit": limit,
-                "order_by": order_by,
-            }
-            while len(objs) < limit:
-                nextobjs = self._search(secure=True, **nextpage)
-                if len(nextobjs) == 0:
-                    return list(objs[:limit])
-                nextpage["offset"] = nextpage["offset"] + limit
-                objs = objs + nextobjs
+    @requestmemoize()
+    def search(
+        self,
+        query=None,
+        offset=0,
+        limit=None,
+        order_by=None,
+        secure=False,
+        include=None,
+        cursor=None,
+    ):
+        if query:
+            validate_condition(query, ALLOWED_SEARCH_OPERATORS)
+        if isinstance(cursor, str):
+            cursor = self.validate_cursor(Cursor.decode(cursor))
+        if order_by is None:
+            order_by = ("created", "desc")
+
+        if secure:
+            objs = self._secure_search(query, offset, limit, order_by, cursor)
+        else:
+            objs = self._search(query, offset, limit, order_by, cursor)
+        if include:
+            self.prefetch(objs, include)
+        return objs
+
+    def iter_search(self, query=None, order_by=None, secure=False, batch_size=None):
+        """
+        Lazily iterate over all search results, fetching ``batch_size``
+        records from the storage at a time, for exporting large result sets
+        """
+        if query:
+            validate_condition(query, ALLOWED_SEARCH_OPERATORS)
+        if order_by is None:
+            order_by = ("created", "desc")
+        if batch_size is None:
+            batch_size = self.app.get_config("morpfw.crud.export.batch_size", 500)
+        if secure:
+            search_filter = self.secure_search_filter()
+            if search_filter:
+                query = rulez.and_(search_filter, query) if query else search_filter
+        for obj in self.storage.iter_search(
+            self, query, order_by=order_by, batch_size=batch_size
+        ):
+            if secure and not self.request.app.permits(
+                self.request, obj, permission.View
+            ):
+                continue
+            yield obj
+
+    def _search(self, query, offset, limit, order_by, cursor=None):
+        if cursor is not None:
+            objs = self.storage.search(self, query, limit=limit, cursor=cursor)
+        else:
+            objs = self.storage.search(
+                self, query, offset=offset, limit=limit, order_by=order_by
+            )
+        return list(objs)
+
+    def _secure_search(self, query, offset, limit, order_by, cursor=None):
+        search_filter = self.secure_search_filter()
+        if search_filter:
+            query = rulez.and_(search_filter, query) if query else search_filter
+
+        def permits(obj):
+            return self.request.app.permits(self.request, obj, permission.View)
+
+        if not limit:
+            objs = self._search(query, offset, limit, order_by, cursor)
+            return [o for o in objs if permits(o)]
+
+        strategy = self.secure_search_strategy.from_config(self.request, limit)
+        previous = cursor is not None and cursor.direction == "previous"
+        objs = []
+        scanned = 0
+        size = strategy.batch_size(scanned, len(objs))
+        while size:
+            batch = self._search(query, offset + scanned, size, order_by, cursor)
+            scanned += len(batch)
+            found = [o for o in batch if permits(o)]
+            objs = found + objs if previous else objs + found
+            if len(batch) < size:
+                break
+            if cursor is not None:
+                # continue from the last record scanned, including filtered ones
+                cursor = self.get_cursor(
+                    batch[0] if previous else batch[-1],
+                    cursor.order_by,
+                    cursor.direction,
+                )
+            size = strategy.batch_size(scanned, len(objs))
+        if len(objs) > limit:
+            objs = objs[-limit:] if previous else objs[:limit]
         return objs
 
+    def secure_search_filter(self):
+        """
+        Return ``rulez`` condition contributed by authorization rules to
+        narrow down secure search in the storage, or ``None``. Results are
+        still checked against ``View`` permission afterwards.
+        """
+        identity = self.request.identity
+        if identity is None or identity is morepath.NO_IDENTITY:
+            return None
+        return self.app.get_search_filter(self, identity)
+
+    def start_cursor(self, order_by=None) -> Cursor:
+        """Return a cursor pointing at the start of the result set"""
+        if order_by is None:
+            order_by = ("created", "desc")
+        return Cursor(order_by, self.storage.cursor_key_field)
+
+    def validate_cursor(self, cursor: Cursor) -> Cursor:
+        """Check that a cursor received from a client orders by a visible
+        field of the schema and uses the key field of the storage"""
+        if cursor.key_field != self.storage.cursor_key_field:
+            raise UnprocessableError("Invalid cursor key %s" % cursor.key_field)
+        field = self.schema.__dataclass_fields__.get(cursor.order_by[0], None)
+        if field is None or field.metadata.get("hidden", False):
+            raise UnprocessableError("Invalid cursor order %s" % cursor.order_by[0])
+        return cursor
+
+    def get_cursor(self, obj, order_by=None, direction="next") -> Cursor:
+        """Return a cursor positioned at ``obj``"""
+        if order_by is None:
+            order_by = ("created", "desc")
+        return self.storage.get_cursor(obj, order_by, direction)
+
+    def prefetch(self, objs, include):
+        """
+        Resolve references and backreferences named in ``include`` for
+        all ``objs`` using one query per reference, and attach the result
+        to the models so that ``resolve_reference`` and
+        ``resolve_backreference`` do not need to query the storage.
+        """
+        if not objs:
+            return
+        refs = {}
+        for ref in getattr(self.schema, "__references__", None) or []:
+            refs[ref.name] = ref
+        brefs = {}
+        for bref in getattr(self.schema, "__backreferences__", None) or []:
+            brefs[bref.name] = bref
+
+        for name in include:
+            if name in refs:
+                resolved = resolve_references(self.request, objs, refs[name])
+            elif name in brefs:
+                resolved = resolve_backreferences(self.request, objs, brefs[name])
+            else:
+                raise UnprocessableError("Unknown reference %s" % name)
+            for obj, res in zip(objs, resolved):
+                obj._prefetched_relations[name] = res
+
     @requestmemoize()
     def all(self):
         return self.search()
 
     @requestmemoize()
+    @memoize()
     def count(self):
         return self.aggregate(group={"count": {"function": "count", "field": "uuid"}})[
             0
         ]["count"]
 
     @requestmemoize()
+    @memoize()
     def max_id(self):
         return self.aggregate(group={"max_id": {"function": "max", "field": "id"}})[0][
             "max_id"
         ]
 
     @requestmemoize()
+    @memoize()
     def min_id(self):
         return self.aggregate(group={"min_id": {"function": "min", "field": "id"}})[0][
             "min_id"
         ]
 
-    def _search(self, query=None, offset=0, limit=None, order_by=None, secure=False):
-        if query:
-            validate_condition(query, ALLOWED_SEARCH_OPERATORS)
-
-        if order_by is None:
-            order_by = ("created", "desc")
-
-        objs = self.storage.search(
-            self, query, offset=offset, limit=limit, order_by=order_by
-        )
-
-        if secure:
-            objs = list(
-                [
-                    obj
-                    for obj in objs
-                    if self.request.app.permits(self.request, obj, permission.View)
-                ]
-            )
-        return list(objs)
-
+    @requestmemoize()
     def aggregate(self, query=None, group=None, order_by=None, limit=None):
         if query:
             validate_condition(query, ALLOWED_SEARCH_OPERATORS)
@@ -175,6 +312,151 @@ class Collection(ICollection):
         return None
 
     def create(self, data, deserialize=True, secure=False):
+        data = self._prepare_create(data, deserialize=deserialize, secure=secure)
+        identifier, generated = self._default_identifier(data)
+        if identifier and not generated and self.get(identifier):
+            raise self.exist_exc(identifier)
+        data = self._set_defaults(data)
+        self._check_unique([data])
+        self.update_computed_fields(data)
+        self._before_create(data)
+        obj = self._create(data)
+        invalidate_request_cache(self.request)
+        self._after_create(obj)
+        obj.save()
+        return obj
+
+    def bulk_create(self, records, deserialize=True, secure=False):
+        """
+        Create objects from a list of ``records`` with batched identifier
+        and unique constraint checks, and a single storage write.
+
+        ``OBJECT_CREATED`` is dispatched for each object, followed by
+        ``OBJECTS_CREATED`` for the whole batch. Returns list of created
+        models.
+        """
+        datas = [
+            self._prepare_create(r, deserialize=deserialize, secure=secure)
+            for r in records
+        ]
+        if not datas:
+            return []
+        identifiers = []
+        seen = set()
+        for data in datas:
+            identifier, generated = self._default_identifier(data)
+            if not identifier or generated:
+                continue
+            if identifier in seen:
+                raise self.exist_exc(identifier)
+            seen.add(identifier)
+            identifiers.append(identifier)
+        for identifier, obj in zip(identifiers, self.get_many(identifiers)):
+            if obj is not None:
+                raise self.exist_exc(identifier)
+        datas = [self._set_defaults(d) for d in datas]
+        self._check_unique(datas)
+        for data in datas:
+            self.update_computed_fields(data)
+            self._before_create(data)
+
+        objs = self.storage.bulk_create(self, datas)
+        invalidate_request_cache(self.request)
+        for obj in objs:
+            self._after_create(obj)
+        self._save_changed(objs)
+        self._dispatch_batch(signals.OBJECTS_CREATED, objs)
+        return objs
+
+    def bulk_update(self, items, secure=False, deserialize=True):
+        """
+        Update objects from a list of ``(identifier, data)`` pairs with
+        batched unique constraint checks and a single storage write.
+
+        ``OBJECT_UPDATED`` is dispatched for each object, followed by
+        ``OBJECTS_UPDATED`` for the whole batch. Returns list of updated
+        models.
+        """
+        items = list(items)
+        if not items:
+            return []
+        objs = self.get_many([i for i, d in items])
+        missing = [i for (i, d), o in zip(items, objs) if o is None]
+        if missing:
+            raise UnprocessableError(
+                "Unknown identifiers %s" % ", ".join([str(i) for i in missing])
+            )
+        datas = [
+            obj._prepare_update(
+                newdata, secure=secure, deserialize=deserialize, check_unique=False
+            )
+            for obj, (identifier, newdata) in zip(objs, items)
+        ]
+        self._check_unique(datas, [obj.identifier for obj in objs])
+        self.storage.bulk_update(
+            self, [(obj.identifier, data) for obj, data in zip(objs, datas)]
+        )
+        invalidate_request_cache(self.request)
+        for obj in objs:
+            obj._after_update()
+        self._dispatch_batch(signals.OBJECTS_UPDATED, objs)
+        return objs
+
+    def bulk_delete(self, identifiers, *, cascade=True, **kwargs):
+        """
+        Delete objects of ``identifiers`` with a single storage write.
+
+        ``OBJECT_TOBEDELETED`` is dispatched for each object, and
+        ``OBJECTS_TOBEDELETED`` for the whole batch. Backreferenced objects
+        are deleted in one batch per backreference. Returns list of deleted
+        models.
+        """
+        identifiers = list(identifiers)
+        objs = [o for o in self.get_many(identifiers) if o is not None]
+        if not objs:
+            return []
+        self._bulk_delete(objs, cascade=cascade, **kwargs)
+        return objs
+
+    def _bulk_delete(self, objs, cascade=True, **kwargs):
+        self._dispatch_batch(signals.OBJECTS_TOBEDELETED, objs)
+        dispatch = self.request.app.dispatcher(signals.OBJECT_TOBEDELETED)
+        for obj in objs:
+            dispatch.dispatch(self.request, obj)
+
+        if cascade:
+            for name in objs[0].backreferences().keys():
+                self.prefetch(objs, [name])
+                refitems = []
+                for obj in objs:
+                    refitems += obj._prefetched_relations[name]
+                if refitems:
+                    refitems[0].collection._bulk_delete(refitems, cascade=cascade)
+
+        objs = [obj for obj in objs if obj.before_delete()]
+        if not objs:
+            return
+        blob_uuids = []
+        for obj in objs:
+            blob_uuids += obj._blob_uuids()
+        self.storage.bulk_delete(self, objs, **kwargs)
+        invalidate_request_cache(self.request)
+        for blob_uuid in blob_uuids:
+            self.storage.delete_blob(blob_uuid)
+
+    def _default_identifier(self, data):
+        """Return identifier of new object ``data``, and whether it is a
+        new uuid generated by ``default_identifier``, which does not need to
+        be checked against existing objects"""
+        idfield = self.app.get_identifierfield(self.schema)
+        before = data.get(idfield, None)
+        identifier = self.app.get_default_identifier(self.schema, data, self.request)
+        generated = idfield == self.app.get_uuidfield(self.schema) and (
+            identifier != before
+        )
+        return identifier, generated
+
+    def _prepare_create(self, data, deserialize=True, secure=False):
         if secure:
             if "state" in data:
                 raise StateUpdateProhibitedError()
@@ -192,9 +474,9 @@ class Collection(ICollection):
             self.request, data, deserialize=deserialize, context=self
         )
         self.before_create(data)
-        identifier = self.app.get_default_identifier(self.schema, data, self.request)
-        if identifier and self.get(identifier):
-            raise self.exist_exc(identifier)
+        return data
+
+    def _set_defaults(self, data):
         data = self.storage.set_schema_defaults(data)
         for fname, field in self.schema.__dataclass_fields__.items():
             if data[fname] is not None:
@@ -209,24 +491,78 @@ class Collection(ICollection):
             default_factory = field.metadata.get("default_factory", None)
             if default_factory:
                 data[fname] = default_factory(self, self.request)
+        return data
+
+    def _check_unique(self, datas, identifiers=None, chunk_size=500):
+        """
+        Check ``datas`` against ``__unique_constraint__`` of the schema with
+        one search per ``chunk_size`` records. ``identifiers`` are the
+        identifiers of records being updated, which do not conflict with
+        themselves.
+        """
         unique_constraint = getattr(self.schema, "__unique_constraint__", None)
-        if unique_constraint:
-            unique_search = []
-            msg = []
-            for c in unique_constraint:
-                unique_search.append(rulez.field[c] == data[c])
-                msg.append(f"{c}=({data[c]})")
-            if self.search(rulez.and_(*unique_search)):
-                raise self.exist_exc(" ".join(msg))
+        if not unique_constraint:
+            return
+        if identifiers is None:
+            identifiers = [None] * len(datas)
 
-        self.update_computed_fields(data)
-        obj = self._create(data)
+        def error(key):
+            return self.exist_exc(
+                " ".join([f"{c}=({v})" for c, v in zip(unique_constraint, key)])
+            )
+
+        keys = {}
+        for data, identifier in zip(datas, identifiers):
+            key = tuple(data[c] for c in unique_constraint)
+            if key in keys:
+                raise error(key)
+            keys[key] = identifier
+
+        keylist = list(keys.keys())
+        for i in range(0, len(keylist), chunk_size):
+            query = rulez.or_(
+                *[
+                    rulez.and_(
+                        *[rulez.field[c] == v for c, v in zip(unique_constraint, key)]
+                    )
+                    for key in keylist[i : i + chunk_size]
+                ]
+            )
+            for obj in self.search(query):
+                key = tuple(obj[c] for c in unique_constraint)
+                if key in keys and keys[key] != obj.identifier:
+                    raise error(key)
+
+    def _before_create(self, data):
+        # subscribers and the statemachine populate data through a transient
+        # model, so that the object is written to the storage only once
+        obj = self.storage.model(self.request, self, data)
         obj.set_initial_state()
+        dispatch = self.request.app.dispatcher(signals.OBJECT_BEFORE_CREATE)
+        dispatch.dispatch(self.request, obj)
+
+    def _after_create(self, obj):
         dispatch = self.request.app.dispatcher(signals.OBJECT_CREATED)
         dispatch.dispatch(self.request, obj)
         obj.after_created()
-        obj.save()
-        return obj
+
+    def _save_changed(self, objs):
+        # batch equivalent of Model.save()
+        items = []
+        for obj in objs:
+            if obj.data.changed:
+                data = self.schema.validate(
+                    self.request, obj.as_dict(), deserialize=False, context=obj
+                )
+                items.append((obj.identifier, data))
+        if items:
+            self.storage.bulk_update(self, items)
+
+    def _dispatch_batch(self, signal, objs):
+        batch = copy.copy(self)
+        batch.objects = objs
+        dispatch = self.request.app.dispatcher(signal)
+        dispatch.dispatch(self.request, batch)
 
     def update_computed_fields(self, data):
         for fn, field in self.schema.__dataclass_fields__.items():
@@ -247,6 +583,38 @@ class Collection(ICollection):
     def get_by_uuid(self, uuid):
         return self.storage.get_by_uuid(self, uuid)
 
+    def get_many(self, identifiers):
+        """
+        Get models for a list of identifiers in a single storage call.
+
+        Returns a list aligned with ``identifiers``, where missing objects
+        are ``None``. Results are stored in the request cache so subsequent
+        :meth:`get` calls are served without querying the storage.
+        """
+        identifiers = [
+            self.request.app.join_identifier(*i) if isinstance(i, (list, tuple)) else i
+            for i in identifiers
+        ]
+        objs = self.storage.get_many(self, identifiers)
+        for identifier, obj in zip(identifiers, objs):
+            requestmemoize.store(self.request, self, Collection.get, [identifier], obj)
+        return objs
+
+    def get_many_by_uuid(self, uuids):
+        """
+        Get models for a list of uuids in a single storage call.
+
+        Returns a list aligned with ``uuids``, where missing objects
+        are ``None``.
+        """
+        uuids = list(uuids)
+        objs = self.storage.get_many_by_uuid(self, uuids)
+        for uuid, obj in zip(uuids, objs):
+            requestmemoize.store(
+                self.request, self, Collection.get_by_uuid, [uuid], obj
+            )
+        return objs
+
     def json(self):
         return {
             "schema": dc2jsl.convert(self.schema).get_schema(ordered=True),
@@ -363,6 +731,11 @@ class Model(IModel):
         self._cached_identifier = None
         super().__init__(request, collection, data)
 
+    @property
+    def _prefetched_relations(self):
+        cache = self.request.environ.setdefault("morpfw.cache.relations", {})
+        return cache.setdefault((self.__class__, self.uuid), {})
+
     def is_editable(self):
         sm = self.statemachine()
         if sm:
@@ -371,6 +744,18 @@ class Model(IModel):
         return True
 
     def update(self, newdata: dict, secure: bool = False, deserialize: bool = True):
+        data = self._prepare_update(newdata, secure=secure, deserialize=deserialize)
+        self.storage.update(self.collection, self.identifier, data)
+        invalidate_request_cache(self.request)
+        self._after_update()
+
+    def _prepare_update(
+        self,
+        newdata: dict,
+        secure: bool = False,
+        deserialize: bool = True,
+        check_unique: bool = True,
+    ):
         if secure:
             if "state" in newdata:
                 raise StateUpdateProhibitedError()
@@ -400,7 +785,7 @@ class Model(IModel):
             self.request, data, deserialize=deserialize, update_mode=True, context=self
         )
         unique_constraint = getattr(self.schema, "__unique_constraint__", None)
-        if unique_constraint:
+        if unique_constraint and check_unique:
             unique_search = []
             msg = []
             for c in unique_constraint:
@@ -412,11 +797,15 @@ class Model(IModel):
                     raise self.collection.exist_exc(" ".join(msg))
 
         if deserialize:
-            cschema = dc2colanderjson.convert(self.schema, request=self.request)
+            cschema = schemacache.convert(
+                dc2colanderjson, self.schema, request=self.request
+            )
             cs = cschema()
             cs = cs.bind(context=self, request=self.request)
             data = cs.deserialize(data)
-        self.storage.update(self.collection, self.identifier, data)
+        return data
+
+    def _after_update(self):
         dispatch = self.request.app.dispatcher(signals.OBJECT_UPDATED)
         dispatch.dispatch(self.request, self)
         self.after_updated()
@@ -433,11 +822,27 @@ class Model(IModel):
 
         if cascade:
             for bref in self.backreferences().values():
-                for refitem in self.resolve_backreference(bref):
+                refitems = self.resolve_backreference(bref)
+                relations = []
+                if refitems:
+                    # resolve the next level for all items at once
+                    refcol = refitems[0].collection
+                    refcol.prefetch(refitems, refitems[0].backreferences().keys())
+                    # each delete drops the request relation cache
+                    relations = [dict(i._prefetched_relations) for i in refitems]
+                for refitem, prefetched in zip(refitems, relations):
+                    refitem._prefetched_relations.update(prefetched)
                     refitem.delete(cascade=cascade)
 
         if not self.before_delete():
             return
+        blob_uuids = self._blob_uuids()
+        self.storage.delete(self.identifier, model=self, **kwargs)
+        invalidate_request_cache(self.request)
+        for blob_uuid in blob_uuids:
+            self.storage.delete_blob(blob_uuid)
+
+    def _blob_uuids(self):
         blob_uuids = []
         for blobfield in self.blob_fields:
             if self.blobstorage_field not in self.data.keys():
@@ -450,9 +855,7 @@ class Model(IModel):
                 uuid = self.data[self.blobstorage_field][blobfield]
             if uuid:
                 blob_uuids.append(uuid)
-        self.storage.delete(self.identifier, model=self, **kwargs)
-        for blob_uuid in blob_uuids:
-            self.storage.delete_blob(blob_uuid)
+        return blob_uuids
 
     def save(self):
         if self.data.changed:
@@ -461,20 +864,22 @@ class Model(IModel):
                 self.request, data, deserialize=False, context=self
             )
             self.storage.update(self.collection, self.identifier, data)
+            invalidate_request_cache(self.request)
 
     def _base_json(self, exclude_metadata=False):
 
-        exclude_fields = self.hidden_fields
+        exclude_fields = list(self.hidden_fields)
         if exclude_metadata:
             from .schema import Schema
 
             exclude_fields += list(Schema.__dataclass_fields__.keys())
-        cschema = dc2colanderjson.convert(
-            self.schema, exclude_fields=exclude_fields, request=self.request
+        return jsonserializer.serialize(
+            self.request,
+            self.schema,
+            self.data.as_dict(),
+            exclude_fields,
+            context=self,
         )
-        cs = cschema()
-        cs = cs.bind(context=self, request=self.request)
-        return cs.serialize(self.data.as_dict())
 
     @requestmemoize()
     def base_json(self):
@@ -501,15 +906,12 @@ class Model(IModel):
     @requestmemoize()
     def links(self):
         links = []
-        links.append({"rel": "self", "href": self.request.link(self)})
+        href = self.request.link(self)
+        links.append({"rel": "self", "href": href})
         if self.update_view_enabled:
-            links.append(
-                {"rel": "update", "href": self.request.link(self), "method": "PATCH"}
-            )
+            links.append({"rel": "update", "href": href, "method": "PATCH"})
         if self.delete_view_enabled:
-            links.append(
-                {"rel": "delete", "href": self.request.link(self), "method": "DELETE"}
-            )
+            links.append({"rel": "delete", "href": href, "method": "DELETE"})
         if self.statemachine_view_enabled:
             links.append(
                 {
@@ -627,10 +1029,14 @@ class Model(IModel):
         return result
 
     def resolve_reference(self, reference):
+        if reference.name in self._prefetched_relations:
+            return self._prefetched_relations[reference.name]
         resolver = ReferenceResolver(self.request, self, reference)
         return resolver.resolve()
 
     def resolve_backreference(self, backreference):
+        if backreference.name in self._prefetched_relations:
+            return self._prefetched_relations[backreference.name]
         resolver = BackReferenceResolver(self.request, self, backreference)
         return resolver.resolve()
 
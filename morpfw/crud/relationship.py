@@ -41,6 +41,22 @@ class ReferenceResolver(object):
         return None
 
 
+def resolve_references(request, objs, reference: Reference):
+    """
+    Resolve ``reference`` for a list of objects using a single search.
+
+    Returns a list aligned with ``objs``
+    """
+    values = set([o[reference.name] for o in objs if o[reference.name] is not None])
+    result = {}
+    if values:
+        collection = reference.collection(request)
+        items = collection.search(rulez.field(reference.attribute).in_(list(values)))
+        for item in items:
+            result.setdefault(item[reference.attribute], item)
+    return [result.get(o[reference.name], None) for o in objs]
+
+
 class BackReference(object):
     def __init__(
         self,
@@ -97,3 +113,23 @@ class BackReferenceResolver(object):
         items = collection.search(rulez.field(reference.name) == value)
         return items
 
+
+def resolve_backreferences(request, objs, backreference: BackReference):
+    """
+    Resolve ``backreference`` for a list of objects using a single search.
+
+    Returns a list of lists aligned with ``objs``
+    """
+    reference = backreference.get_reference(request)
+
+    if reference is None:
+        raise ValueError("Invalid reference name. %s" % backreference.reference_name)
+
+    values = set([o[reference.attribute] for o in objs])
+    result = {}
+    if values:
+        collection = backreference.collection(request)
+        items = collection.search(rulez.field(reference.name).in_(list(values)))
+        for item in items:
+            result.setdefault(item[reference.name], []).append(item)
+    return [result.get(o[reference.attribute], []) for o in objs]
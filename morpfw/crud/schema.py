@@ -10,6 +10,7 @@ import colander
 from inverter import dc2colander, dc2colanderjson
 
 from ..interfaces import ISchema
+from . import schemacache
 from .app import App
 from .errors import FieldValidationError, FormValidationError, ValidationError
 from .relationship import BackReference, Reference
@@ -23,27 +24,14 @@ class BaseSchema(ISchema):
     ):
         params = {}
 
-        if not update_mode:
-            if json:
-                cschema = dc2colanderjson.convert(cls, request=request)
-            else:
-                cschema = dc2colander.convert(
-                    cls, request=request, default_tzinfo=request.timezone()
-                )
-
-        else:
-            if json:
-                cschema = dc2colanderjson.convert(
-                    cls, request=request, include_fields=data.keys(), mode="update",
-                )
-            else:
-                cschema = dc2colander.convert(
-                    cls,
-                    request=request,
-                    include_fields=data.keys(),
-                    mode="update",
-                    default_tzinfo=request.timezone(),
-                )
+        cschema = schemacache.convert(
+            dc2colanderjson if json else dc2colander,
+            cls,
+            request=request,
+            include_fields=data.keys() if update_mode else None,
+            mode="update" if update_mode else "default",
+            default_tzinfo=None if json else request.timezone(),
+        )
         cs = cschema()
         # FIXME: need to pass context here
         cs = cs.bind(request=request, **kwargs)
@@ -65,6 +53,44 @@ class BaseSchema(ISchema):
         return data
 
 
+class Index(object):
+    """
+    Index declaration for ``__indexes__`` of schemas and SQL models
+
+    :param fields: names of the indexed columns, in index order
+    :param name: index name, generated from table name and fields if not set
+    :param live: create a partial index covering only rows which are not
+        soft deleted (``WHERE deleted IS NULL``), which is the condition
+        ``SQLStorage`` adds to its queries
+    :param using: index method, eg: ``gin``. JSON columns are indexed as
+        ``jsonb`` when using ``gin``
+    :param ops: operator class for the indexed columns, eg: ``gin_trgm_ops``
+    :param unique: create unique index
+    """
+
+    def __init__(
+        self, *fields, name=None, live=False, using=None, ops=None, unique=False
+    ):
+        if not fields:
+            raise ValueError("Index requires at least one field")
+        self.fields = fields
+        self.name = name
+        self.live = live
+        self.using = using
+        self.ops = ops
+        self.unique = unique
+
+    def index_name(self, table_name):
+        if self.name:
+            return self.name
+        name = "ix_%s_%s" % (table_name, "_".join(self.fields))
+        if self.using:
+            name += "_%s" % self.using
+        if self.live:
+            name += "_live"
+        return name
+
+
 @dataclass
 class Schema(BaseSchema):
 
@@ -100,6 +126,7 @@ class Schema(BaseSchema):
     __references__ = []  # type: ignore
     __backreferences__ = []  # type: ignore
     __validators__ = []  # type: ignore
+    __indexes__ = [Index("created", "id", live=True)]  # type: ignore
     __protected_fields__ = [
         "id",
         "blobs",
@@ -0,0 +1,188 @@
+import contextvars
+import copy
+import dataclasses
+import functools
+import threading
+
+import colander
+from inverter.common import dataclass_get_type, is_dataclass_field
+
+_current_request = contextvars.ContextVar("morpfw.schemacache.request", default=None)
+
+_cache: dict = {}
+_cacheable: dict = {}
+_stats = {"hits": 0, "misses": 0}
+_lock = threading.Lock()
+
+
+class RequestProxy(object):
+    """
+    Stands in for the request in cached colander schemas, forwarding
+    attribute access to the request the schema was last looked up with
+    in the current context.
+    """
+
+    def __getattr__(self, name):
+        request = _current_request.get()
+        if request is None:
+            raise AttributeError(name)
+        return getattr(request, name)
+
+    def __bool__(self):
+        return _current_request.get() is not None
+
+    def __repr__(self):
+        return "<RequestProxy for %r>" % _current_request.get()
+
+
+request_proxy = RequestProxy()
+
+
+def _has_widget_factory(schema, seen):
+    if schema in seen:
+        return False
+    seen.add(schema)
+    for field in dataclasses.fields(schema):
+        if "deform.widget_factory" in field.metadata:
+            return True
+        if is_dataclass_field(field):
+            if _has_widget_factory(dataclass_get_type(field)["type"], seen):
+                return True
+    return False
+
+
+def _is_cacheable(schema):
+    # widget factories are evaluated against the request when the schema is
+    # converted, so their result can not be shared across requests
+    if schema not in _cacheable:
+        _cacheable[schema] = not _has_widget_factory(schema, set())
+    return _cacheable[schema]
+
+
+def _defer_defaults(nodes, schema):
+    # converters evaluate ``default_factory`` and build mutable defaults once
+    # per conversion and use the result as ``missing``, which would be shared
+    # by every deserialization of a cached schema. Those fields are dropped
+    # instead and filled by ``DefaultsMixin`` after deserialization
+    fields = schema.__dataclass_fields__
+    factories = {}
+    for node in nodes:
+        field = fields.get(node.name, None)
+        if field is None:
+            continue
+        if is_dataclass_field(field):
+            nested = _defer_defaults(node.children, dataclass_get_type(field)["type"])
+            if nested:
+                factories[node.name] = nested
+            continue
+        if node.missing is colander.required or node.missing is colander.drop:
+            continue
+        if not isinstance(field.default_factory, dataclasses._MISSING_TYPE):
+            factory = field.default_factory
+        elif isinstance(node.missing, (dict, list, set)):
+            factory = functools.partial(copy.deepcopy, node.missing)
+        else:
+            continue
+        node.missing = colander.drop
+        factories[node.name] = factory
+    return factories
+
+
+def _apply_defaults(appstruct, factories):
+    if not isinstance(appstruct, dict):
+        return appstruct
+    appstruct = dict(appstruct)
+    for name, factory in factories.items():
+        if isinstance(factory, dict):
+            if name in appstruct:
+                appstruct[name] = _apply_defaults(appstruct[name], factory)
+        elif name not in appstruct:
+            appstruct[name] = factory()
+    return appstruct
+
+
+class DefaultsMixin(object):
+    """
+    Fills fields with ``default_factory`` or mutable defaults with a new
+    value on each serialization and deserialization of a cached schema
+    """
+
+    default_factories: dict = {}
+
+    def serialize(self, appstruct=colander.null):
+        return super().serialize(_apply_defaults(appstruct, self.default_factories))
+
+    def deserialize(self, cstruct=colander.null):
+        appstruct = super().deserialize(cstruct)
+        return _apply_defaults(appstruct, self.default_factories)
+
+
+def convert(
+    converter,
+    schema,
+    request,
+    include_fields=None,
+    exclude_fields=None,
+    mode="default",
+    default_tzinfo=None,
+):
+    """
+    Return colander schema class converted from dataclass ``schema`` using
+    ``converter`` (eg: ``inverter.dc2colanderjson``).
+
+    Converted schemas are cached per process, keyed on the converter,
+    schema, mode, field subsets and timezone. The schema is bound to
+    ``request`` through :class:`RequestProxy`, so it should be used within
+    the request it was looked up with. Fields with ``default_factory`` are
+    still given a new value on each deserialization, see
+    :class:`DefaultsMixin`.
+    """
+    _current_request.set(request)
+    key = (
+        converter.__name__,
+        schema,
+        mode,
+        tuple(sorted(include_fields)) if include_fields is not None else None,
+        tuple(sorted(exclude_fields)) if exclude_fields is not None else None,
+        default_tzinfo,
+    )
+    cschema = _cache.get(key, None)
+    if cschema is not None:
+        _stats["hits"] += 1
+        return cschema
+
+    kwargs = {"mode": mode}
+    if include_fields is not None:
+        kwargs["include_fields"] = list(include_fields)
+    if exclude_fields is not None:
+        kwargs["exclude_fields"] = list(exclude_fields)
+    if default_tzinfo is not None:
+        kwargs["default_tzinfo"] = default_tzinfo
+
+    if not _is_cacheable(schema):
+        return converter.convert(schema, request=request, **kwargs)
+
+    cschema = converter.convert(schema, request=request_proxy, **kwargs)
+    factories = _defer_defaults(cschema.__all_schema_nodes__, schema)
+    if factories:
+        cschema = type(
+            cschema.__name__,
+            (DefaultsMixin, cschema),
+            {"default_factories": factories},
+        )
+    with _lock:
+        _stats["misses"] += 1
+        _cache[key] = cschema
+    return cschema
+
+
+def clear():
+    """Drop all cached schemas, eg: when application configuration changes"""
+    with _lock:
+        _cache.clear()
+        _cacheable.clear()
+
+
+def stats():
+    """Return cache hit and miss counters and number of cached schemas"""
+    return {"hits": _stats["hits"], "misses": _stats["misses"], "size": len(_cache)}
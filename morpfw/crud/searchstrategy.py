@@ -0,0 +1,52 @@
+import math
+
+from .log import logger
+
+
+class AdaptiveOverfetchStrategy(object):
+    """
+    Decides how many rows secure search fetches per storage round trip.
+
+    The first batch is ``limit * overfetch`` rows. Subsequent batches are
+    sized from the ratio of permitted rows observed so far, so a user who
+    can only see a small fraction of a collection needs a few large scans
+    instead of many ``limit`` sized ones. Scanning stops once ``max_scan``
+    rows have been read, returning whatever was found.
+    """
+
+    def __init__(self, limit, overfetch=1.5, max_batch=1000, max_scan=10000):
+        self.limit = limit
+        self.overfetch = overfetch
+        self.max_batch = max_batch
+        self.max_scan = max_scan
+
+    @classmethod
+    def from_config(cls, request, limit):
+        get_config = request.app.get_config
+        return cls(
+            limit,
+            overfetch=get_config("morpfw.crud.search.secure_overfetch", 1.5),
+            max_batch=get_config("morpfw.crud.search.secure_max_batch", 1000),
+            max_scan=get_config("morpfw.crud.search.secure_max_scan", 10000),
+        )
+
+    def batch_size(self, scanned, found):
+        """Return number of rows to fetch next, or 0 to stop scanning"""
+        remaining = self.limit - found
+        if remaining <= 0:
+            return 0
+        if scanned >= self.max_scan:
+            logger.warning(
+                "Secure search stopped after scanning %s rows with %s of %s "
+                "results found" % (scanned, found, self.limit)
+            )
+            return 0
+        if not scanned:
+            size = math.ceil(self.limit * self.overfetch)
+        else:
+            # assume at least 1% visibility to avoid unbounded batch sizes
+            ratio = max(found / scanned, 0.01)
+            size = math.ceil(remaining * self.overfetch / ratio)
+        size = max(size, remaining)
+        size = min(size, self.max_batch, self.max_scan - scanned)
+        return max(size, 1)
@@ -6,10 +6,17 @@ import reg
 
 from . import pubsub
 
+OBJECT_BEFORE_CREATE = "morpfw.object_before_create"
 OBJECT_CREATED = "morpfw.object_created"
 OBJECT_UPDATED = "morpfw.object_updated"
 OBJECT_TOBEDELETED = "morpfw.object_tobedeleted"
 
+# batch signals are dispatched on a copy of the collection, with the affected
+# models in its ``objects`` attribute
+OBJECTS_CREATED = "morpfw.objects_created"
+OBJECTS_UPDATED = "morpfw.objects_updated"
+OBJECTS_TOBEDELETED = "morpfw.objects_tobedeleted"
+
 
 def _get_identifier(obj):
     if inspect.isclass(obj):
@@ -1,5 +1,6 @@
 import copy
 from ..blobstorage.base import NullBlobStorage
+from ..cursor import Cursor
 from ..errors import BlobStorageNotImplementedError
 from ...interfaces import IStorage
 
@@ -8,6 +9,9 @@ class BaseStorage(IStorage):
 
     use_transactions = True
 
+    #: field used as tie breaker in keyset pagination
+    cursor_key_field = "uuid"
+
     blobstorage = None
 
     @property
@@ -28,6 +32,63 @@ class BaseStorage(IStorage):
         obj = self.model.schema(**data)
         return obj.__dict__
 
+    def get_many(self, collection, identifiers):
+        """Return list of models aligned with ``identifiers``.
+
+        Storages should override this with a single backend query"""
+        return [self.get(collection, i) for i in identifiers]
+
+    def get_many_by_uuid(self, collection, uuids):
+        """Return list of models aligned with ``uuids``.
+
+        Storages should override this with a single backend query"""
+        return [self.get_by_uuid(collection, u) for u in uuids]
+
+    def bulk_create(self, collection, items):
+        """Create models from a list of ``items`` data.
+
+        Storages should override this with a single backend write"""
+        return [self.create(collection, data) for data in items]
+
+    def bulk_update(self, collection, items):
+        """Update models from a list of ``(identifier, data)`` pairs.
+
+        Storages should override this with a single backend write"""
+        for identifier, data in items:
+            self.update(collection, identifier, data)
+
+    def bulk_delete(self, collection, models, **kwargs):
+        """Delete ``models``.
+
+        Storages should override this with a single backend write"""
+        for model in models:
+            self.delete(model.identifier, model=model, **kwargs)
+
+    def iter_search(self, collection, query=None, order_by=None, batch_size=100):
+        """Lazily iterate over search result, querying ``batch_size`` records
+        at a time.
+
+        Storages should override this with a streaming backend query"""
+        offset = 0
+        while True:
+            batch = self.search(
+                collection, query, offset=offset, limit=batch_size, order_by=order_by
+            )
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            offset += batch_size
+
+    def get_cursor(self, model, order_by, direction="next"):
+        """Return keyset pagination cursor positioned at ``model``"""
+        return Cursor(
+            order_by,
+            self.cursor_key_field,
+            value=model.data[order_by[0]],
+            key=model.data[self.cursor_key_field],
+            direction=direction,
+        )
+
 #	def create(self, data):
 #		raise NotImplementedError
 #
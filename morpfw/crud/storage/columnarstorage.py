@@ -0,0 +1,572 @@
+import bisect
+import operator
+import threading
+from collections.abc import MutableMapping
+from datetime import date, datetime
+
+import pytz
+from dateutil.parser import parse as parse_date
+from rulez import compile_condition
+
+from ..aggregate import AggregatePlan
+from ..cursor import Cursor
+from .base import BaseStorage
+from .memorystorage import keyset_search
+
+TABLES = {}
+
+_tables_lock = threading.Lock()
+
+
+class _Missing(object):
+    def __repr__(self):
+        return "<MISSING>"
+
+
+#: marker of a field which is not set on a row
+MISSING = _Missing()
+
+_LOWEST_ROW = -1
+_HIGHEST_ROW = float("inf")
+
+COMPARATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, values: value in values,
+    "~": lambda value, pattern: pattern in value,
+}
+
+RANGE_OPERATORS = ["<", "<=", ">", ">="]
+
+#: evaluation order of conditions in an ``and``, cheapest first
+OPERATOR_COSTS = {"==": 0, "in": 0, "<": 1, "<=": 1, ">": 1, ">=": 1}
+
+
+class ColumnTable(object):
+    """
+    Column-wise record store.
+
+    Rows are addressed by their position, every field is stored in its
+    own list and deleted rows are left as holes. Hash indexes map a value
+    to its set of rows, sorted indexes keep ``(value, row)`` pairs in
+    order. Both are kept up to date on write, indexes which are not
+    created eagerly are built on first use by a query. Fields holding
+    values which can't be hashed or ordered are not indexed and queries
+    on them scan the column instead.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.columns = {}
+            self.size = 0
+            self.live = set()
+            self.identifiers = {}
+            self.hash_indexes = {}
+            self.sorted_indexes = {}
+            self.unindexable = set()
+            self.next_id = 1
+
+    def __len__(self):
+        return len(self.live)
+
+    def value(self, row, field):
+        column = self.columns.get(field, None)
+        if column is None:
+            return MISSING
+        return column[row]
+
+    def row_dict(self, row):
+        result = {}
+        for field, column in self.columns.items():
+            if column[row] is not MISSING:
+                result[field] = column[row]
+        return result
+
+    def insert(self, identifier, data):
+        with self.lock:
+            row = self.size
+            self.size += 1
+            for column in self.columns.values():
+                column.append(MISSING)
+            self.live.add(row)
+            for field, value in data.items():
+                self.set(row, field, value)
+            self.identifiers[identifier] = row
+            return row
+
+    def set(self, row, field, value):
+        with self.lock:
+            column = self.columns.get(field, None)
+            if column is None:
+                column = [MISSING] * self.size
+                self.columns[field] = column
+            if column[row] is not MISSING:
+                self._unindex(row, field, column[row])
+            column[row] = value
+            self._index(row, field, value)
+
+    def unset(self, row, field):
+        with self.lock:
+            column = self.columns.get(field, None)
+            if column is None or column[row] is MISSING:
+                return
+            self._unindex(row, field, column[row])
+            column[row] = MISSING
+
+    def delete(self, identifier):
+        with self.lock:
+            row = self.identifiers.pop(identifier)
+            for field in list(self.columns.keys()):
+                self.unset(row, field)
+            self.live.discard(row)
+
+    def _index(self, row, field, value):
+        index = self.hash_indexes.get(field, None)
+        if index is not None:
+            try:
+                index.setdefault(value, set()).add(row)
+            except TypeError:
+                self.drop_index(field)
+        index = self.sorted_indexes.get(field, None)
+        if index is not None and value is not None:
+            try:
+                bisect.insort(index, (value, row))
+            except TypeError:
+                self.drop_index(field)
+
+    def _unindex(self, row, field, value):
+        index = self.hash_indexes.get(field, None)
+        if index is not None:
+            rows = index.get(value, None)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del index[value]
+        index = self.sorted_indexes.get(field, None)
+        if index is not None and value is not None:
+            pos = bisect.bisect_left(index, (value, row))
+            if pos < len(index) and index[pos][1] == row:
+                del index[pos]
+
+    def drop_index(self, field):
+        self.hash_indexes.pop(field, None)
+        self.sorted_indexes.pop(field, None)
+        self.unindexable.add(field)
+
+    def hash_index(self, field):
+        """Return ``{value: rows}`` index of ``field``, building it if
+        needed. Returns ``None`` if the field values are not hashable"""
+        if field in self.unindexable:
+            return None
+        index = self.hash_indexes.get(field, None)
+        if index is not None:
+            return index
+        with self.lock:
+            index = {}
+            try:
+                for row, value in enumerate(self.columns.get(field, [])):
+                    if value is not MISSING:
+                        index.setdefault(value, set()).add(row)
+            except TypeError:
+                self.unindexable.add(field)
+                return None
+            self.hash_indexes[field] = index
+        return index
+
+    def sorted_index(self, field):
+        """Return ordered list of ``(value, row)`` of ``field``, null values
+        excluded, building it if needed. Returns ``None`` if the field
+        values are not orderable"""
+        if field in self.unindexable:
+            return None
+        index = self.sorted_indexes.get(field, None)
+        if index is not None:
+            return index
+        with self.lock:
+            try:
+                index = sorted(
+                    (value, row)
+                    for row, value in enumerate(self.columns.get(field, []))
+                    if value is not MISSING and value is not None
+                )
+            except TypeError:
+                self.unindexable.add(field)
+                return None
+            self.sorted_indexes[field] = index
+        return index
+
+    def select(self, query=None):
+        """Return set of live rows matching rulez ``query``"""
+        with self.lock:
+            if not query:
+                return set(self.live)
+            return self._select(query, None)
+
+    def _select(self, query, candidates):
+        op = query["operator"]
+        value = query.get("value", None)
+        if op == "and":
+            for condition in sorted(
+                value, key=lambda c: OPERATOR_COSTS.get(c["operator"], 2)
+            ):
+                candidates = self._select(condition, candidates)
+                if not candidates:
+                    return set()
+            return set(self.live) if candidates is None else candidates
+        if op == "or":
+            result = set()
+            for condition in value:
+                result |= self._select(condition, candidates)
+            return result
+
+        field = query.get("field", None)
+        if (
+            op not in COMPARATORS
+            or not isinstance(field, str)
+            or field.startswith("$")
+            or isinstance(value, dict)
+        ):
+            return self._select_native(query, candidates)
+
+        value = self._literal(field, value, query.get("value_type", None))
+        rows = self._lookup(field, op, value)
+        if rows is None:
+            return self._scan(field, op, value, candidates)
+        if candidates is None:
+            return rows
+        return rows & candidates
+
+    def _literal(self, field, value, value_type=None):
+        """Convert query value to the type stored in the column, date and
+        datetime values are commonly given as strings"""
+        if not isinstance(value, str):
+            return value
+        if value_type == "date":
+            return parse_date(value).date()
+        if value_type == "datetime":
+            return parse_date(value)
+        sample = None
+        index = self.sorted_indexes.get(field, None)
+        if index:
+            sample = index[0][0]
+        else:
+            for v in self.columns.get(field, []):
+                if v is not MISSING and v is not None:
+                    sample = v
+                    break
+        if isinstance(sample, datetime):
+            value = parse_date(value)
+            if sample.tzinfo is not None and value.tzinfo is None:
+                value = pytz.UTC.localize(value)
+        elif isinstance(sample, date):
+            value = parse_date(value).date()
+        return value
+
+    def _lookup(self, field, op, value):
+        """Return set of rows matching the condition from an index, or
+        ``None`` if the condition can't be answered by an index"""
+        if op in ["==", "in"]:
+            index = self.hash_index(field)
+            if index is None:
+                return None
+            values = [value] if op == "==" else value
+            rows = set()
+            try:
+                for v in values:
+                    rows |= index.get(v, set())
+            except TypeError:
+                return None
+            return rows
+
+        if op in RANGE_OPERATORS and value is not None:
+            index = self.sorted_index(field)
+            if index is None:
+                return None
+            try:
+                if op == ">":
+                    entries = index[bisect.bisect_right(index, (value, _HIGHEST_ROW)) :]
+                elif op == ">=":
+                    entries = index[bisect.bisect_left(index, (value, _LOWEST_ROW)) :]
+                elif op == "<":
+                    entries = index[: bisect.bisect_left(index, (value, _LOWEST_ROW))]
+                else:
+                    entries = index[: bisect.bisect_right(index, (value, _HIGHEST_ROW))]
+            except TypeError:
+                return None
+            return set(row for v, row in entries)
+        return None
+
+    def _scan(self, field, op, value, candidates):
+        column = self.columns.get(field, None)
+        if column is None:
+            return set()
+        rows = self.live if candidates is None else candidates
+        compare = COMPARATORS[op]
+        nullable = op in ["==", "!=", "in"]
+        result = set()
+        for row in rows:
+            v = column[row]
+            if v is MISSING or (v is None and not nullable):
+                continue
+            try:
+                if compare(v, value):
+                    result.add(row)
+            except TypeError:
+                continue
+        return result
+
+    def _select_native(self, query, candidates):
+        f = compile_condition("native", query)
+        rows = self.live if candidates is None else candidates
+        result = set()
+        for row in rows:
+            try:
+                if f(self.row_dict(row)):
+                    result.add(row)
+            except (KeyError, TypeError):
+                continue
+        return result
+
+    def _sortkey(self, row, field):
+        value = self.value(row, field)
+        if value is MISSING:
+            value = None
+        return (value is None, value)
+
+    def order(self, rows, order_by=None, offset=None, limit=None):
+        """Return ``rows`` as list ordered by ``order_by``, then apply
+        ``offset`` and ``limit``.
+
+        Rows are in insertion order if ``order_by`` is not given. Nulls
+        sort last in ascending order, same as postgresql"""
+        start = offset or 0
+        stop = None if limit is None else start + limit
+        with self.lock:
+            if order_by is None:
+                return sorted(rows)[start:stop]
+            field, direction = order_by
+            if direction not in ["asc", "desc"]:
+                raise KeyError(direction)
+            index = self.sorted_index(field)
+            if index is None:
+                result = sorted(rows, key=lambda r: self._sortkey(r, field))
+                if direction == "desc":
+                    result.reverse()
+                return result[start:stop]
+
+            nulls = sorted(r for r in rows if self._sortkey(r, field)[0])
+            if direction == "asc":
+                result, entries = [], index
+            else:
+                result, entries = nulls[::-1], reversed(index)
+            for value, row in entries:
+                if stop is not None and len(result) >= stop:
+                    break
+                if row in rows:
+                    result.append(row)
+            if direction == "asc":
+                result.extend(nulls)
+            return result[start:stop]
+
+    def keyset(self, rows, limit, cursor):
+        def getter(row, field):
+            value = self.value(row, field)
+            return None if value is MISSING else value
+
+        with self.lock:
+            return keyset_search(sorted(rows), limit, cursor, getter=getter)
+
+    def columns_of(self, rows, fields):
+        """Return ``{field: values}`` of ``fields`` for the given ``rows``,
+        missing values are ``None``"""
+        result = {}
+        with self.lock:
+            for field in fields:
+                column = self.columns.get(field, [MISSING] * self.size)
+                values = [column[row] for row in rows]
+                result[field] = [None if v is MISSING else v for v in values]
+        return result
+
+
+class ColumnRow(MutableMapping):
+    """Dictionary view of a row of a :class:`ColumnTable`. Writes go
+    through the table so that its indexes stay up to date"""
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, key):
+        value = self.table.value(self.row, key)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.table.set(self.row, key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.table.unset(self.row, key)
+
+    def __iter__(self):
+        return iter(self.table.row_dict(self.row).keys())
+
+    def __len__(self):
+        return len(self.table.row_dict(self.row))
+
+    def copy(self):
+        return self.table.row_dict(self.row)
+
+    def __repr__(self):
+        return "<ColumnRow %s %s>" % (self.row, self.table.row_dict(self.row))
+
+
+class ColumnarStorage(BaseStorage):
+    """
+    In process storage keeping records column-wise in a :class:`ColumnTable`.
+
+    Lookups by identifier, uuid and id use hash indexes, ``created`` and
+    the incremental id column are kept in sorted indexes. Other fields
+    get their index created when first queried or ordered by. Like
+    :class:`.memorystorage.MemoryStorage`, data lives in the process and
+    is not transactional.
+    """
+
+    incremental_id = False
+    incremental_column = "id"
+
+    #: fields indexed for ordering and range queries when the table is created
+    sorted_index_fields = ["created"]
+
+    @property
+    def typekey(self):
+        return ":".join([self.__module__, self.__class__.__name__])
+
+    @property
+    def table(self):
+        return TABLES[self.typekey]
+
+    @property
+    def datastore(self):
+        return self.table
+
+    def __init__(self, request, blobstorage=None):
+        super(ColumnarStorage, self).__init__(request, blobstorage)
+        if self.typekey not in TABLES:
+            with _tables_lock:
+                if self.typekey not in TABLES:
+                    TABLES[self.typekey] = self.create_table()
+
+    def create_table(self):
+        table = ColumnTable()
+        table.hash_index(self.app.get_uuidfield(self.model.schema))
+        fields = list(self.sorted_index_fields)
+        if self.incremental_id:
+            table.hash_index(self.incremental_column)
+            fields.append(self.incremental_column)
+        for field in fields:
+            table.sorted_index(field)
+        return table
+
+    def _model(self, collection, row):
+        return self.model(self.request, collection, ColumnRow(self.table, row))
+
+    def create(self, collection, data):
+        assert data["uuid"] is not None
+        table = self.table
+        data = data.copy()
+        with table.lock:
+            if self.incremental_id:
+                data[self.incremental_column] = table.next_id
+                table.next_id += 1
+            identifier = self.model(self.request, collection, data).identifier
+            row = table.insert(identifier, data)
+        return self._model(collection, row)
+
+    def aggregate(self, query=None, group=None, order_by=None, limit=None):
+        if not group:
+            return []
+        plan = AggregatePlan(group)
+        rows = sorted(self.table.select(query))
+        columns = self.table.columns_of(rows, plan.fields)
+        return plan.aggregate_columns(
+            columns, len(rows), order_by=order_by, limit=limit
+        )
+
+    def search(
+        self,
+        collection,
+        query=None,
+        offset=None,
+        limit=None,
+        order_by=None,
+        cursor=None,
+    ):
+        table = self.table
+        rows = table.select(query)
+        if cursor is not None:
+            rows = table.keyset(rows, limit, cursor)
+        else:
+            rows = table.order(rows, order_by, offset, limit)
+        return [self._model(collection, row) for row in rows]
+
+    def iter_search(self, collection, query=None, order_by=None, batch_size=100):
+        table = self.table
+        rows = table.select(query)
+        if order_by is not None:
+            rows = table.keyset(rows, None, Cursor(order_by, self.cursor_key_field))
+        else:
+            rows = sorted(rows)
+        for row in rows:
+            if row in table.live:
+                yield self._model(collection, row)
+
+    def get(self, collection, identifier):
+        row = self.table.identifiers.get(identifier, None)
+        if row is None:
+            return None
+        return self._model(collection, row)
+
+    def get_many(self, collection, identifiers):
+        return [self.get(collection, i) for i in identifiers]
+
+    def _get_by_field(self, collection, field, value):
+        index = self.table.hash_index(field)
+        if index is None:
+            raise AttributeError("%s is not indexable" % field)
+        rows = index.get(value, None)
+        if not rows:
+            return None
+        return self._model(collection, min(rows))
+
+    def get_by_id(self, collection, id):
+        return self._get_by_field(collection, self.incremental_column, id)
+
+    def get_by_uuid(self, collection, uuid):
+        uuid_field = self.app.get_uuidfield(self.model.schema)
+        return self._get_by_field(collection, uuid_field, uuid)
+
+    def get_many_by_uuid(self, collection, uuids):
+        uuid_field = self.app.get_uuidfield(self.model.schema)
+        return [self._get_by_field(collection, uuid_field, u) for u in uuids]
+
+    def update(self, collection, identifier, data):
+        table = self.table
+        row = table.identifiers[identifier]
+        with table.lock:
+            for k, v in data.items():
+                table.set(row, k, v)
+        return self._model(collection, row)
+
+    def delete(self, identifier, model, **kwargs):
+        self.table.delete(identifier)
@@ -1,15 +1,25 @@
 import copy
-import json
+import logging
+import threading
+import time
+from datetime import datetime
 from pprint import pprint
 from typing import Optional
 
 import elasticsearch.exceptions as es_exc
+import transaction
+from elasticsearch.helpers import BulkIndexError
 from inverter import dc2colanderESjson, dc2esmapping
 from rulez import compile_condition
 
+from .. import schemacache
+from ..aggregate import AggregatePlan
 from ..app import App
+from ..cursor import Cursor
 from .base import BaseStorage
 
+logger = logging.getLogger("morpfw.crud.storage.elasticsearch")
+
 
 class AggGroup(object):
     def __init__(self, key, field, type="terms", opts=None, children=None):
@@ -149,12 +159,258 @@ def is_text_mapping(collection, field):
     return False
 
 
+CALENDAR_INTERVALS = {
+    "minute": "1m",
+    "hour": "1h",
+    "day": "1d",
+    "week": "1w",
+    "month": "1M",
+    "quarter": "1q",
+    "year": "1y",
+}
+
+PART_GETTERS = {"year": "getYear", "month": "getMonthValue", "day": "getDayOfMonth"}
+
+
+def _refresh_rank(refresh):
+    if refresh in [True, "true"]:
+        return 2
+    if refresh == "wait_for":
+        return 1
+    return 0
+
+
+def _item_result(item):
+    return list(item.values())[0]
+
+
+_stats: dict = {}
+_stats_lock = threading.Lock()
+
+
+def _record(counter, value=1):
+    with _stats_lock:
+        _stats[counter] = _stats.get(counter, 0) + value
+
+
+def stats():
+    """
+    Return bulk write counters of this process: ``queued`` operations,
+    ``flushed`` operations, ``flushes`` and their total ``flush_seconds``,
+    ``failures`` of flushes and ``discarded`` operations of aborted
+    transactions.
+    """
+    result = dict.fromkeys(
+        ["queued", "flushed", "flushes", "flush_seconds", "failures", "discarded"],
+        0,
+    )
+    with _stats_lock:
+        result.update(_stats)
+    return result
+
+
+def reset_stats():
+    """Reset bulk write counters"""
+    with _stats_lock:
+        _stats.clear()
+
+
+class BulkBuffer(object):
+    """
+    Elasticsearch write operations queued by a request, sent through the
+    bulk API when flushed.
+
+    Operations are sent in order, ``chunk_size`` at a time, and the
+    strongest refresh policy requested by the queued operations is applied
+    once per bulk request. Requests or items rejected with status 429 are
+    retried with exponential backoff, other failed items are raised
+    together as :class:`BulkIndexError`.
+    """
+
+    def __init__(self, client, chunk_size=500, max_retries=5, retry_backoff=0.5):
+        self.client = client
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.transaction = None
+        self.clear()
+
+    def __len__(self):
+        return len(self.actions)
+
+    def clear(self):
+        self.actions = []
+        self.refresh = None
+
+    def discard(self):
+        """Drop queued operations without sending them"""
+        if self.actions:
+            _record("discarded", len(self.actions))
+        self.clear()
+
+    def add(self, action, source=None, refresh=None):
+        self.actions.append((action, source))
+        _record("queued")
+        if _refresh_rank(refresh) > _refresh_rank(self.refresh):
+            self.refresh = refresh
+
+    def operations(self, index):
+        """Return queued operations on documents of ``index`` as
+        ``{document id: [(operation, source), ...]}``, in queue order"""
+        result: dict = {}
+        for action, source in self.actions:
+            op, meta = list(action.items())[0]
+            if meta.get("_index", None) != index or "_id" not in meta:
+                continue
+            result.setdefault(str(meta["_id"]), []).append((op, source))
+        return result
+
+    def flush(self):
+        """Send queued operations, returns the bulk response items"""
+        actions, refresh = self.actions, self.refresh
+        self.clear()
+        if not actions:
+            return []
+        items = []
+        start_time = time.perf_counter()
+        try:
+            for start in range(0, len(actions), self.chunk_size):
+                items += self.send(actions[start : start + self.chunk_size], refresh)
+        except Exception:
+            _record("failures")
+            raise
+        finally:
+            _record("flush_seconds", time.perf_counter() - start_time)
+        _record("flushes")
+        _record("flushed", len(actions))
+        return items
+
+    def send(self, actions, refresh=None):
+        """Send ``actions``, a list of ``(action, source)``, in one bulk
+        request. Returns the bulk response items aligned with ``actions``"""
+        items = [None] * len(actions)
+        pending = list(range(len(actions)))
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            body = []
+            for idx in pending:
+                action, source = actions[idx]
+                body.append(action)
+                if source is not None:
+                    body.append(source)
+            try:
+                res = self.client.bulk(body=body, refresh=refresh)
+            except es_exc.TransportError as e:
+                if e.status_code != 429 or attempt == self.max_retries:
+                    raise
+                continue
+            rejected = []
+            for idx, item in zip(pending, res["items"]):
+                items[idx] = item
+                if _item_result(item).get("status", None) == 429:
+                    rejected.append(idx)
+            pending = rejected
+            if not pending:
+                break
+
+        errors = [item for item in items if "error" in _item_result(item)]
+        if errors:
+            raise BulkIndexError("%s document(s) failed" % len(errors), errors)
+        return items
+
+
+class BulkBufferSavepoint(object):
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.size = len(buffer)
+
+    def rollback(self):
+        discarded = self.buffer.actions[self.size :]
+        if discarded:
+            _record("discarded", len(discarded))
+            del self.buffer.actions[self.size :]
+
+
+class ElasticSearchDataManager(object):
+    """
+    Transaction data manager sending the writes of a :class:`BulkBuffer`
+    when the transaction finishes.
+
+    It sorts after the SQL data managers, so writes are only sent once the
+    database transaction has committed, and are dropped when the
+    transaction aborts. A failure at that point can't roll the transaction
+    back anymore, it is logged and counted in :func:`stats`.
+    """
+
+    def __init__(self, buffer, transaction_manager=None):
+        self.buffer = buffer
+        self.transaction_manager = transaction_manager or transaction.manager
+
+    def abort(self, txn):
+        self._finish(txn)
+
+    def tpc_begin(self, txn):
+        pass
+
+    def commit(self, txn):
+        pass
+
+    def tpc_vote(self, txn):
+        pass
+
+    def tpc_finish(self, txn):
+        try:
+            self.buffer.flush()
+        except Exception:
+            logger.exception("Failed sending writes to elasticsearch after commit")
+        self._finish(txn)
+
+    def tpc_abort(self, txn):
+        self._finish(txn)
+
+    def _finish(self, txn):
+        self.buffer.discard()
+        if self.buffer.transaction is txn:
+            self.buffer.transaction = None
+
+    def savepoint(self):
+        return BulkBufferSavepoint(self.buffer)
+
+    def sortKey(self):
+        # zope.sqlalchemy data managers use "~sqlalchemy:<id>"
+        return "~~morpfw.elasticsearch:%d" % id(self)
+
+
 class ElasticSearchStorage(BaseStorage):
 
     refresh: Optional[str] = None
     auto_id = False
     use_transactions = False
 
+    #: number of composite aggregation buckets fetched per request
+    aggregate_page_size = 1000
+
+    #: how long point in time contexts of ``iter_search`` are kept between
+    #: batches
+    pit_keep_alive = "5m"
+
+    #: queue writes and send them through the bulk API once the transaction
+    #: has committed. Reads by identifier see the queued writes, searches
+    #: and aggregations, including unique constraint checks, only see what
+    #: was sent. Ignored when ``refresh`` is set, as searches are then
+    #: expected to see the writes of the transaction. Documents created
+    #: with ``auto_id`` are sent immediately as their identifier is
+    #: generated by elasticsearch
+    use_bulk_buffer = False
+    #: refresh policy of bulk requests, ``refresh`` takes precedence if set
+    bulk_refresh: Optional[str] = "wait_for"
+    bulk_chunk_size = 500
+    bulk_max_retries = 5
+    #: seconds to wait before the first retry of rejected items, doubled on
+    #: each subsequent retry
+    bulk_retry_backoff = 0.5
+
     @property
     def index_name(self):
         raise NotImplementedError
@@ -207,38 +463,194 @@ class ElasticSearchStorage(BaseStorage):
         )
         return True
 
-    def create(self, collection, data):
-        m = self.model(self.request, collection, data)
-        cschema = dc2colanderESjson.convert(
+    def _colander_schema(self, collection, include_fields=None):
+        return schemacache.convert(
+            dc2colanderESjson,
             collection.schema,
             request=collection.request,
+            include_fields=include_fields,
             default_tzinfo=collection.request.timezone(),
         )
-        esdata = cschema().serialize(data)
+
+    @property
+    def bulk_buffer(self):
+        """Write buffer of the elasticsearch client of this request, joined
+        to the current transaction through :class:`ElasticSearchDataManager`
+        """
+        client = self.client
+        buffers = self.request.environ.setdefault("morpfw.elasticsearch.bulk", {})
+        buffer = buffers.get(client, None)
+        if buffer is None:
+            buffer = BulkBuffer(
+                client,
+                chunk_size=self.bulk_chunk_size,
+                max_retries=self.bulk_max_retries,
+                retry_backoff=self.bulk_retry_backoff,
+            )
+            buffers[client] = buffer
+        txn = transaction.get()
+        if buffer.transaction is not txn:
+            buffer.discard()
+            buffer.transaction = txn
+            txn.join(ElasticSearchDataManager(buffer, transaction.manager))
+        return buffer
+
+    def _pending_buffer(self):
+        buffers = self.request.environ.get("morpfw.elasticsearch.bulk", {})
+        buffer = buffers.get(self.client, None)
+        if buffer is None or buffer.transaction is not transaction.get():
+            return None
+        return buffer
+
+    def flush(self):
+        """Send writes queued by this request to elasticsearch. They are
+        then not dropped anymore if the transaction aborts"""
+        buffer = self._pending_buffer()
+        if buffer is not None and len(buffer):
+            buffer.flush()
+
+    def _pending_operations(self):
+        buffer = self._pending_buffer()
+        if buffer is None:
+            return {}
+        return buffer.operations(self.index_name)
+
+    def _warn_pending(self):
+        if self._pending_operations():
+            logger.warning(
+                "Querying %s with queued writes, which are not visible to "
+                "the query until the transaction commits",
+                self.index_name,
+            )
+
+    def _apply_pending(self, operations, fetch):
+        """Return document source with queued ``operations`` applied.
+        ``fetch`` returns the indexed source and is only called when no
+        queued operation replaces it"""
+        start = None
+        for idx, (op, source) in enumerate(operations):
+            if op in ["index", "create", "delete"]:
+                start = idx
+        if start is None:
+            data = fetch()
+        else:
+            data = None
+            operations = operations[start:]
+        for op, source in operations:
+            if op in ["index", "create"]:
+                data = dict(source)
+            elif op == "delete":
+                data = None
+            elif op == "update" and data is not None:
+                data = dict(data)
+                data.update(source["doc"])
+        return data
+
+    def _fetch_source(self, identifier):
         try:
-            r = self.client.index(
+            res = self.client.get(
                 index=self.index_name,
-                id=m.identifier,
-                body=esdata,
+                id=identifier,
                 refresh=self.refresh,
             )
-        except es_exc.TransportError as e:
-            print(e.args, e.error, e.info)
-            print(data)
-            raise e
-
-        if self.auto_id:
-            self.set_identifier(m.data, r["_id"])
-            m.save()
+        except es_exc.NotFoundError:
+            return None
+        return res["_source"]
+
+    def _queue(self, action, source=None):
+        self._queue_all([(action, source)])
+
+    def _queue_all(self, actions):
+        """Queue ``actions`` in the bulk buffer, or send them right away
+        when writes are not buffered"""
+        if self.use_bulk_buffer and not self.refresh:
+            buffer = self.bulk_buffer
+            for action, source in actions:
+                buffer.add(action, source, self.bulk_refresh)
+            return
+        for start in range(0, len(actions), self.bulk_chunk_size):
+            self._bulk(actions[start : start + self.bulk_chunk_size])
+
+    def _bulk(self, actions):
+        """Send ``actions`` immediately, writes queued before them stay
+        queued"""
+        return self.bulk_buffer.send(actions, self.refresh or self.bulk_refresh)
+
+    def create(self, collection, data):
+        m = self.model(self.request, collection, data)
+        cschema = self._colander_schema(collection)
+        esdata = cschema().serialize(data)
+        if not self.auto_id:
+            self._queue(
+                {"index": {"_index": self.index_name, "_id": m.identifier}}, esdata
+            )
+            return m
+
+        # generated identifier is only known from the response
+        items = self._bulk([({"index": {"_index": self.index_name}}, esdata)])
+        self.set_identifier(m.data, items[0]["index"]["_id"])
+        m.save()
         return m
 
-    def search(self, collection, query=None, offset=None, limit=None, order_by=None):
+    def bulk_create(self, collection, items):
+        models = [self.model(self.request, collection, data) for data in items]
+        if not models:
+            return []
+        cschema = self._colander_schema(collection)()
+        actions = []
+        for m, data in zip(models, items):
+            action = {"_index": self.index_name}
+            if not self.auto_id:
+                action["_id"] = m.identifier
+            actions.append(({"index": action}, cschema.serialize(data)))
+        if not self.auto_id:
+            self._queue_all(actions)
+            return models
+
+        res = self._bulk(actions)
+        for m, item in zip(models, res):
+            self.set_identifier(m.data, item["index"]["_id"])
+        self.bulk_update(collection, [(m.identifier, m.data.as_dict()) for m in models])
+        return models
+
+    def bulk_update(self, collection, items):
+        actions = []
+        for identifier, data in items:
+            cschema = self._colander_schema(collection, data.keys())
+            actions.append(
+                (
+                    {"update": {"_index": self.index_name, "_id": identifier}},
+                    {"doc": cschema().serialize(data)},
+                )
+            )
+        self._queue_all(actions)
+
+    def bulk_delete(self, collection, models, **kwargs):
+        self._queue_all(
+            [
+                ({"delete": {"_index": self.index_name, "_id": m.identifier}}, None)
+                for m in models
+            ]
+        )
+
+    def search(
+        self,
+        collection,
+        query=None,
+        offset=None,
+        limit=None,
+        order_by=None,
+        cursor=None,
+    ):
+        self._warn_pending()
         if limit is None:
             limit = 9999
         if query:
             q = {"query": compile_condition("elasticsearch", query)()}
         else:
             q = {"query": {"match_all": {}}}
+        if cursor is not None:
+            return self._search_after(collection, q, limit, cursor)
         if limit is not None:
             q["from"] = 0
             q["size"] = limit
@@ -256,24 +668,19 @@ class ElasticSearchStorage(BaseStorage):
 
         res = self.client.search(index=self.index_name, body=q, **params)
 
-        models = []
-        for o in res["hits"]["hits"]:
-            data = o["_source"]
-            cschema = dc2colanderESjson.convert(
-                collection.schema,
-                include_fields=data.keys(),
-                request=collection.request,
-                default_tzinfo=collection.request.timezone(),
-            )
-            data = cschema().deserialize(data)
-            models.append(self.model(self.request, collection, data))
-
-        return list(models)
+        hits = [o["_source"] for o in res["hits"]["hits"]]
+        return [
+            self.model(self.request, collection, data)
+            for data in self._deserialize_hits(collection, hits)
+        ]
 
     def aggregate(self, query=None, group=None, order_by=None, limit=None):
         if group is None:
             return []
 
+        plan = AggregatePlan(group)
+        self._warn_pending()
+
         if query:
             q = {"query": compile_condition("elasticsearch", query)()}
         else:
@@ -281,182 +688,290 @@ class ElasticSearchStorage(BaseStorage):
 
         q["size"] = 0
 
-        params = {}
-        if order_by:
-            params["sort"] = [":".join(order_by)]
-        if limit is not None:
-            params["size"] = limit
-
         aggs = {}
-        sources = []
-        result_converters = {}
-        if group:
-
-            for k, v in group.items():
-                if isinstance(v, str):
-                    sources.append({k: {"terms": {"field": v}}})
-
-                elif isinstance(v, dict):
-                    ff = v["function"]
-                    f = v["field"]
-                    if ff == "count":
-                        aggs[k] = {"value_count": {"field": f}}
-                    elif ff == "sum":
-                        aggs[k] = {"sum": {"field": f}}
-                    elif ff == "avg":
-                        aggs[k] = {"avg": {"field": f}}
-                    elif ff == "year":
-                        sources.append(
-                            {
-                                k: {
-                                    "date_histogram": {
-                                        "field": f,
-                                        "interval": "year",
-                                        "format": "yyyy",
-                                    }
-                                }
-                            }
-                        )
-                        result_converters[k] = lambda request, value: int(value)
-
-                    elif ff == "month":
-                        sources.append(
-                            {
-                                k: {
-                                    "date_histogram": {
-                                        "field": f,
-                                        "interval": "month",
-                                        "format": "MM",
-                                    }
-                                }
-                            }
-                        )
-
-                        result_converters[k] = lambda request, value: int(value)
-
-                    elif ff == "day":
-                        sources.append(
-                            {
-                                k: {
-                                    "date_histogram": {
-                                        "field": f,
-                                        "interval": "day",
-                                        "format": "dd",
-                                    }
-                                }
-                            }
-                        )
-
-                        result_converters[k] = lambda request, value: int(value)
-
-                    elif ff == "interval_1m":
-                        sources.append(
-                            {
-                                k: {
-                                    "date_histogram": {
-                                        "field": f,
-                                        "interval": "1m",
-                                        "format": "yyyy-MM-dd'T'HH:mmZ",
-                                    }
-                                }
-                            }
-                        )
-
-                    elif ff == "interval_15m":
-                        sources.append(
-                            {
-                                k: {
-                                    "date_histogram": {
-                                        "field": f,
-                                        "interval": "15m",
-                                        "format": "yyyy-MM-dd'T'HH:mmZ",
-                                    }
-                                }
-                            }
-                        )
-                    elif ff == "interval_30m":
-                        sources.append(
-                            {
-                                k: {
-                                    "date_histogram": {
-                                        "field": f,
-                                        "interval": "30m",
-                                        "format": "yyyy-MM-dd'T'HH:mmZ",
-                                    }
-                                }
-                            }
-                        )
-
-                    elif ff == "interval_1h":
-                        sources.append(
-                            {
-                                k: {
-                                    "date_histogram": {
-                                        "field": f,
-                                        "interval": "1h",
-                                        "format": "yyyy-MM-dd'T'HH:mmZ",
-                                    }
-                                }
-                            }
-                        )
-
-                    else:
-                        raise ValueError("Unknown function %s" % ff)
-
-            if sources:
-                q["aggs"] = {
-                    "results": {"composite": {"sources": sources}, "aggs": aggs}
-                }
-                if limit is not None:
-                    q["aggs"]["results"]["composite"]["size"] = limit
-            else:
-                q["aggs"] = aggs
-
-        res = self.client.search(index=self.index_name, body=q, **params)
-
-        if "aggregations" not in res:
-            if len(group) == 1 and "count" in group.keys():
-                return [{"count": res["hits"]["total"]["value"]}]
-            raise AssertionError(
-                "Unsupported query\n  Query: %s\n  Result: %s"
-                % (json.dumps(q, indent=4), json.dumps(res, indent=4))
+        for m in plan.metrics:
+            aggs[m.key] = self._aggregate_metric(m)
+
+        sources = [{d.key: self._aggregate_dimension(d)} for d in plan.dimensions]
+
+        if not sources:
+            q["aggs"] = aggs
+            res = self.client.search(index=self.index_name, body=q)
+            data = res.get("aggregations", {})
+            row = {}
+            for m in plan.metrics:
+                row[m.key] = self._aggregate_metric_value(m, data[m.key])
+            return plan.finalize([plan.format_row(row)], order_by, limit)
+
+        # without ordering, stop paging through buckets once limit is reached
+        page_size = self.aggregate_page_size
+        if limit is not None and order_by is None:
+            page_size = min(int(limit), page_size)
+        composite = {"sources": sources, "size": page_size}
+        q["aggs"] = {"results": {"composite": composite, "aggs": aggs}}
+
+        rows = []
+        while True:
+            res = self.client.search(index=self.index_name, body=q)
+            data = res["aggregations"]["results"]
+            for bucket in data["buckets"]:
+                row = bucket["key"].copy()
+                for m in plan.metrics:
+                    row[m.key] = self._aggregate_metric_value(m, bucket[m.key])
+                rows.append(plan.format_row(row))
+            after_key = data.get("after_key", None)
+            if not data["buckets"] or after_key is None:
+                break
+            if limit is not None and order_by is None and len(rows) >= int(limit):
+                break
+            composite["after"] = after_key
+
+        return plan.finalize(rows, order_by, limit)
+
+    def _aggregate_dimension(self, dimension):
+        if dimension.function is None:
+            return {"terms": {"field": dimension.field, "missing_bucket": True}}
+        if dimension.is_part:
+            getter = PART_GETTERS[dimension.function]
+            source = (
+                "if (doc[params.field].size() == 0) { return null; } "
+                "return doc[params.field].value"
+                ".withZoneSameInstant(ZoneId.of(params.tz)).%s();" % getter
             )
-
-        result = []
-        if sources:
-            data = res["aggregations"]["results"]["buckets"]
-            for row in data:
-                r = row["key"].copy()
-                for k in aggs:
-                    r[k] = row[k]["value"]
-                for k, f in result_converters.items():
-                    r[k] = f(self.request, r[k])
-                result.append(r)
-            return result
-
-        data = res["aggregations"]
-        r = {}
-        for k in aggs:
-            r[k] = data[k]["value"]
-        return [r]
+            return {
+                "terms": {
+                    "script": {
+                        "lang": "painless",
+                        "source": source,
+                        "params": {
+                            "field": dimension.field,
+                            "tz": dimension.tz.zone,
+                        },
+                    },
+                    "missing_bucket": True,
+                }
+            }
+        histogram = {
+            "field": dimension.field,
+            "time_zone": dimension.tz.zone,
+            "missing_bucket": True,
+        }
+        if dimension.step > 1:
+            histogram["fixed_interval"] = "%dm" % dimension.step
+        else:
+            histogram["calendar_interval"] = CALENDAR_INTERVALS[dimension.unit]
+        return {"date_histogram": histogram}
+
+    def _aggregate_metric(self, metric):
+        f = metric.function
+        if f == "count":
+            return {"value_count": {"field": metric.field}}
+        if f == "count_distinct":
+            # counts are exact up to the precision threshold
+            return {
+                "cardinality": {"field": metric.field, "precision_threshold": 40000}
+            }
+        if f == "stddev":
+            return {"extended_stats": {"field": metric.field}}
+        if f in ["percentile", "median"]:
+            return {
+                "percentiles": {
+                    "field": metric.field,
+                    "percents": [metric.percentile * 100],
+                    "keyed": False,
+                }
+            }
+        return {f: {"field": metric.field}}
+
+    def _aggregate_metric_value(self, metric, data):
+        f = metric.function
+        if f == "stddev":
+            if data["count"] < 2:
+                return None
+            return data["std_deviation_sampling"]
+        if f in ["percentile", "median"]:
+            return data["values"][0]["value"]
+        return data["value"]
 
     def get(self, collection, identifier):
+        operations = self._pending_operations().get(str(identifier), [])
+        data = self._apply_pending(operations, lambda: self._fetch_source(identifier))
+        if data is None:
+            return None
+        cschema = self._colander_schema(collection, data.keys())
+        data = cschema().deserialize(data)
+        return self.model(self.request, collection, data)
+
+    def _keyset_sort(self, collection, cursor):
+        field = cursor.order_by[0]
+        if is_text_mapping(collection, field):
+            field = "%s.raw" % field
+        order = cursor.sort_order
+        # same null ordering as postgresql: last on asc, first on desc
+        missing = "_last" if order == "asc" else "_first"
+        return [
+            {field: {"order": order, "missing": missing}},
+            {cursor.key_field: {"order": order}},
+        ]
+
+    def _search_after(self, collection, q, limit, cursor):
+        q["sort"] = self._keyset_sort(collection, cursor)
+        q["size"] = limit
+        if not cursor.is_start:
+            q["search_after"] = [cursor.value, cursor.key]
+
+        res = self.client.search(index=self.index_name, body=q)
+        hits = res["hits"]["hits"]
+        models = []
+        for hit, data in zip(
+            hits, self._deserialize_hits(collection, [h["_source"] for h in hits])
+        ):
+            m = self.model(self.request, collection, data)
+            m._es_sort = hit["sort"]
+            models.append(m)
+        if cursor.direction == "previous":
+            models.reverse()
+        return models
+
+    def iter_search(self, collection, query=None, order_by=None, batch_size=100):
+        """Lazily iterate over search result with ``search_after``, within a
+        point in time so that the walk sees a consistent snapshot of the
+        index. Clusters without point in time support are walked without
+        it"""
+        self._warn_pending()
+        if order_by is None:
+            order_by = ("created", "desc")
+        if query:
+            q = {"query": compile_condition("elasticsearch", query)()}
+        else:
+            q = {"query": {"match_all": {}}}
+        q["sort"] = self._keyset_sort(
+            collection, Cursor(order_by, self.cursor_key_field)
+        )
+        q["size"] = batch_size
+        pit_id = self._open_point_in_time()
+        deserialize = self._deserializer(collection)
         try:
-            res = self.client.get(
-                index=self.index_name, id=identifier, refresh=self.refresh,
+            while True:
+                if pit_id is None:
+                    res = self.client.search(index=self.index_name, body=q)
+                else:
+                    q["pit"] = {"id": pit_id, "keep_alive": self.pit_keep_alive}
+                    res = self.client.search(body=q)
+                    pit_id = res.get("pit_id", pit_id)
+                hits = res["hits"]["hits"]
+                for hit in hits:
+                    data = deserialize(hit["_source"])
+                    m = self.model(self.request, collection, data)
+                    m._es_sort = hit["sort"]
+                    yield m
+                if len(hits) < batch_size:
+                    return
+                q["search_after"] = hits[-1]["sort"]
+        finally:
+            if pit_id is not None:
+                self.client.close_point_in_time(body={"id": pit_id})
+
+    def _open_point_in_time(self):
+        try:
+            res = self.client.open_point_in_time(
+                index=self.index_name, keep_alive=self.pit_keep_alive
             )
-        except es_exc.NotFoundError as e:
+        except (es_exc.RequestError, es_exc.NotFoundError):
+            # point in time is available from elasticsearch 7.10
             return None
+        return res["id"]
+
+    def get_cursor(self, model, order_by, direction="next"):
+        sort = getattr(model, "_es_sort", None)
+        if sort is None:
+            value = model.data[order_by[0]]
+            if isinstance(value, datetime):
+                # elasticsearch sorts dates as epoch milliseconds
+                value = int(value.timestamp() * 1000)
+            sort = [value, model.data[self.cursor_key_field]]
+        return Cursor(
+            order_by,
+            self.cursor_key_field,
+            value=sort[0],
+            key=sort[1],
+            direction=direction,
+        )
 
-        data = res["_source"]
-        cschema = dc2colanderESjson.convert(
-            collection.schema,
-            include_fields=data.keys(),
-            request=collection.request,
-            default_tzinfo=collection.request.timezone(),
+    def _deserializer(self, collection):
+        """Return function deserializing documents of ``collection``.
+
+        Documents only carry the fields they were indexed with, the colander
+        schema is instantiated once per distinct set of fields"""
+        schemas = {}
+
+        def deserialize(data):
+            key = tuple(sorted(data.keys()))
+            cschema = schemas.get(key, None)
+            if cschema is None:
+                cschema = self._colander_schema(collection, key)()
+                schemas[key] = cschema
+            return cschema.deserialize(data)
+
+        return deserialize
+
+    def _deserialize_hits(self, collection, hits):
+        deserialize = self._deserializer(collection)
+        return [deserialize(data) for data in hits]
+
+    def get_many(self, collection, identifiers):
+        identifiers = list(identifiers)
+        if not identifiers:
+            return []
+        pending = self._pending_operations()
+        sources = {}
+        fetch = [
+            i
+            for i in identifiers
+            if not any(
+                op in ["index", "create", "delete"]
+                for op, source in pending.get(str(i), [])
+            )
+        ]
+        if fetch:
+            res = self.client.mget(
+                index=self.index_name,
+                body={"ids": fetch},
+                refresh=self.refresh,
+            )
+            for doc in res["docs"]:
+                if doc.get("found", False):
+                    sources[doc["_id"]] = doc["_source"]
+        found = {}
+        for i in set(str(i) for i in identifiers):
+            data = self._apply_pending(pending.get(i, []), lambda: sources.get(i, None))
+            if data is not None:
+                found[i] = data
+        keys = list(found.keys())
+        deserialized = self._deserialize_hits(collection, [found[k] for k in keys])
+        models = {
+            k: self.model(self.request, collection, data)
+            for k, data in zip(keys, deserialized)
+        }
+        return [models.get(str(i), None) for i in identifiers]
+
+    def get_many_by_uuid(self, collection, uuids):
+        uuids = list(uuids)
+        if not uuids:
+            return []
+        uuid_field = self.app.get_uuidfield(self.model.schema)
+        self._warn_pending()
+        res = self.client.search(
+            index=self.index_name,
+            body={"query": {"terms": {uuid_field: list(set(uuids))}}},
+            size=len(uuids),
         )
-        data = cschema().deserialize(data)
-        return self.model(self.request, collection, data)
+        hits = [o["_source"] for o in res["hits"]["hits"]]
+        found = {}
+        for data in self._deserialize_hits(collection, hits):
+            m = self.model(self.request, collection, data)
+            found[m.uuid] = m
+        return [found.get(u, None) for u in uuids]
 
     def get_by_uuid(self, collection, uuid):
         res = self.search(
@@ -468,32 +983,22 @@ class ElasticSearchStorage(BaseStorage):
         return None
 
     def get_by_id(self, collection, id):
-        res = self.client.get(index=self.index_name, id=id)
-        data = res["_source"]
-        cschema = dc2colanderESjson.convert(
-            collection.schema,
-            include_fields=data.keys(),
-            request=collection.request,
-            default_tzinfo=collection.request.timezone(),
+        operations = self._pending_operations().get(str(id), [])
+        data = self._apply_pending(
+            operations, lambda: self.client.get(index=self.index_name, id=id)["_source"]
         )
+        if data is None:
+            return None
+        cschema = self._colander_schema(collection, data.keys())
         data = cschema().deserialize(data)
         return self.model(self.request, collection, data)
 
     def update(self, collection, identifier, data):
-        cschema = dc2colanderESjson.convert(
-            collection.schema,
-            include_fields=data.keys(),
-            request=collection.request,
-            default_tzinfo=collection.request.timezone(),
-        )
-        data = cschema().serialize(data)
-        self.client.update(
-            index=self.index_name,
-            id=identifier,
-            body={"doc": data},
-            refresh=self.refresh,
+        cschema = self._colander_schema(collection, data.keys())
+        self._queue(
+            {"update": {"_index": self.index_name, "_id": identifier}},
+            {"doc": cschema().serialize(data)},
         )
 
     def delete(self, identifier, model, **kwargs):
-        self.client.delete(index=self.index_name, id=identifier, refresh=True)
-
+        self._queue({"delete": {"_index": self.index_name, "_id": identifier}})
@@ -1,12 +1,47 @@
+import bisect
+
 import jsl
 from morepath.request import Request
 from rulez import compile_condition
 
+from ..aggregate import AggregatePlan
+from ..cursor import Cursor
 from .base import BaseStorage
 
 DATA = {}
 
 
+def keyset_search(items, limit, cursor, getter=lambda o, field: o.data[field]):
+    """Keyset pagination over ``items``, field values are read with ``getter``"""
+    field = cursor.order_by[0]
+    key_field = cursor.key_field
+
+    # nulls sort last in ascending order, same as postgresql
+    def sortkey(value, key):
+        return (value is None, value, key)
+
+    index = sorted(
+        ((sortkey(getter(o, field), getter(o, key_field)), o) for o in items),
+        key=lambda i: i[0],
+    )
+    keys = [k for k, o in index]
+    if cursor.sort_order == "asc":
+        start = 0
+        if not cursor.is_start:
+            start = bisect.bisect_right(keys, sortkey(cursor.value, cursor.key))
+        res = [o for k, o in index[start:]]
+    else:
+        end = len(index)
+        if not cursor.is_start:
+            end = bisect.bisect_left(keys, sortkey(cursor.value, cursor.key))
+        res = [o for k, o in reversed(index[:end])]
+    if limit is not None:
+        res = res[:limit]
+    if cursor.direction == "previous":
+        res.reverse()
+    return res
+
+
 class MemoryStorage(BaseStorage):
 
     incremental_id = False
@@ -35,20 +70,24 @@ class MemoryStorage(BaseStorage):
         return obj
 
     def aggregate(self, query=None, group=None, order_by=None, limit=None):
-        items = self.search(query)
-
-        result = []
-        if group:
-            row = {}
-            for k, v in group.items():
-                if v["function"] == "count":
-                    row[k] = len(DATA[self.typekey].values())
-                else:
-                    raise NotImplementedError
-            result.append(row)
-        return result
-
-    def search(self, collection, query=None, offset=None, limit=None, order_by=None):
+        if not group:
+            return []
+        plan = AggregatePlan(group)
+        items = DATA[self.typekey].values()
+        if query:
+            f = compile_condition("native", query)
+            items = [o for o in items if f(o.data)]
+        return plan.aggregate([o.data for o in items], order_by=order_by, limit=limit)
+
+    def search(
+        self,
+        collection,
+        query=None,
+        offset=None,
+        limit=None,
+        order_by=None,
+        cursor=None,
+    ):
         res = []
         if query:
             f = compile_condition("native", query)
@@ -59,17 +98,35 @@ class MemoryStorage(BaseStorage):
             res = list(DATA[self.typekey].values())
         for r in res:
             r.request = self.request
-        if offset is not None:
-            res = res[offset:]
-        if limit is not None:
-            res = res[:limit]
+        if cursor is not None:
+            return self._keyset_search(res, limit, cursor)
         if order_by is not None:
             col, d = order_by
             res = list(sorted(res, key=lambda x: x.data[col]))
             if d == "desc":
                 res = list(reversed(res))
+        if offset is not None:
+            res = res[offset:]
+        if limit is not None:
+            res = res[:limit]
         return res
 
+    def iter_search(self, collection, query=None, order_by=None, batch_size=100):
+        items = list(DATA[self.typekey].values())
+        if query:
+            f = compile_condition("native", query)
+            items = (o for o in items if f(o.data))
+        if order_by is not None:
+            items = self._keyset_search(
+                items, None, Cursor(order_by, self.cursor_key_field)
+            )
+        for o in items:
+            o.request = self.request
+            yield o
+
+    def _keyset_search(self, items, limit, cursor):
+        return keyset_search(items, limit, cursor)
+
     def get(self, collection, identifier):
         if identifier not in DATA[self.typekey].keys():
             return None
@@ -77,6 +134,16 @@ class MemoryStorage(BaseStorage):
         res.request = self.request
         return res
 
+    def get_many(self, collection, identifiers):
+        datastore = DATA[self.typekey]
+        result = []
+        for identifier in identifiers:
+            res = datastore.get(identifier, None)
+            if res is not None:
+                res.request = self.request
+            result.append(res)
+        return result
+
     def get_by_id(self, collection, id):
         id_field = self.incremental_column
         data_by_id = {}
@@ -105,6 +172,22 @@ class MemoryStorage(BaseStorage):
         res.request = self.request
         return res
 
+    def get_many_by_uuid(self, collection, uuids):
+        uuid_field = self.app.get_uuidfield(self.model.schema)
+        data_by_uuid = {}
+        for u, v in DATA[self.typekey].items():
+            if uuid_field not in v.data.keys():
+                raise AttributeError("%s does not have %s field" % (v, uuid_field))
+            data_by_uuid[v.data[uuid_field]] = v
+
+        result = []
+        for uuid in uuids:
+            res = data_by_uuid.get(uuid, None)
+            if res is not None:
+                res.request = self.request
+            result.append(res)
+        return result
+
     def update(self, collection, identifier, data):
         obj = DATA[self.typekey][identifier]
         for k, v in data.items():
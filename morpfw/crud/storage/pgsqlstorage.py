@@ -17,7 +17,7 @@ from sqlalchemy.types import CHAR, TypeDecorator
 
 from ..app import App
 from .base import BaseStorage
-from .sqlstorage import Base, MappedTable, SQLStorage
+from .sqlstorage import Base, MappedTable, SQLStorage, create_indexes
 
 db_meta = Base.metadata
 
@@ -30,6 +30,7 @@ def construct_orm_model(schema, metadata, *, name=None):
         return existing
 
     table = dc2pgsqla.convert(schema, metadata, name=name)
+    create_indexes(table, getattr(schema, "__indexes__", []))
 
     class Table(MappedTable):
 
@@ -1,7 +1,7 @@
+import time
 import typing
 import uuid
 from datetime import datetime
-from decimal import Decimal
 
 import jsl
 import pytz
@@ -10,14 +10,17 @@ import sqlalchemy_jsonfield as sajson
 import sqlalchemy_utils as sautils
 from rulez import compile_condition
 from sqlalchemy import func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.exc import StatementError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import select
 from sqlalchemy.types import CHAR, TypeDecorator
 from zope.sqlalchemy import mark_changed
 
+from ..aggregate import AggregatePlan, format_value
 from ..app import App
+from ..blobstorage.base import NullBlobStorage
+from ..schema import Index
 from .base import BaseStorage
 
 
@@ -25,6 +28,16 @@ class SQLStorage(BaseStorage):
 
     _temp: dict = {}
 
+    cursor_key_field = "id"
+
+    #: number of rows written per statement in bulk operations
+    bulk_batch_size = 1000
+
+    #: number of rows removed per statement by vacuum, and the seconds to
+    #: sleep between statements
+    vacuum_batch_size = 1000
+    vacuum_sleep = 0
+
     @property
     def orm_model(self):
         raise NotImplementedError
@@ -40,74 +53,61 @@ class SQLStorage(BaseStorage):
         for k, v in src.items():
             dst[k] = v
         m = self.model(self.request, collection, o)
-        identifier = m.identifier
         self.session.add(o)
+        # flush loads the generated primary key and applies column defaults
+        # to ``o``, no refresh is needed as columns have no server defaults
         self.session.flush()
-        self.session.refresh(o)
         return m
 
+    def bulk_create(self, collection, items):
+        items = list(items)
+        uuid_field = self.app.get_uuidfield(self.model.schema)
+        mapper = sa.inspect(self.orm_model)
+        result = []
+        for i in range(0, len(items), self.bulk_batch_size):
+            mappings = []
+            uuids = []
+            for data in items[i : i + self.bulk_batch_size]:
+                o = self.orm_model()
+                dst = self.app.get_dataprovider(self.model.schema, o, self)
+                src = self.app.get_dataprovider(self.model.schema, data, self)
+                for k, v in src.items():
+                    dst[k] = v
+                # uuid is needed to read the inserted rows back
+                if getattr(o, uuid_field, None) is None:
+                    setattr(o, uuid_field, uuid.uuid4())
+                uuids.append(getattr(o, uuid_field))
+                mappings.append(
+                    {
+                        attr.key: o.__dict__[attr.key]
+                        for attr in mapper.column_attrs
+                        if attr.key in o.__dict__
+                    }
+                )
+            # executemany INSERT per group of rows with the same columns,
+            # followed by a single SELECT to load generated ids and defaults
+            self.session.bulk_insert_mappings(self.orm_model, mappings)
+            result += self.get_many_by_uuid(collection, uuids)
+        mark_changed(self.session())
+        return result
+
     def aggregate(self, query=None, group=None, order_by=None, limit=None):
         group_bys = []
         group_bys_map = {}
+        plan = None
 
         if group:
+            plan = AggregatePlan(group)
             fields = []
-            for k, v in group.items():
-                if isinstance(v, str):
-                    c = getattr(self.orm_model, v)
-                    fields.append(c)
-                    group_bys.append(c)
-                elif isinstance(v, dict):
-                    ff = v["function"]
-                    f = v["field"]
-                    c = getattr(self.orm_model, f)
-                    if ff == "count":
-                        op = func.count(c).label(k)
-                        fields.append(op)
-                        group_bys_map[k] = op
-                    elif ff == "sum":
-                        op = func.sum(c).label(k)
-                        fields.append(op)
-                        group_bys_map[k] = op
-                    elif ff == "avg":
-                        op = func.avg(c).label(k)
-                        fields.append(op)
-                        group_bys_map[k] = op
-                    elif ff == "min":
-                        op = func.min(c).label(k)
-                        fields.append(op)
-                        group_bys_map[k] = op
-                    elif ff == "max":
-                        op = func.max(c).label(k)
-                        fields.append(op)
-                        group_bys_map[k] = op
-                    elif ff == "year":
-                        op = func.date_part("YEAR", c).label(k)
-                        fields.append(op)
-                        group_bys.append(op)
-                        group_bys_map[k] = op
-                    elif ff == "month":
-                        op = func.date_part("MONTH", c).label(k)
-                        fields.append(op)
-                        group_bys.append(op)
-                        group_bys_map[k] = op
-                    elif ff == "day":
-                        op = func.date_part("DAY", c).label(k)
-                        fields.append(op)
-                        group_bys.append(op)
-                        group_bys_map[k] = op
-                    elif ff == "date":
-                        op = func.to_char(c, "YYYY-MM-DD").label(k)
-                        fields.append(op)
-                        group_bys.append(op)
-                        group_bys_map[k] = op
-                    elif ff == "hourly":
-                        op = func.to_char(c, "YYYY-MM-DD HH24:00 TZ").label(k)
-                        fields.append(op)
-                        group_bys.append(op)
-                        group_bys_map[k] = op
-                    else:
-                        raise ValueError("Unknown function %s" % ff)
+            for d in plan.dimensions:
+                op = self._aggregate_dimension(d).label(d.key)
+                fields.append(op)
+                group_bys.append(op)
+                group_bys_map[d.key] = op
+            for m in plan.metrics:
+                op = self._aggregate_metric(m).label(m.key)
+                fields.append(op)
+                group_bys_map[m.key] = op
         else:
             fields = [self.orm_model]
 
@@ -154,37 +154,55 @@ class SQLStorage(BaseStorage):
 
         for o in q_res:
             d = o._asdict()
-            for k, v in d.items():
-                if isinstance(v, datetime):
-                    d[k] = v.isoformat()
-                elif isinstance(v, Decimal):
-                    d[k] = float(v)
-                elif isinstance(v, uuid.UUID):
-                    d[k] = v.hex
-
+            if plan is not None:
+                d = plan.format_row(d)
+            else:
+                d = dict((k, format_value(v)) for k, v in d.items())
             results.append(d)
         return results
 
-    def search(self, collection, query=None, offset=None, limit=None, order_by=None):
-        include_deleted = self.request.environ.get(
-            "morpfw.sqlstorage.include_deleted", False
-        )
-        if query:
-            f = compile_condition("sqlalchemy", query)
-            filterquery = f(self.orm_model)
-            if not include_deleted:
-                q = self.session.query(self.orm_model).filter(
-                    sa.and_(self.orm_model.deleted.is_(None), filterquery)
-                )
-            else:
-                q = self.session.query(self.orm_model).filter(filterquery)
+    def _aggregate_dimension(self, dimension):
+        c = getattr(self.orm_model, dimension.field)
+        if dimension.function is None:
+            return c
+        if dimension.timezone:
+            c = func.timezone(dimension.timezone, c)
+        if dimension.is_part:
+            return func.date_part(dimension.function.upper(), c)
+        if not dimension.timezone:
+            c = func.timezone("UTC", c)
+        if dimension.unit == "minute" and dimension.step > 1:
+            bucket = func.date_trunc("hour", c) + func.floor(
+                func.date_part("minute", c) / dimension.step
+            ) * sa.literal_column("interval '%d minutes'" % dimension.step)
         else:
-            if not include_deleted:
-                q = self.session.query(self.orm_model).filter(
-                    self.orm_model.deleted.is_(None)
-                )
-            else:
-                q = self.session.query(self.orm_model)
+            bucket = func.date_trunc(dimension.unit, c)
+        return func.timezone(dimension.timezone or "UTC", bucket)
+
+    def _aggregate_metric(self, metric):
+        c = getattr(self.orm_model, metric.field)
+        f = metric.function
+        if f == "count_distinct":
+            return func.count(sa.distinct(c))
+        if f == "stddev":
+            return func.stddev_samp(c)
+        if f in ["percentile", "median"]:
+            return func.percentile_cont(metric.percentile).within_group(c.asc())
+        return getattr(func, f)(c)
+
+    def search(
+        self,
+        collection,
+        query=None,
+        offset=None,
+        limit=None,
+        order_by=None,
+        cursor=None,
+    ):
+        q = self._search_query(query)
+
+        if cursor is not None:
+            return self._keyset_search(collection, q, limit, cursor)
 
         if order_by is not None:
             col = order_by[0]
@@ -216,6 +234,78 @@ class SQLStorage(BaseStorage):
             except StatementError:
                 return []
 
+    def iter_search(self, collection, query=None, order_by=None, batch_size=100):
+        q = self._search_query(query)
+        if order_by is not None:
+            col = getattr(self.orm_model, order_by[0])
+            keycol = getattr(self.orm_model, self.cursor_key_field)
+            if order_by[1] == "desc":
+                q = q.order_by(col.desc(), keycol.desc())
+            else:
+                q = q.order_by(col, keycol)
+        # stream rows through a server side cursor
+        try:
+            for o in q.yield_per(batch_size):
+                yield self.model(self.request, collection, o)
+        except StatementError:
+            return
+
+    def _search_query(self, query=None):
+        include_deleted = self.request.environ.get(
+            "morpfw.sqlstorage.include_deleted", False
+        )
+        if query:
+            f = compile_condition("sqlalchemy", query)
+            filterquery = f(self.orm_model)
+            if not include_deleted:
+                q = self.session.query(self.orm_model).filter(
+                    sa.and_(self.orm_model.deleted.is_(None), filterquery)
+                )
+            else:
+                q = self.session.query(self.orm_model).filter(filterquery)
+        else:
+            if not include_deleted:
+                q = self.session.query(self.orm_model).filter(
+                    self.orm_model.deleted.is_(None)
+                )
+            else:
+                q = self.session.query(self.orm_model)
+        return q
+
+    def _keyset_filter(self, cursor):
+        col = getattr(self.orm_model, cursor.order_by[0])
+        keycol = getattr(self.orm_model, cursor.key_field)
+        value, key = cursor.value, cursor.key
+        # nulls sort last on asc and first on desc, see _keyset_search
+        if cursor.sort_order == "asc":
+            if value is None:
+                return sa.and_(col.is_(None), keycol > key)
+            return sa.or_(
+                col > value, sa.and_(col == value, keycol > key), col.is_(None)
+            )
+        if value is None:
+            return sa.or_(sa.and_(col.is_(None), keycol < key), col.isnot(None))
+        return sa.or_(col < value, sa.and_(col == value, keycol < key))
+
+    def _keyset_search(self, collection, q, limit, cursor):
+        col = getattr(self.orm_model, cursor.order_by[0])
+        keycol = getattr(self.orm_model, cursor.key_field)
+        if not cursor.is_start:
+            q = q.filter(self._keyset_filter(cursor))
+        if cursor.sort_order == "desc":
+            q = q.order_by(col.desc().nullsfirst(), keycol.desc())
+        else:
+            q = q.order_by(col.asc().nullslast(), keycol)
+        if limit is not None:
+            q = q.limit(limit)
+        try:
+            result = [self.model(self.request, collection, o) for o in q.all()]
+        except StatementError:
+            return []
+        if cursor.direction == "previous":
+            result.reverse()
+        return result
+
     def get(self, collection, identifier):
         qs = []
         idfield = self.app.get_identifierfield(self.model.schema)
@@ -242,6 +332,62 @@ class SQLStorage(BaseStorage):
             return None
         return self.model(self.request, collection, r)
 
+    def _normalize_key(self, attr, value):
+        if value is not None and isinstance(attr.property.columns[0].type, GUID):
+            if isinstance(value, uuid.UUID):
+                return value.hex
+            return uuid.UUID(str(value)).hex
+        return value
+
+    def _get_many(self, collection, attr, values, include_deleted=False):
+        values = list(values)
+        if not values:
+            return []
+        try:
+            keys = [self._normalize_key(attr, v) for v in values]
+        except ValueError:
+            # malformed uuid
+            return [None for v in values]
+        qs = [attr.in_(list(set(keys)))]
+        if not include_deleted:
+            qs.append(self.orm_model.deleted.is_(None))
+        q = self.session.query(self.orm_model).filter(sa.and_(*qs))
+        try:
+            rows = q.all()
+        except StatementError:
+            return [None for v in values]
+        found = {}
+        for r in rows:
+            found[self._normalize_key(attr, getattr(r, attr.key))] = self.model(
+                self.request, collection, r
+            )
+        return [found.get(k, None) for k in keys]
+
+    def get_many(self, collection, identifiers):
+        idfield = self.app.get_identifierfield(self.model.schema)
+        include_deleted = self.request.environ.get(
+            "morpfw.sqlstorage.include_deleted", False
+        )
+        return self._get_many(
+            collection,
+            getattr(self.orm_model, idfield),
+            identifiers,
+            include_deleted=include_deleted,
+        )
+
+    def get_many_by_uuid(self, collection, uuids):
+        uuid_field = self.app.get_uuidfield(self.model.schema)
+        if getattr(self.orm_model, uuid_field, None) is None:
+            raise AttributeError(
+                "%s does not have %s field" % (self.orm_model, uuid_field)
+            )
+        return self._get_many(
+            collection,
+            getattr(self.orm_model, uuid_field),
+            uuids,
+            include_deleted=True,
+        )
+
     def get_by_id(self, collection, id):
         q = self.session.query(self.orm_model).filter(self.orm_model.id == id)
         r = q.first()
@@ -285,6 +431,39 @@ class SQLStorage(BaseStorage):
         self.session.flush()
         return self.model(self.request, collection, r)
 
+    def bulk_update(self, collection, items):
+        items = list(items)
+        idfield = self.app.get_identifierfield(self.model.schema)
+        include_deleted = self.request.environ.get(
+            "morpfw.sqlstorage.include_deleted", False
+        )
+        for i in range(0, len(items), self.bulk_batch_size):
+            batch = items[i : i + self.bulk_batch_size]
+            models = self._get_many(
+                collection,
+                getattr(self.orm_model, idfield),
+                [identifier for identifier, data in batch],
+                include_deleted=include_deleted,
+            )
+            for (identifier, data), m in zip(batch, models):
+                if m is None:
+                    raise ValueError(identifier)
+                for k, v in data.items():
+                    if m.data.get(k, None) != v:
+                        m.data[k] = v
+            # rows with the same changed columns are updated with executemany
+            self.session.flush()
+
+    def bulk_delete(self, collection, models, **kwargs):
+        permanent = kwargs.get("permanent", False)
+        now = datetime.now(tz=pytz.UTC)
+        for m in models:
+            if permanent:
+                self.session.delete(m.data.data)
+            else:
+                m.data["deleted"] = now
+        self.session.flush()
+
     def delete(self, identifier, model, **kwargs):
         permanent = kwargs.get("permanent", False)
         if permanent:
@@ -303,19 +482,78 @@ class SQLStorage(BaseStorage):
         d = self.app.get_dataprovider(self.model.schema, r, self)
         d["deleted"] = datetime.now(tz=pytz.UTC)
 
-    def vacuum(self):
-        affected = select([func.count(self.orm_model.__table__.c.uuid)]).where(
-            self.orm_model.deleted.isnot(None)
-        )
-        delete_q = self.orm_model.__table__.delete().where(
-            self.orm_model.deleted.isnot(None)
-        )
-        items = self.session.execute(affected)
-        total = items.fetchone()[0]
-        self.session.execute(delete_q)
-        mark_changed(self.session())
+    def vacuum(self, older_than=None):
+        total = 0
+        for count in self.iter_vacuum(older_than=older_than):
+            total += count
         return total
 
+    def vacuum_count(self, older_than=None):
+        """Number of rows which would be removed by vacuum"""
+        table = self.orm_model.__table__
+        q = select([func.count(table.c.id)]).where(self._vacuum_condition(older_than))
+        return self.session.execute(q).scalar()
+
+    def iter_vacuum(self, batch_size=None, older_than=None, sleep=None, dry_run=False):
+        """Permanently remove soft deleted rows.
+
+        Rows are removed in chunks of ``batch_size`` in ``id`` order, the
+        number of rows removed is yielded after each chunk so that callers
+        can report progress and commit between chunks. ``older_than`` is a
+        ``timedelta`` which restricts vacuum to rows deleted before that
+        retention window. Blobs referenced by removed rows are deleted from
+        the blob storage"""
+        batch_size = batch_size or self.vacuum_batch_size
+        if sleep is None:
+            sleep = self.vacuum_sleep
+        table = self.orm_model.__table__
+        columns = [table.c.id]
+        if "blobs" in table.c:
+            columns.append(table.c.blobs)
+        condition = self._vacuum_condition(older_than)
+        last_id = None
+        while True:
+            q = select(columns).where(condition)
+            if last_id is not None:
+                q = q.where(table.c.id > last_id)
+            rows = self.session.execute(
+                q.order_by(table.c.id).limit(batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            ids = [r[0] for r in rows]
+            last_id = ids[-1]
+            if not dry_run:
+                self._vacuum_rows(ids)
+                mark_changed(self.session())
+                if len(columns) > 1:
+                    self._vacuum_blobs([r[1] for r in rows])
+            yield len(ids)
+            if len(rows) < batch_size:
+                break
+            if sleep:
+                time.sleep(sleep)
+
+    def _vacuum_condition(self, older_than=None):
+        table = self.orm_model.__table__
+        condition = table.c.deleted.isnot(None)
+        if older_than is not None:
+            cutoff = datetime.now(tz=pytz.UTC) - older_than
+            condition = sa.and_(condition, table.c.deleted < cutoff)
+        return condition
+
+    def _vacuum_rows(self, ids):
+        table = self.orm_model.__table__
+        self.session.execute(table.delete().where(table.c.id.in_(ids)))
+
+    def _vacuum_blobs(self, blobs):
+        if self.blobstorage is None or isinstance(self.blobstorage, NullBlobStorage):
+            return
+        for row_blobs in blobs:
+            for blob_uuid in (row_blobs or {}).values():
+                if blob_uuid:
+                    self.blobstorage.delete(blob_uuid)
+
 
 GUID = sautils.UUIDType
 
@@ -344,5 +582,41 @@ class BaseMixin(MappedTable):
     blobs = sa.Column(sajson.JSONField)
     xattrs = sa.Column(sajson.JSONField)
 
+    __indexes__ = [Index("created", "id", live=True)]
+
+
+def create_indexes(table, indexes):
+    """Attach ``__indexes__`` declarations to ``table``"""
+    existing = set(i.name for i in table.indexes)
+    for spec in indexes:
+        name = spec.index_name(table.name)
+        if name in existing:
+            continue
+        columns = []
+        for field in spec.fields:
+            column = table.c[field]
+            if spec.using == "gin" and isinstance(
+                column.type, (sa.JSON, sajson.JSONField)
+            ):
+                column = sa.cast(column, JSONB)
+            columns.append(column)
+        kwargs = {"unique": spec.unique}
+        if spec.using:
+            kwargs["postgresql_using"] = spec.using
+        if spec.ops:
+            kwargs["postgresql_ops"] = dict((f, spec.ops) for f in spec.fields)
+        if spec.live:
+            kwargs["postgresql_where"] = table.c.deleted.is_(None)
+            kwargs["sqlite_where"] = table.c.deleted.is_(None)
+        sa.Index(name, *columns, **kwargs)
+        existing.add(name)
+
 
 Base = declarative_base(cls=BaseMixin)
+
+
+@sa.event.listens_for(Base, "instrument_class", propagate=True)
+def _create_model_indexes(mapper, cls):
+    table = getattr(cls, "__table__", None)
+    if table is not None:
+        create_indexes(table, getattr(cls, "__indexes__", []))
@@ -3,11 +3,12 @@ from uuid import uuid4
 
 import pytz
 
+from ..memoizer import memoize
 from . import model, signals
 from .app import App
 
 
-@App.subscribe(signal=signals.OBJECT_CREATED, model=model.Model)
+@App.subscribe(signal=signals.OBJECT_BEFORE_CREATE, model=model.Model)
 def set_uuid(app, request, obj, signal):
     uuid_field = app.get_uuidfield(obj.schema)
     if uuid_field in obj.schema.__dataclass_fields__.keys():
@@ -15,7 +16,7 @@ def set_uuid(app, request, obj, signal):
             obj.data[uuid_field] = uuid4().hex
 
 
-@App.subscribe(signal=signals.OBJECT_CREATED, model=model.Model)
+@App.subscribe(signal=signals.OBJECT_BEFORE_CREATE, model=model.Model)
 def set_created(app, request, obj, signal):
     if "created" in obj.schema.__dataclass_fields__.keys():
         now = datetime.now(tz=pytz.UTC)
@@ -23,7 +24,7 @@ def set_created(app, request, obj, signal):
         obj.data["modified"] = now
 
 
-@App.subscribe(signal=signals.OBJECT_CREATED, model=model.Model)
+@App.subscribe(signal=signals.OBJECT_BEFORE_CREATE, model=model.Model)
 def set_creator(app, request, obj, signal):
     if "creator" in obj.schema.__dataclass_fields__.keys():
         obj.data["creator"] = request.identity.userid or None
@@ -33,3 +34,10 @@ def set_creator(app, request, obj, signal):
 def set_modified(app, request, obj, signal):
     if "modified" in obj.schema.__dataclass_fields__.keys():
         obj.data["modified"] = datetime.now(tz=pytz.UTC)
+
+
+@App.subscribe(signal=signals.OBJECT_CREATED, model=model.Model)
+@App.subscribe(signal=signals.OBJECT_UPDATED, model=model.Model)
+@App.subscribe(signal=signals.OBJECT_TOBEDELETED, model=model.Model)
+def invalidate_memoize(app, request, obj, signal):
+    memoize.invalidate(obj)
@@ -1,39 +1,120 @@
+import threading
 
 import reg
 
 
-class TypeRegistry(object):
+class TypeInfo(dict):
+    """Type information bound to a request.
+
+    The dictionary content is the static part returned by the typeinfo
+    factory, which is computed once per committed app and shared across
+    requests. The request dependent parts (``collection`` instance and
+    ``storage``) are only constructed when accessed.
+    """
+
+    def __init__(self, static, request):
+        super().__init__(static)
+        self.request = request
+        self._collection = None
+        self._storage = None
+
+    @property
+    def name(self):
+        return self["name"]
+
+    def get_collection(self):
+        if self._collection is None:
+            self._collection = self.request.get_collection(self["name"])
+        return self._collection
+
+    def get_storage(self):
+        if self._collection is not None:
+            return self._collection.storage
+        if self._storage is None:
+            try:
+                self._storage = self.request.app.get_storage(
+                    self["model"], self.request
+                )
+            except NotImplementedError:
+                # storage is bound by the collection factory
+                return self.get_collection().storage
+        return self._storage
 
+
+class TypeRegistry(object):
     def __init__(self):
         self.types = []
         self.schema_name = {}
+        self._static = {}
+        self._schema_index = {}
+        self._lock = threading.Lock()
 
     def register_type(self, name, schema):
         if name not in self.types:
             self.types.append(name)
         self.schema_name[schema] = name
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._static.clear()
+            self._schema_index.clear()
+
+    def get_static_typeinfo(self, name, request):
+        """Return the request independent typeinfo of ``name``.
+
+        Typeinfo factories are executed once per registry, the result is
+        reused for every subsequent request"""
+        result = self._static.get(name, None)
+        if result is not None:
+            return result
+
+        if name not in self.types:
+            raise KeyError("No type info registered for %s" % name)
 
-    def get_typeinfo(self, name, request):
         try:
             factory = request.app.get_typeinfo_factory(name)
         except NotImplementedError:
             factory = None
 
         if factory is None:
-            raise KeyError('No type info registered for %s' % name)
+            raise KeyError("No type info registered for %s" % name)
 
-        result = factory(request)  # self.typeinfo_factories[name](request)
-        result['name'] = name
+        result = dict(factory(request))
+        result["name"] = name
+        with self._lock:
+            self._static.setdefault(name, result)
         return result
 
+    def get_typeinfo(self, name, request):
+        return TypeInfo(self.get_static_typeinfo(name, request), request)
+
     def get_typeinfos(self, request):
         res = {}
         for k in self.types:
             res[k] = self.get_typeinfo(k, request)
         return res
 
-    def get_typeinfo_by_schema(self, schema, request):
+    def get_name_by_schema(self, schema):
+        """Return the type name registered for ``schema``, or for its nearest
+        registered base class. Returns ``None`` if nothing matches"""
+        try:
+            return self._schema_index[schema]
+        except KeyError:
+            pass
+
         name = self.schema_name.get(schema, None)
         if name is None:
-            raise KeyError('No type info registered for %s' % schema)
+            for base in getattr(schema, "__mro__", ())[1:]:
+                name = self.schema_name.get(base, None)
+                if name is not None:
+                    break
+        with self._lock:
+            self._schema_index[schema] = name
+        return name
+
+    def get_typeinfo_by_schema(self, schema, request):
+        name = self.get_name_by_schema(schema)
+        if name is None:
+            raise KeyError("No type info registered for %s" % schema)
         return self.get_typeinfo(name, request)
@@ -1,3 +1,5 @@
+import csv
+import io
 import json
 import logging
 import os
@@ -5,13 +7,17 @@ import sys
 import traceback
 from urllib.parse import urlencode
 
+import transaction
 from jsonpath_ng import parse as jsonpath_parse
 from morepath.request import Request
 from transitions import MachineError
+from webob import Response
 from webob.exc import HTTPForbidden, HTTPInternalServerError, HTTPNotFound
 
+from ..memoizer import requestmemoize
 from . import permission
 from .app import App
+from .cursor import Cursor
 from .errors import (
     AlreadyExistsError,
     FieldValidationError,
@@ -85,24 +91,54 @@ def search(context, request):
     offset = int(request.GET.get("offset", 0))
     order_by = request.GET.get("order_by", None)
     select = request.GET.get("select", None)
+    include = request.GET.get("include", "").strip()
+    include = [i.strip() for i in include.split(",") if i.strip()]
     if order_by:
         order_by = order_by.split(":")
         if len(order_by) == 1:
             order_by = order_by + ["asc"]
+    # paginate with keyset cursor unless client explicitly asked for offset
+    cursor = None
+    if "offset" not in request.GET:
+        token = request.GET.get("cursor", None)
+        if token:
+            cursor = context.validate_cursor(Cursor.decode(token))
+            order_by = list(cursor.order_by)
+        else:
+            cursor = context.start_cursor(order_by)
     # HACK: +1 to ensure next page links is triggered
     searchlimit = limit
     if limit:
         searchlimit = limit + 1
-    objs = context.search(
-        query, offset=offset, limit=searchlimit, order_by=order_by, secure=True
+    models = context.search(
+        query,
+        offset=offset,
+        limit=searchlimit,
+        order_by=order_by,
+        secure=True,
+        cursor=cursor,
     )
     # and limit back to actual limit
-    objs = [obj.json() for obj in objs]
     has_next = False
-    if limit:
-        if len(objs) > limit:
+    has_previous = offset > 0
+    if cursor is not None:
+        has_previous = not cursor.is_start
+    if limit and len(models) > limit:
+        if cursor is not None and cursor.direction == "previous":
+            # backward scans overflow at the start of the page
+            models = models[-limit:]
+            has_previous = True
+        else:
+            models = models[:limit]
             has_next = True
-        objs = objs[:limit]
+    if cursor is not None and cursor.direction == "previous":
+        has_next = True
+    if include:
+        context.prefetch(models, include)
+    objs = [obj.json() for obj in models]
+    if include and not select:
+        for model, obj in zip(models, objs):
+            obj["included"] = _included_json(request, model, include)
     if select:
         expr = jsonpath_parse(select)
         results = []
@@ -111,14 +147,16 @@ def search(context, request):
     else:
         results = objs
     params = {}
+    if query:
+        params["q"] = qs
     if select:
         params["select"] = select
     if limit:
         params["limit"] = limit
-    if order_by:
+    if order_by and cursor is None:
         params["order_by"] = request.GET.get("order_by", "")
-    params["offset"] = offset + (limit or 0)
-    qs = urlencode(params)
+    if include:
+        params["include"] = ",".join(include)
     res = {
         "results": results,
         "q": query,
@@ -127,24 +165,138 @@ def search(context, request):
         "offset": offset,
         "result_count": len(results),
     }
+    if cursor is not None:
+        if models:
+            next_cursor = context.get_cursor(models[-1], cursor.order_by, "next")
+            prev_cursor = context.get_cursor(models[0], cursor.order_by, "previous")
+        else:
+            # empty page, link back to where we came from
+            next_cursor = prev_cursor = Cursor(
+                cursor.order_by,
+                cursor.key_field,
+                value=cursor.value,
+                key=cursor.key,
+                direction="next" if cursor.direction == "previous" else "previous",
+            )
+            has_next = has_next and cursor.direction == "previous"
+            has_previous = has_previous and cursor.direction == "next"
+        next_params = dict(params, cursor=next_cursor.encode())
+        prev_params = dict(params, cursor=prev_cursor.encode())
+    else:
+        next_params = dict(params, offset=offset + (limit or 0))
+        prev_params = dict(params, offset=max(offset - (limit or 0), 0))
     if has_next:
         res.setdefault("links", [])
         res["links"].append(
-            {"rel": "next", "href": request.link(context, "+search?%s" % qs)}
+            {
+                "rel": "next",
+                "href": request.link(context, "+search?%s" % urlencode(next_params)),
+            }
         )
-    if offset > 0:
-        prev_offset = offset - (limit or 0)
-        if prev_offset < 0:
-            prev_offset = 0
-        params["offset"] = prev_offset
-        qs = urlencode(params)
+    if has_previous:
         res.setdefault("links", [])
         res["links"].append(
-            {"rel": "previous", "href": request.link(context, "+search?%s" % qs)}
+            {
+                "rel": "previous",
+                "href": request.link(context, "+search?%s" % urlencode(prev_params)),
+            }
         )
     return res
 
 
+@App.view(model=Collection, name="export", permission=permission.Search)
+def export(context, request):
+    if not context.search_view_enabled or not context.export_view_enabled:
+        raise HTTPNotFound()
+
+    qs = request.GET.get("q", "").strip()
+    query = None
+    if qs:
+        searchprovider = context.searchprovider()
+        query = searchprovider.parse_query(qs)
+    order_by = request.GET.get("order_by", None)
+    if order_by:
+        order_by = order_by.split(":")
+        if len(order_by) == 1:
+            order_by = order_by + ["asc"]
+    select = request.GET.get("select", None)
+    expr = jsonpath_parse(select) if select else None
+    fmt = request.GET.get("format", "ndjson")
+    if fmt not in ["ndjson", "csv"]:
+        raise UnprocessableError("Unsupported export format %s" % fmt)
+
+    def rows():
+        # exported objects are not looked up again, reset the request cache
+        # after each of them so that it does not grow with the export
+        environ_key = requestmemoize.environ_key
+        cached = dict(request.environ.get(environ_key, None) or {})
+        for obj in context.iter_search(query, order_by=order_by, secure=True):
+            if expr:
+                row = [match.value for match in expr.find(obj.json()["data"])]
+            elif fmt == "csv":
+                row = obj.json()["data"]
+            else:
+                row = obj.json()
+            request.environ[environ_key] = dict(cached)
+            yield row
+
+    def ndjson():
+        for row in rows():
+            yield (json.dumps(row) + "\n").encode("utf8")
+
+    def csvlines():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        header = None
+        for row in rows():
+            if isinstance(row, dict):
+                if header is None:
+                    header = list(row.keys())
+                    writer.writerow(header)
+                row = [row.get(k, None) for k in header]
+            writer.writerow(
+                [json.dumps(v) if isinstance(v, (dict, list)) else v for v in row]
+            )
+            yield buf.getvalue().encode("utf8")
+            buf.seek(0)
+            buf.truncate()
+
+    def app_iter(lines):
+        # the response is iterated after the request transaction has ended,
+        # so read within a transaction of its own
+        with transaction.manager:
+            yield from lines
+
+    if fmt == "csv":
+        return Response(
+            app_iter=app_iter(csvlines()), content_type="text/csv", charset="utf8"
+        )
+    return Response(
+        app_iter=app_iter(ndjson()), content_type="application/x-ndjson", charset="utf8"
+    )
+
+
+def _included_json(request, model, include):
+    result = {}
+    refs = model.references()
+    brefs = model.backreferences()
+    for name in include:
+        if name in refs:
+            item = model.resolve_reference(refs[name])
+            if item is not None and request.app.permits(request, item, permission.View):
+                result[name] = item.json()
+            else:
+                result[name] = None
+        else:
+            items = model.resolve_backreference(brefs[name])
+            result[name] = [
+                item.json()
+                for item in items
+                if request.app.permits(request, item, permission.View)
+            ]
+    return result
+
+
 @App.json(model=Collection, request_method="POST", permission=permission.Create)
 def create(context, request):
     if not context.create_view_enabled:
@@ -153,6 +305,46 @@ def create(context, request):
     return obj.json()
 
 
+@App.json(
+    model=Collection, name="bulk", request_method="POST", permission=permission.Create
+)
+def bulk(context, request):
+    if not context.bulk_view_enabled:
+        raise HTTPNotFound()
+
+    data = request.json
+    create_items = data.get("create", [])
+    update_items = data.get("update", [])
+    delete_items = data.get("delete", [])
+    if create_items and not context.create_view_enabled:
+        raise HTTPNotFound()
+
+    updates = [(i["identifier"], i["data"]) for i in update_items]
+    for obj in context.get_many([identifier for identifier, d in updates]):
+        if obj is None:
+            continue
+        if not obj.update_view_enabled:
+            raise HTTPNotFound()
+        if not request.app.permits(request, obj, permission.Edit):
+            raise HTTPForbidden()
+    objs = [o for o in context.get_many(delete_items) if o is not None]
+    for obj in objs:
+        if not obj.delete_view_enabled:
+            raise HTTPNotFound()
+        if not request.app.permits(request, obj, permission.Delete):
+            raise HTTPForbidden()
+
+    created = context.bulk_create(create_items, secure=True)
+    updated = context.bulk_update(updates, secure=True)
+    deleted = context.bulk_delete([o.identifier for o in objs])
+    return {
+        "status": "success",
+        "created": [o.json() for o in created],
+        "updated": [o.json() for o in updated],
+        "deleted": [o.identifier for o in deleted],
+    }
+
+
 @get_data.register(model=Model, request=Request)
 def get_obj_data(model, request):
     data = model.json()["data"]
@@ -379,6 +379,8 @@ class ICollection(abc.ABC):
         limit: Optional[int] = None,
         order_by: Optional[tuple] = None,
         secure: bool = False,
+        include: Optional[list] = None,
+        cursor: Union[None, str, "Cursor"] = None,
     ) -> List[IModel]:
         """Search for models
 
@@ -392,6 +394,10 @@ class ICollection(abc.ABC):
                          ``'asc'`` or ``'desc'``
         : param secure: When set to True, this will filter out any object which
                        current logged in user is not allowed to see
+        : param include: List of reference and backreference names to prefetch
+        : param cursor: Keyset pagination cursor (or its encoded token). When
+                       set, ``offset`` and ``order_by`` are ignored and
+                       results continue after the cursor position
 
         : todo: ``order_by`` need to allow multiple field ordering
         """
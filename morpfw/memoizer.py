@@ -1,63 +1,451 @@
+import hashlib
 import inspect
+import logging
+import os
+import pickle
+import tempfile
 import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from uuid import uuid4
 
 import pytz
+import redis
+import transaction
 
 from .interfaces import ICollection, IModel
 
-threadlocal = threading.local()
+logger = logging.getLogger("morpfw.memoizer")
+
+
+class UnhashableArgumentError(TypeError):
+    """Raised when memoized method arguments can not be turned into a key"""
+
+
+class _Mapping(object):
+    """Marks canonicalized mappings in cache keys"""
+
+
+class _Set(object):
+    """Marks canonicalized sets in cache keys"""
+
+
+def canonical(value):
+    """
+    Convert ``value`` into a hashable structure which compares equal for
+    equal values, eg: ``rulez`` condition dicts and lists. Lists and tuples
+    are equivalent. Raises :class:`UnhashableArgumentError` for other
+    unhashable values.
+    """
+    if isinstance(value, dict):
+        items = [(canonical(k), canonical(v)) for k, v in value.items()]
+        return (_Mapping, tuple(sorted(items, key=repr)))
+    if isinstance(value, (list, tuple)):
+        return tuple([canonical(v) for v in value])
+    if isinstance(value, (set, frozenset)):
+        return (_Set, tuple(sorted([canonical(v) for v in value], key=repr)))
+    try:
+        hash(value)
+    except TypeError:
+        raise UnhashableArgumentError(
+            "Unable to memoize argument of type %s" % type(value)
+        )
+    return value
+
+
+_signatures: dict = {}
+
+
+def _arguments(method, args, kwargs):
+    # bind to the signature so that positional and keyword calls, and calls
+    # relying on defaults, share the same key
+    signature = _signatures.get(method, None)
+    if signature is None:
+        signature = inspect.signature(method)
+        _signatures[method] = signature
+    bound = signature.bind(None, *args, **kwargs)
+    bound.apply_defaults()
+    return tuple([(k, canonical(v)) for k, v in list(bound.arguments.items())[1:]])
+
+
+def _cache_key(obj, method, args, kwargs=None):
+    arguments = _arguments(method, args, kwargs or {})
+    if isinstance(obj, IModel):
+        return (obj.__class__, method, obj.uuid, arguments)
+    elif isinstance(obj, ICollection):
+        return (obj.__class__, method, arguments)
+    raise AssertionError(
+        "Memoization is only supported on IModel and ICollection instances"
+    )
+
+
+def _qualname(obj):
+    return "%s.%s" % (obj.__module__, obj.__qualname__)
+
+
+def _shared_cache_key(obj, method, args, kwargs=None):
+    # shared backends are accessed from several processes, so the key can not
+    # rely on hash() which is randomized per process
+    arguments = _arguments(method, args, kwargs or {})
+    parts = [_qualname(obj.request.app.__class__), _qualname(obj.__class__)]
+    if isinstance(obj, IModel):
+        parts += [method.__name__, obj.uuid, repr(arguments)]
+    elif isinstance(obj, ICollection):
+        parts += [method.__name__, repr(arguments)]
+    else:
+        raise AssertionError(
+            "Memoization is only supported on IModel and ICollection instances"
+        )
+    return "morpfw.memoize:" + ":".join([str(p) for p in parts])
+
+
+_stats: dict = {}
+_stats_lock = threading.Lock()
+
+
+def _method_name(method):
+    return _qualname(inspect.unwrap(method))
+
+
+def _record(name, counter, count=1):
+    with _stats_lock:
+        stats = _stats.get(name, None)
+        if stats is None:
+            stats = {"hits": 0, "misses": 0, "evictions": 0}
+            _stats[name] = stats
+        stats[counter] += count
+
+
+def stats():
+    """
+    Return memoization counters per method, as
+    ``{"module.Class.method": {"hits": .., "misses": .., "evictions": ..}}``.
+    Evictions count cached results dropped because they were stale,
+    invalidated by a write, or removed to make space.
+    """
+    with _stats_lock:
+        return {k: dict(v) for k, v in _stats.items()}
+
+
+def reset_stats():
+    """Reset memoization counters"""
+    with _stats_lock:
+        _stats.clear()
+
+
+def _version_key(obj, model=True):
+    parts = [_qualname(obj.request.app.__class__), _qualname(obj.schema)]
+    if model and isinstance(obj, IModel):
+        parts.append(obj.uuid)
+    return "morpfw.memoize.version:" + ":".join([str(p) for p in parts])
+
+
+class MemoizeBackend(object):
+    """
+    Storage for :class:`ModelMemoizer` results. Backends store values with
+    an expiry time and are shared by all requests of an application.
+    """
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def version(self, key):
+        """Return the current version token of ``key``, creating one if it
+        does not exist or has been evicted"""
+        version = self.get(key)
+        if version is None:
+            version = self.bump(key)
+        return version
+
+    def bump(self, key):
+        """Replace version token of ``key``, invalidating results cached with
+        the previous token"""
+        version = uuid4().hex
+        self.set(key, version)
+        return version
+
+
+class LRUBackend(MemoizeBackend):
+    """In-process backend which keeps up to ``maxsize`` entries"""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, None)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                key, (value, expires) = self._data.popitem(last=False)
+                if isinstance(value, dict) and "method" in value:
+                    _record(value["method"], "evictions")
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileBackend(MemoizeBackend):
+    """
+    Backend storing pickled entries as files in ``path``, shared by all
+    worker processes on the host. Point ``path`` to a tmpfs such as
+    ``/dev/shm`` to keep entries in shared memory. When there are more than
+    ``maxsize`` files, the least recently written ones are removed.
+    """
+
+    def __init__(self, path=None, maxsize=10000):
+        self.path = path or os.path.join(tempfile.gettempdir(), "morpfw-memoize")
+        self.maxsize = maxsize
+        self._writes = 0
+        os.makedirs(self.path, exist_ok=True)
+
+    def _filename(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode("utf8")).hexdigest())
+
+    def get(self, key, default=None):
+        try:
+            with open(self._filename(key), "rb") as f:
+                stored_key, value, expires = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        if stored_key != key:
+            return default
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        try:
+            data = pickle.dumps((key, value, expires))
+        except Exception:
+            logger.debug("Unable to pickle memoized value of %s" % key)
+            return
+        fd, tmpname = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmpname, self._filename(key))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+
+    def delete(self, key):
+        try:
+            os.unlink(self._filename(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+
+    def prune(self):
+        """Remove least recently written files above ``maxsize``"""
+        entries = []
+        for entry in os.scandir(self.path):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+        if len(entries) <= self.maxsize:
+            return
+        entries.sort()
+        for mtime, path in entries[: len(entries) - self.maxsize]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+class RedisBackend(MemoizeBackend):
+    """
+    Backend storing pickled entries in Redis, or any client implementing
+    ``get``, ``set(key, value, ex=None)`` and ``delete``.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", client=None, prefix=""):
+        if client is None:
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key, default=None):
+        data = self.client.get(self.prefix + key)
+        if data is None:
+            return default
+        return pickle.loads(data)
+
+    def set(self, key, value, ttl=None):
+        try:
+            data = pickle.dumps(value)
+        except Exception:
+            logger.debug("Unable to pickle memoized value of %s" % key)
+            return
+        self.client.set(self.prefix + key, data, ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = self.client.keys(self.prefix + "morpfw.memoize*")
+        if keys:
+            self.client.delete(*keys)
+
+
+BACKENDS = {"lru": LRUBackend, "file": FileBackend, "redis": RedisBackend}
+
+_backends: dict = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(app) -> MemoizeBackend:
+    """
+    Return memoize backend of ``app`` configured through
+    ``morpfw.memoize.backend``, eg: ``{"type": "file", "path": "/dev/shm/x"}``
+    """
+    key = app.__class__
+    backend = _backends.get(key, None)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(key, None)
+            if backend is None:
+                opts = dict(app.get_config("morpfw.memoize.backend", None) or {})
+                factory = BACKENDS[opts.pop("type", "lru")]
+                opts.pop("ttl", None)
+                backend = factory(**opts)
+                _backends[key] = backend
+    return backend
+
+
+def clear_backends():
+    """Forget configured backends, eg: when application configuration changes"""
+    with _backends_lock:
+        _backends.clear()
+
+
+def _nomemoize(request):
+    if request.environ.get("morpfw.nomemoize", False):
+        return True
+    if request.headers.get("X-MORP-NOMEMOIZE", None) is not None:
+        return True
+    return False
 
 
 class ModelMemoizer(object):
+    """
+    Memoize results of model and collection methods across requests in the
+    application memoize backend, for ``seconds`` or the backend ``ttl``
+    (default 300 seconds).
+
+    Results of a model are dropped when the model is updated or deleted, and
+    results of a collection when any object of its type is created, updated
+    or deleted, see :meth:`invalidate`.
+    """
+
     def __init__(self, seconds: int = None):
         self.seconds = seconds
 
     def __call__(self, method):
         seconds = self.seconds
+        name = _method_name(method)
 
-        def MemoizeWrapper(self, *args):
-            klass = self.__class__
-            nomemoize = self.request.environ.get("morpfw.nomemoize", False)
-            if nomemoize:
-                return method(self, *args)
-            nomemoize = self.request.headers.get("X-MORP-NOMEMOIZE", None)
-            if nomemoize is not None:
-                return method(self, *args)
-            if getattr(klass, "__memoize__", None) is None:
-
-                memoizer = getattr(threadlocal, "mfw_classmemoize", None)
-                if memoizer is None:
-                    memoizer = {}
-                    threadlocal.mfw_classmemoize = memoizer
-                klass.__memoize__ = memoizer
-            cachemgr = klass.__memoize__
-            if isinstance(self, IModel):
-                key = hash((self.__class__, method, self.uuid, args))
-            elif isinstance(self, ICollection):
-                key = hash((self.__class__, method, args))
-            else:
-                raise AssertionError(
-                    "Memoization is only supported on IModel and ICollection instances"
-                )
-            cache = cachemgr.get(key, None)
+        def MemoizeWrapper(self, *args, **kwargs):
+            request = self.request
+            if _nomemoize(request):
+                return method(self, *args, **kwargs)
+            try:
+                key = _shared_cache_key(self, method, args, kwargs)
+            except UnhashableArgumentError:
+                return method(self, *args, **kwargs)
+            backend = get_backend(request.app)
+            ttl = seconds
+            if ttl is None:
+                opts = request.app.get_config("morpfw.memoize.backend", None) or {}
+                ttl = opts.get("ttl", 300)
+            version = backend.version(_version_key(self))
+            cache = backend.get(key)
             if cache:
-                if isinstance(self, IModel) and cache["modified"] >= self["modified"]:
+                if cache["version"] == version and (
+                    not isinstance(self, IModel)
+                    or cache["modified"] >= self["modified"]
+                ):
+                    _record(name, "hits")
                     return cache["result"]
+                _record(name, "evictions")
 
-                if seconds:
-                    if cache["modified"] >= (
-                        datetime.now(tz=pytz.UTC) + timedelta(seconds=seconds)
-                    ):
-                        return cache["result"]
-
-            result = method(self, *args)
-            cachemgr[key] = {"result": result, "modified": datetime.now(tz=pytz.UTC)}
+            _record(name, "misses")
+            result = method(self, *args, **kwargs)
+            backend.set(
+                key,
+                {
+                    "result": result,
+                    "modified": datetime.now(tz=pytz.UTC),
+                    "version": version,
+                    "method": name,
+                },
+                ttl=ttl,
+            )
             return result
 
         MemoizeWrapper.__wrapped__ = method
         return MemoizeWrapper
 
+    @classmethod
+    def invalidate(cls, obj):
+        """
+        Drop memoized results of model ``obj`` and of collections of its
+        type. Results are dropped again after the transaction commits, so
+        that other requests do not keep results computed from data read
+        before the commit.
+        """
+        backend = get_backend(obj.request.app)
+        keys = [_version_key(obj, model=False)]
+        if isinstance(obj, IModel):
+            keys.append(_version_key(obj))
+
+        def bump():
+            for key in keys:
+                backend.bump(key)
+
+        bump()
+        transaction.get().addAfterCommitHook(lambda success: success and bump())
+
 
 class ModelRequestMemoizer(object):
 
@@ -69,42 +457,73 @@ class ModelRequestMemoizer(object):
     def __call__(self, method):
         environ_key = self.environ_key
         seconds = self.seconds
+        name = _method_name(method)
 
-        def RequestMemoizeWrapper(self, *args):
-            nomemoize = self.request.environ.get("morpfw.nomemoize", False)
-            if nomemoize:
-                return method(self, *args)
-            nomemoize = self.request.headers.get("X-MORP-NOMEMOIZE", None)
-            if nomemoize is not None:
-                return method(self, *args)
+        def RequestMemoizeWrapper(self, *args, **kwargs):
+            if _nomemoize(self.request):
+                return method(self, *args, **kwargs)
+            try:
+                key = _cache_key(self, method, args, kwargs)
+            except UnhashableArgumentError:
+                return method(self, *args, **kwargs)
             self.request.environ.setdefault(environ_key, {})
             cachemgr = self.request.environ[environ_key]
-            if isinstance(self, IModel):
-                key = hash((self.__class__, method, self.uuid, args))
-            elif isinstance(self, ICollection):
-                key = hash((self.__class__, method, args))
-            else:
-                raise AssertionError(
-                    "Memoization is only supported on IModel and ICollection instances"
-                )
             cache = cachemgr.get(key, None)
             if cache:
                 if isinstance(self, IModel) and cache["modified"] >= self["modified"]:
+                    _record(name, "hits")
+                    return cache["result"]
+
+                # collection cache lives until the end of the request or
+                # until it is invalidated by a write
+                if isinstance(self, ICollection):
+                    _record(name, "hits")
                     return cache["result"]
 
                 if seconds:
                     if cache["modified"] >= (
-                        datetime.now(tz=pytz.UTC) + timedelta(seconds=seconds)
+                        datetime.now(tz=pytz.UTC) - timedelta(seconds=seconds)
                     ):
+                        _record(name, "hits")
                         return cache["result"]
+                _record(name, "evictions")
 
-            result = method(self, *args)
-            cachemgr[key] = {"result": result, "modified": datetime.now(tz=pytz.UTC)}
+            _record(name, "misses")
+            result = method(self, *args, **kwargs)
+            cachemgr[key] = {
+                "result": result,
+                "modified": datetime.now(tz=pytz.UTC),
+                "method": name,
+            }
             return result
 
         RequestMemoizeWrapper.__wrapped__ = method
         return RequestMemoizeWrapper
 
+    @classmethod
+    def store(cls, request, obj, method, args, result):
+        """Populate request cache as if ``method`` was called with ``args``"""
+        method = getattr(method, "__wrapped__", method)
+        request.environ.setdefault(cls.environ_key, {})
+        cachemgr = request.environ[cls.environ_key]
+        key = _cache_key(obj, method, tuple(args))
+        cachemgr[key] = {
+            "result": result,
+            "modified": datetime.now(tz=pytz.UTC),
+            "method": _method_name(method),
+        }
+
+    @classmethod
+    def invalidate(cls, request):
+        """Drop request cache"""
+        cachemgr = request.environ.get(cls.environ_key, None) or {}
+        evictions: dict = {}
+        for entry in cachemgr.values():
+            evictions[entry["method"]] = evictions.get(entry["method"], 0) + 1
+        for name, count in evictions.items():
+            _record(name, "evictions", count)
+        request.environ[cls.environ_key] = {}
+
 
 memoize = ModelMemoizer
 requestmemoize = ModelRequestMemoizer
@@ -1,7 +1,12 @@
 import importlib
 
+import morepath
+import rulez
+
+from .app import BaseApp
 from .authn.pas import permission as authperm
 from .authn.pas.apikey.model import APIKeyCollection, APIKeyModel
+from .authn.pas.principal import get_principal
 from .authn.pas.user.model import CurrentUserModel, UserCollection, UserModel
 from .authz.pas import DefaultAuthzPolicy
 from .crud import permission as crudperms
@@ -18,20 +23,21 @@ def import_name(name):
 
 
 def eval_config_groupperms(request, model, permission, identity):
-    usercol = request.get_collection("morpfw.pas.user")
-    user = usercol.get_by_userid(identity.userid)
-    if user["is_administrator"]:
+    principal = get_principal(request, identity.userid)
+    if principal is None:
+        return None
+    if principal.is_administrator:
         return True
 
     if isinstance(model, (Collection, Model)):
         config = request.app.get_config("morpfw.authz.type_permissions", {})
         typeinfo = request.app.get_typeinfo_by_schema(model.schema, request)
         type_conf = config.get(typeinfo["name"], {})
-        for g in user.groups():
-            rule_name = type_conf.get(g["groupname"], None)
+        for groupname in principal.groupnames:
+            rule_name = type_conf.get(groupname, None)
             if rule_name:
                 rule_func = request.app.get_authz_rule(rule_name)
-                if rule_func(g["groupname"], identity, model, permission):
+                if rule_func(groupname, identity, model, permission):
                     return True
 
     config = request.app.get_config("morpfw.authz.model_permissions", {})
@@ -46,21 +52,73 @@ def eval_config_groupperms(request, model, permission, identity):
     if not model_conf:
         return
 
-    for g in user.groups():
-        rule_name = model_conf.get(g["groupname"], None)
+    for groupname in principal.groupnames:
+        rule_name = model_conf.get(groupname, None)
         if rule_name:
             rule_func = request.app.get_authz_rule(rule_name)
-            if rule_func(g["groupname"], identity, model, permission):
+            if rule_func(groupname, identity, model, permission):
                 return True
 
     return None
 
 
+def _view_rule(app, model_class):
+    return app._permits.by_predicates(
+        identity=morepath.Identity, obj=model_class, permission=crudperms.View
+    ).component
+
+
+def config_groupperms_search_filter(request, collection, identity):
+    """
+    Combine search filters of authz rules configured for the user groups
+    in ``morpfw.authz.type_permissions``. Returns ``None`` when any rule
+    may grant access without a filter, or when the model has its own
+    ``View`` permission rule, which the configured rules don't describe
+    """
+    if not isinstance(request.app, Policy):
+        return None
+
+    app = request.app
+    if _view_rule(app, collection.storage.model) is not _view_rule(app, Model):
+        return None
+
+    principal = get_principal(request, identity.userid)
+    if principal is None or principal.is_administrator:
+        return None
+
+    config = request.app.get_config("morpfw.authz.model_permissions", {})
+    for model_name in config.keys():
+        if issubclass(collection.storage.model, import_name(model_name)):
+            return None
+
+    config = request.app.get_config("morpfw.authz.type_permissions", {})
+    typeinfo = request.app.get_typeinfo_by_schema(collection.schema, request)
+    type_conf = config.get(typeinfo["name"], {})
+    filters = []
+    for groupname in principal.groupnames:
+        rule_name = type_conf.get(groupname, None)
+        if not rule_name:
+            continue
+        filter_func = request.app.get_authz_rule_filter(rule_name)
+        if filter_func is None:
+            return None
+        condition = filter_func(groupname, identity, collection)
+        if condition is None:
+            return None
+        filters.append(condition)
+
+    if not filters:
+        return None
+    if len(filters) == 1:
+        return filters[0]
+    return rulez.or_(*filters)
+
+
 def currentuser_permission(identity, model, permission):
-    request = model.request
-    usercol = request.get_collection("morpfw.pas.user")
-    user = usercol.get_by_userid(identity.userid)
-    if user["is_administrator"]:
+    principal = get_principal(model.request, identity.userid)
+    if principal is None:
+        return False
+    if principal.is_administrator:
         return True
     userid = identity.userid
     if isinstance(model, UserModel):
@@ -85,10 +143,8 @@ def allow_user_crud(identity, model, permission):
 
 @Policy.permission_rule(model=UserModel, permission=authperm.ChangePassword)
 def allow_change_all_user_password(identity, model, permission):
-    request = model.request
-    usercol = request.get_collection("morpfw.pas.user")
-    user = usercol.get_by_userid(identity.userid)
-    if user["is_administrator"]:
+    principal = get_principal(model.request, identity.userid)
+    if principal is not None and principal.is_administrator:
         return True
     return False
 
@@ -100,10 +156,7 @@ def allow_change_self_password(identity, model, permission):
 
 @Policy.permission_rule(model=APIKeyCollection, permission=crudperms.All)
 def allow_apikeycollection_management(identity, model, permission):
-    request = model.request
-    usercol = request.get_collection("morpfw.pas.user")
-    user = usercol.get_by_userid(identity.userid)
-    if user:
+    if get_principal(model.request, identity.userid) is not None:
         return True
     return False
 
@@ -122,3 +175,18 @@ def collection_permission(identity, model, permission):
 def model_permission(identity, model, permission):
     return eval_config_groupperms(model.request, model, permission, identity)
 
+
+@BaseApp.search_filter(model=Collection)
+def collection_search_filter(context, identity):
+    return config_groupperms_search_filter(context.request, context, identity)
+
+
+@BaseApp.search_filter(model=UserCollection)
+def usercollection_search_filter(context, identity):
+    # users can always see themselves, see allow_user_crud
+    return None
+
+
+@BaseApp.search_filter(model=APIKeyCollection)
+def apikeycollection_search_filter(context, identity):
+    return None
@@ -18,6 +18,8 @@ from morepath.publish import resolve_model
 from morepath.request import SAME_APP, LinkError
 from morepath.request import Request as BaseRequest
 from morepath.traject import parse_path
+from sqlalchemy import event
+from sqlalchemy import exc as saexc
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.pool import NullPool, QueuePool
 from zope.sqlalchemy import ZopeTransactionEvents
@@ -29,6 +31,49 @@ from .exc import ConfigurationError
 
 threadlocal = threading.local()
 
+# engines are shared by all threads of a process, keyed by pid so that
+# a forked child (gunicorn worker, celery prefork worker) never reuses
+# pooled connections inherited from its parent
+_process_db_engines: dict = {}
+_process_db_engines_lock = threading.Lock()
+
+POOL_CLASSES = {"queue": QueuePool, "null": NullPool}
+
+
+def get_process_db_engines() -> dict:
+    return _process_db_engines.setdefault(os.getpid(), {})
+
+
+def dispose_process_db_engines():
+    """Dispose all engines created by the current process"""
+    engines = get_process_db_engines()
+    with _process_db_engines_lock:
+        for name in list(engines.keys()):
+            engines[name].dispose()
+            del engines[name]
+
+
+def _protect_engine_pool(engine):
+    # Connections checked in before a fork must not be used by the child.
+    # Discard them without closing so the parent connection stays intact.
+    # https://docs.sqlalchemy.org/en/13/core/pooling.html#using-connection-pools-with-multiprocessing
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        connection_record.info["pid"] = os.getpid()
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info["pid"] != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise saexc.DisconnectionError(
+                "Connection record belongs to pid %s, "
+                "attempting to check out in pid %s"
+                % (connection_record.info["pid"], pid)
+            )
+
+
 default_settings = open(
     os.path.join(os.path.dirname(__file__), "default_settings.yml")
 ).read()
@@ -96,7 +141,10 @@ class Request(BaseRequest):
         transaction.commit()
         if os.path.exists(self._cm_cwd):
             os.chdir(self._cm_cwd)
-        self.dispose_db_engines()
+        self.release_db_connections()
+
+    def release_db_connections(self):
+        pass
 
     def timezone(self):
         cache_key = "morpfw.cache.timezone"
@@ -196,29 +244,71 @@ class DBSessionRequest(Request):
 
     @property
     def _db_engines(self):
-        engines = getattr(threadlocal, "mfw_db_engines", None)
-        if engines is None:
-            engines = {}
-            threadlocal.mfw_db_engines = engines
-
-        return threadlocal.mfw_db_engines
+        return get_process_db_engines()
 
     @property
     def db_session(self) -> sqlalchemy.orm.Session:
         return self.get_db_session("default")
 
+    def get_db_pool_settings(self, name="default"):
+        settings = self.app._raw_settings
+        config = settings["configuration"]
+        key = "morpfw.storage.sqlstorage.pool"
+        result = {"poolclass": "queue"}
+        result.update(config.get(key, None) or {})
+        if name != "default" and "://" not in name:
+            result.update(config.get("{}.{}".format(key, name), None) or {})
+        return result
+
+    def _get_db_engine_config(self, name="default"):
+        """Return ``(dburl, poolclass, pool_settings)`` of engine ``name``"""
+        config = self.app._raw_settings["configuration"]
+        key = "morpfw.storage.sqlstorage.dburl"
+        if "://" in name:
+            dburl = name
+        else:
+            if name != "default":
+                key = "morpfw.storage.sqlstorage.dburl.{}".format(name)
+
+            if not config.get(key, None):
+                raise ConfigurationError("{} not found".format(key))
+
+            dburl = config[key]
+
+        pool_settings = self.get_db_pool_settings(name)
+        poolclass = pool_settings.pop("poolclass")
+        if poolclass not in POOL_CLASSES:
+            raise ConfigurationError(
+                "Unknown poolclass '{}', expected one of: {}".format(
+                    poolclass, ", ".join(POOL_CLASSES.keys())
+                )
+            )
+        if poolclass == "null":
+            # NullPool does not accept sizing options
+            pool_settings = {}
+        return dburl, poolclass, pool_settings
+
+    def _get_db_engine_key(self, name="default"):
+        # apps of the same process may configure different databases under
+        # the same name, engines are shared only when url and options match
+        dburl, poolclass, pool_settings = self._get_db_engine_config(name)
+        return (str(dburl), poolclass, repr(sorted(pool_settings.items())))
+
     def get_db_engine(self, name="default"):
-        # FIXME: Allow safe pooling, especially on the
-        # worker side. Currently NullPool is used
-        # to force worker to clean up connections
-        # upon completion of tasks
-        existing = self._db_engines.get(name, None)
+        key = self._get_db_engine_key(name)
+        existing = self._db_engines.get(key, None)
         if existing:
             return existing
 
-        settings = self.app._raw_settings
-        config = settings["configuration"]
+        with _process_db_engines_lock:
+            existing = self._db_engines.get(key, None)
+            if existing:
+                return existing
+            engine = self._create_db_engine(name)
+            self._db_engines[key] = engine
+        return engine
 
+    def _create_db_engine(self, name="default"):
         home_env = self.app.home_env
         if home_env not in os.environ:
             if "MORP_WORKDIR" in os.environ:
@@ -231,73 +321,78 @@ class DBSessionRequest(Request):
         cwd = os.environ.get(home_env, os.getcwd())
         os.chdir(cwd)
 
-        key = "morpfw.storage.sqlstorage.dburl"
-        if "://" in name:
-            dburl = name
-        else:
-            if name != "default":
-                key = "morpfw.storage.sqlstorage.dburl.{}".format(name)
-
-            if not config.get(key, None):
-                raise ConfigurationError("{} not found".format(key))
-
-            dburl = config[key]
+        dburl, poolclass, pool_settings = self._get_db_engine_config(name)
         engine = sqlalchemy.create_engine(
-            dburl, poolclass=NullPool, connect_args={"options": "-c timezone=utc"}
+            dburl,
+            poolclass=POOL_CLASSES[poolclass],
+            connect_args={"options": "-c timezone=utc"},
+            **pool_settings
         )
-
-        self._db_engines[name] = engine
+        if poolclass != "null":
+            _protect_engine_pool(engine)
         return engine
 
-    def get_db_session(self, name="default"):
+    def _get_db_session_key(self, name="default"):
+        return (name,) + self._get_db_engine_key(name)
 
-        if self._db_session.get(name, None) is None:
+    def _close_db_sessions(self, keys):
+        for k in keys:
+            self._db_session[k].expunge_all()
+            self._db_session[k].close()
+            del self._db_session[k]
+
+    def get_db_session(self, name="default"):
+        key = self._get_db_session_key(name)
+        if self._db_session.get(key, None) is None:
             engine = self.get_db_engine(name)
             Session = sessionmaker(bind=engine)
             register_session(Session)
-            self._db_session[name] = scoped_session(Session)
-        return self._db_session[name]
+            self._db_session[key] = scoped_session(Session)
+        return self._db_session[key]
 
     def clear_db_session(self, name=None):
         if name:
-            if name in self._db_session.keys():
-                self._db_session[name].expunge_all()
-                self._db_session[name].close()
-                del self._db_session[name]
+            self._close_db_sessions(
+                [k for k in self._db_session.keys() if k[0] == name]
+            )
         else:
-            for k in list(self._db_session.keys()):
-                self._db_session[k].expunge_all()
-                self._db_session[k].close()
-                self._db_session[k] = None
-                del self._db_session[k]
+            self._close_db_sessions(list(self._db_session.keys()))
         self.environ["morpfw.memoize"] = {}  # noqa
 
     def expunge_all(self, name=None):
-        if name:
-            if name in self._db_session.keys():
-                self._db_session[name].expunge_all()
-        else:
-            for k in list(self._db_session.keys()):
+        for k in list(self._db_session.keys()):
+            if not name or k[0] == name:
                 self._db_session[k].expunge_all()
         self.environ["morpfw.memoize"] = {}  # noqa
 
+    def release_db_connections(self):
+        """
+        Return connections held by this thread to their pool.
+
+        Engines configured with ``poolclass: null`` are disposed instead,
+        closing their connections.
+        """
+        for k in list(self._db_session.keys()):
+            if k not in self._db_session:
+                continue
+            if k[2] == "null":
+                self.dispose_db_engines(k[0])
+            else:
+                self._db_session[k].close()
+        self.environ["morpfw.memoize"] = {}  # noqa
+
     def dispose_db_engines(self, name=None):
         if name:
-            if name in self._db_engines.keys():
-                if name in self._db_session.keys():
-                    self._db_session[name].expunge_all()
-                    self._db_session[name].close()
-                    del self._db_session[name]
-                self._db_engines[name].dispose()
-                del self._db_engines[name]
+            keys = [self._get_db_engine_key(name)]
         else:
-            for k in list(self._db_engines.keys()):
-                if k in self._db_session.keys():
-                    self._db_session[k].expunge_all()
-                    self._db_session[k].close()
-                    del self._db_session[k]
-                self._db_engines[k].dispose()
-                del self._db_engines[k]
+            keys = list(self._db_engines.keys())
+        for key in keys:
+            self._close_db_sessions(
+                [k for k in list(self._db_session.keys()) if k[1:] == key]
+            )
+            if key in self._db_engines:
+                self._db_engines[key].dispose()
+                del self._db_engines[key]
         self.environ["morpfw.memoize"] = {}  # noqa
 
 
@@ -18,8 +18,9 @@ from celery.contrib import rdb
 from celery.local import Proxy
 from celery.result import AsyncResult
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown
 
-from ..request import request_factory
+from ..request import dispose_process_db_engines, request_factory
 from . import directive
 from . import signal as event_signal
 
@@ -37,6 +38,11 @@ ALLOWED_ENVIRONMENT_KEYS = [
 ]
 
 
+@worker_process_shutdown.connect
+def dispose_worker_db_engines(**kwargs):
+    dispose_process_db_engines()
+
+
 class MorpTask(Task):
     abstract = True
 
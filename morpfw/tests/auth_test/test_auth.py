@@ -11,6 +11,7 @@ from more.basicauth import BasicAuthIdentityPolicy
 from more.jwtauth import JWTIdentityPolicy
 from morpfw.authn.pas.app import App
 from morpfw.authn.pas.user.model import GroupSchema, UserCollection, UserSchema
+from morpfw.crud.cursor import Cursor
 from morpfw.oauth import OAuthRoot
 from oauthlib.oauth2 import BackendApplicationClient
 from webtest import TestApp as Client
@@ -355,6 +356,12 @@ def _test_authentication(c):
 
     assert len(r.json["results"]) == 0
 
+    # hidden fields can not be used to order cursor pagination
+    cursor = Cursor(("api_secret", "asc"), "uuid", value="a", key=key_uuid)
+    r = c.get("/apikey/+search", {"cursor": cursor.encode()}, expect_errors=True)
+
+    assert r.status_code == 422
+
     logout(c)
 
     # lets try deactivating user1 using API Oauth
@@ -390,6 +397,24 @@ def _test_authentication(c):
 
     assert r.status_code == 200
 
+    # X-API-KEY authenticates as the key owner, repeated requests are
+    # served from the verified key cache
+    for transition in ["deactivate", "activate"]:
+        r = c.post_json(
+            "/user/user1/+statemachine",
+            {"transition": transition},
+            headers=[("X-API-KEY", ".".join([key_identity, key_secret]))],
+        )
+        assert r.status_code == 200
+
+    r = c.post_json(
+        "/user/user1/+statemachine",
+        {"transition": "deactivate"},
+        headers=[("X-API-KEY", ".".join([key_identity, "wrongsecret"]))],
+        expect_errors=True,
+    )
+    assert r.status_code == 403
+
     login(c, "admin")
 
     r = c.get("/group/")
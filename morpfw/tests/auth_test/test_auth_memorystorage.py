@@ -1,14 +1,20 @@
 import os
 
+import morepath
+import rulez
 import yaml
 from more.jwtauth import JWTIdentityPolicy
 from morpfw.app import BaseApp
 from morpfw.authn.pas.app import App
 from morpfw.authn.pas.path import hook_auth_models
 from morpfw.authn.pas.policy import MemoryStorageAuthApp as BaseAuthApp
+from morpfw.authn.pas.principal import Principal
 from morpfw.authz.pas import DefaultAuthzPolicy
+from morpfw.crud import permission as crudperms
+from morpfw.crud.storage.memorystorage import MemoryStorage
 
-from ..common import create_admin, get_client
+from ..common import create_admin, get_client, make_request
+from . import auth_crud
 from .test_auth import _test_authentication
 
 
@@ -20,8 +26,54 @@ MemoryStorageApp.hook_auth_models()
 MemoryStorageApp.hook_oauth_models()
 
 
+class SearchFilterApp(MemoryStorageApp, auth_crud.App):
+    pass
+
+
+class Object1Storage(MemoryStorage):
+    model = auth_crud.Object1Model
+
+
+@SearchFilterApp.storage(model=auth_crud.Object1Model)
+def get_object1_storage(model, request, blobstorage):
+    return Object1Storage(request, blobstorage=blobstorage)
+
+
+class Object2Storage(MemoryStorage):
+    model = auth_crud.Object2Model
+
+
+@SearchFilterApp.storage(model=auth_crud.Object2Model)
+def get_object2_storage(model, request, blobstorage):
+    return Object2Storage(request, blobstorage=blobstorage)
+
+
+@SearchFilterApp.permission_rule(
+    model=auth_crud.Object1Model, permission=crudperms.View
+)
+def allow_object1_view(identity, model, permission):
+    return True
+
+
 def test_authentication_memorystorage():
     config = os.path.join(os.path.dirname(__file__), "settings-memorystorage.yml")
     c = get_client(config)
     create_admin(c.mfw_request, "admin", "password", "admin@localhost.localdomain")
     _test_authentication(c)
+
+
+def test_search_filter_memorystorage():
+    config = os.path.join(os.path.dirname(__file__), "settings-searchfilter.yml")
+    c = get_client(config)
+    request = make_request(c.app)
+    identity = morepath.Identity("user1")
+    principal = Principal("user1", "user1-uuid", False, {"editors": ["member"]})
+    request.environ["morpfw.cache.principal"] = {"user1": principal}
+
+    col = request.get_collection("tests.object2")
+    condition = c.app.get_search_filter(col, identity)
+    assert condition == (rulez.field["creator"] == "user1-uuid")
+
+    # objects with their own view rule are not filtered by the group rules
+    col = request.get_collection("tests.object1")
+    assert c.app.get_search_filter(col, identity) is None
@@ -8,10 +8,11 @@ from morepath.request import Request
 from morpfw.app import SQLApp
 from morpfw.authn.pas.app import App
 from morpfw.authn.pas.path import hook_auth_models
+from morpfw.authn.pas.principal import get_principal
 from morpfw.authz.pas import DefaultAuthzPolicy
 from morpfw.sql import Base
 
-from ..common import create_admin, get_client
+from ..common import create_admin, get_client, make_request
 from .test_auth import _test_authentication
 
 
@@ -31,3 +32,66 @@ def test_authentication_sqlstorage(pgsql_db):
     Base.metadata.create_all(bind=req.db_session.bind)
     create_admin(c.mfw_request, "admin", "password", "admin@localhost.localdomain")
     _test_authentication(c)
+
+
+def test_principal_cache_sqlstorage(pgsql_db):
+    config = os.path.join(os.path.dirname(__file__), "settings-sqlalchemy.yml")
+
+    c = get_client(config)
+    req = c.mfw_request
+    Base.metadata.create_all(bind=req.db_session.bind)
+    create_admin(c.mfw_request, "admin", "password", "admin@localhost.localdomain")
+
+    request = make_request(c.app)
+    user = request.get_collection("morpfw.pas.user").create(
+        {"username": "principal1", "password": "password", "state": "active"}
+    )
+    group = request.get_collection("morpfw.pas.group").create(
+        {"groupname": "principalgroup"}
+    )
+    principal = get_principal(request, user.userid)
+    assert principal.groupnames == ["__default__"]
+    assert not principal.is_administrator
+
+    # shared across requests
+    assert get_principal(make_request(c.app), user.userid) is principal
+
+    group.add_members([user.userid])
+    group.grant_member_role(user.userid, "editor")
+    principal = get_principal(make_request(c.app), user.userid)
+    assert sorted(principal.groupnames) == ["__default__", "principalgroup"]
+    assert sorted(principal.roles("principalgroup")) == ["editor", "member"]
+
+    group.revoke_member_role(user.userid, "editor")
+    principal = get_principal(make_request(c.app), user.userid)
+    assert principal.roles("principalgroup") == ["member"]
+
+
+def test_group_bulk_members_sqlstorage(pgsql_db):
+    config = os.path.join(os.path.dirname(__file__), "settings-sqlalchemy.yml")
+
+    c = get_client(config)
+    req = c.mfw_request
+    Base.metadata.create_all(bind=req.db_session.bind)
+    create_admin(c.mfw_request, "admin", "password", "admin@localhost.localdomain")
+
+    request = make_request(c.app)
+    users = request.get_collection("morpfw.pas.user")
+    userids = [
+        users.create(
+            {"username": "bulk%s" % i, "password": "password", "state": "active"}
+        ).userid
+        for i in range(5)
+    ]
+    group = request.get_collection("morpfw.pas.group").create({"groupname": "bulk"})
+
+    group.add_members(userids[:3])
+    # existing memberships and roles are skipped
+    group.add_members(userids)
+    members = group.members_roles()
+    assert sorted(m.userid for m, roles in members) == sorted(userids)
+    assert all(roles == ["member"] for m, roles in members)
+
+    group.remove_members(userids[:2])
+    assert sorted(m.userid for m in group.members()) == sorted(userids[2:])
+    assert group.get_member_roles(userids[0]) == []
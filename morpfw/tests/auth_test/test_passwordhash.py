@@ -0,0 +1,97 @@
+import hashlib
+import time
+
+from morpfw.authn.pas import passwordhash
+from morpfw.authn.pas.passwordhash import (
+    PasswordManager,
+    PBKDF2SHA256Hasher,
+    ScryptHasher,
+    VerifiedCache,
+    identify_hasher,
+)
+
+
+def test_hashers():
+    for hasher in [PBKDF2SHA256Hasher(iterations=1000), ScryptHasher(n=1024)]:
+        encoded = hasher.encode("password")
+        assert encoded.startswith(hasher.algorithm + "$")
+        # salted
+        assert encoded != hasher.encode("password")
+        assert isinstance(identify_hasher(encoded), hasher.__class__)
+        assert hasher.verify("password", encoded)
+        assert not hasher.verify("wrongpassword", encoded)
+        assert not hasher.needs_rehash(encoded)
+
+    assert PBKDF2SHA256Hasher(iterations=2000).needs_rehash(
+        PBKDF2SHA256Hasher(iterations=1000).encode("password")
+    )
+    assert ScryptHasher(n=2048).needs_rehash(ScryptHasher(n=1024).encode("password"))
+
+
+def test_password_manager_rehash():
+    passwordhash.reset_stats()
+    manager = PasswordManager(PBKDF2SHA256Hasher(iterations=1000), workers=2)
+
+    # legacy unsalted sha256 is migrated on successful verification
+    legacy = hashlib.sha256(b"password").hexdigest()
+    assert manager.verify_and_update("wrongpassword", legacy) == (False, None)
+    valid, encoded = manager.verify_and_update("password", legacy)
+    assert valid
+    assert encoded.startswith("pbkdf2_sha256$1000$")
+    assert manager.verify_and_update("password", encoded) == (True, None)
+
+    manager.hasher = PBKDF2SHA256Hasher(iterations=1500)
+    valid, encoded = manager.verify_and_update("password", encoded)
+    assert valid
+    assert encoded.startswith("pbkdf2_sha256$1500$")
+    assert manager.verify_and_update("password", None) == (False, None)
+
+    stats = passwordhash.stats()
+    assert stats["verifications"] == 4
+    assert stats["failures"] == 1
+    assert stats["rehashes"] == 2
+
+
+def test_verified_cache():
+    cache = VerifiedCache(maxsize=2)
+    assert cache.get("identity", "secret") is None
+    cache.add("identity", "secret", "userid", 60)
+    assert cache.get("identity", "secret") == "userid"
+    assert cache.get("identity", "othersecret") is None
+    # secrets are not kept
+    assert "secret" not in repr(cache._entries)
+
+    cache.revoke("identity")
+    assert cache.get("identity", "secret") is None
+
+    cache.add("identity", "secret", "userid", 60)
+    cache.add("a", "secret", "userid", 60)
+    cache.add("b", "secret", "userid", 60)
+    assert cache.get("identity", "secret") is None
+
+    cache.add("identity", "secret", "userid", 0.01)
+    time.sleep(0.02)
+    assert cache.get("identity", "secret") is None
+    assert cache.hits == 1
+
+
+class ConfigApp(object):
+    def __init__(self, **config):
+        self.config = config
+
+    def get_config(self, key, default=None):
+        return self.config.get(key, default)
+
+
+def test_apikey_cache_per_app():
+    app = ConfigApp()
+    cache = passwordhash.get_apikey_cache(app)
+    assert passwordhash.get_apikey_cache(app) is cache
+    cache.add("identity", "secret", "userid", 60)
+
+    # keys verified by an app are not trusted by another one
+    other = passwordhash.get_apikey_cache(ConfigApp())
+    assert other.get("identity", "secret") is None
+
+    disabled = ConfigApp(**{"morpfw.authn.apikey_cache_ttl": 0})
+    assert passwordhash.get_apikey_cache(disabled) is None
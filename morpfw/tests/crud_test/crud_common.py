@@ -1,3 +1,5 @@
+import csv
+import io
 import json
 import os
 import shutil
@@ -5,6 +7,7 @@ import tempfile
 import typing
 from dataclasses import dataclass, field
 from datetime import date, datetime
+from urllib.parse import parse_qs, urlparse
 from uuid import uuid4
 
 import jsl
@@ -16,6 +19,8 @@ from more.basicauth import BasicAuthIdentityPolicy
 from morpfw.app import BaseApp
 from morpfw.authn.base import AuthnPolicy as BaseAuthnPolicy
 from morpfw.crud import permission as crudperm
+from morpfw.crud import schemacache
+from morpfw.crud.cursor import Cursor
 from morpfw.crud.model import Collection, Model
 from morpfw.crud.schema import BaseSchema, Schema
 from morpfw.crud.statemachine.base import StateMachine
@@ -174,6 +179,18 @@ def get_object_by_uuid(context, request):
     return context.get_by_uuid(uuid).json()
 
 
+@App.json(model=NamedObjectCollection, name="get_many")
+def get_many_objects(context, request):
+    names = request.GET.getall("name")
+    return [o.json()["data"] if o else None for o in context.get_many(names)]
+
+
+@App.json(model=NamedObjectCollection, name="get_many_by_uuid")
+def get_many_objects_by_uuid(context, request):
+    uuids = request.GET.getall("uuid")
+    return [o.json()["data"] if o else None for o in context.get_many_by_uuid(uuids)]
+
+
 class NamedObjectModel(Model):
     schema = NamedObjectSchema
 
@@ -343,6 +360,60 @@ def run_jslcrud_test(c, skip_aggregate=False):
         ["page%s" % i for i in range(5)]
     )
 
+    # cursor pagination through next/previous links
+    r = c.get("/pages/+search", {"order_by": "title", "limit": 5})
+    titles = [i["data"]["title"] for i in r.json["results"]]
+    links = {l["rel"]: l["href"] for l in r.json["links"]}
+    assert list(links.keys()) == ["next"]
+    assert "cursor=" in links["next"]
+    while "next" in links:
+        r = c.get(links["next"])
+        titles += [i["data"]["title"] for i in r.json["results"]]
+        links = {l["rel"]: l["href"] for l in r.json.get("links", [])}
+
+    assert titles == ["Hello"] + ["page%s" % i for i in range(10)]
+
+    r = c.get(links["previous"])
+    assert list([i["data"]["title"] for i in r.json["results"]]) == (
+        ["page%s" % i for i in range(4, 9)]
+    )
+
+    r = c.get("/pages/+search", {"cursor": "invalid"}, expect_errors=True)
+    assert r.status_code == 422
+
+    # tampered cursors are rejected
+    cursor = Cursor.decode(parse_qs(urlparse(links["previous"]).query)["cursor"][0])
+    for order_by, key_field in [
+        (("nosuchfield", "asc"), cursor.key_field),
+        (cursor.order_by, "nosuchfield"),
+    ]:
+        tampered = Cursor(order_by, key_field, value=cursor.value, key=cursor.key)
+        r = c.get("/pages/+search", {"cursor": tampered.encode()}, expect_errors=True)
+        assert r.status_code == 422
+
+    # streaming export
+    r = c.get("/pages/+export", {"order_by": "title"})
+    assert r.content_type == "application/x-ndjson"
+    lines = [json.loads(l) for l in r.text.strip().split("\n")]
+    assert [l["data"]["title"] for l in lines] == titles
+
+    r = c.get("/pages/+export", {"select": "$.title", "q": 'title in ["Hello"]'})
+    assert [json.loads(l) for l in r.text.strip().split("\n")] == [["Hello"]]
+
+    r = c.get("/pages/+export", {"format": "csv", "order_by": "title"})
+    assert r.content_type == "text/csv"
+    rows = list(csv.reader(io.StringIO(r.text)))
+    assert "title" in rows[0]
+    assert len(rows) == len(titles) + 1
+
+    r = c.get("/pages/+export", {"format": "xml"}, expect_errors=True)
+    assert r.status_code == 422
+
+    # serializing search results reuses compiled serializers and schemas
+    misses = schemacache.stats()["misses"]
+    r = c.get("/pages/+search")
+    assert schemacache.stats()["misses"] == misses
+
     # lets create another with wrong invalid values
     r = c.post_json(
         "/pages/", {"title": "page2", "body": 123, "footer": 123}, expect_errors=True
@@ -507,6 +578,7 @@ def run_jslcrud_test(c, skip_aggregate=False):
     r = c.get("/named_objects/object:obj2")
 
     assert r.json["data"]["name"] == "object:obj2"
+    assert r.json["data"]["uuid"] != uuid
 
     r = c.get("/named_objects/object:obj2?select=$.[body]")
 
@@ -520,10 +592,69 @@ def run_jslcrud_test(c, skip_aggregate=False):
 
     assert r.json["data"]["name"] == "object obj2"
 
+    # batched get
+    r = c.get(
+        "/named_objects/+get_many",
+        [("name", "obj1"), ("name", "missing"), ("name", "object obj2")],
+    )
+
+    assert [o and o["name"] for o in r.json] == ["obj1", None, "object obj2"]
+
+    r = c.get("/named_objects/+get_many_by_uuid", [("uuid", uuid)])
+
+    assert [o["name"] for o in r.json] == ["obj1"]
+
     r = c.patch_json("/named_objects/object%20obj2", {"body": "hello1"})
 
     assert r.status_code == 200
 
+    # bulk create, update and delete
+    r = c.post_json(
+        "/named_objects/+bulk",
+        {"create": [{"name": "bulk%s" % i, "body": "bulk"} for i in range(3)]},
+    )
+
+    assert [o["data"]["name"] for o in r.json["created"]] == [
+        "bulk0",
+        "bulk1",
+        "bulk2",
+    ]
+    assert r.json["created"][0]["data"]["creator"] == _USERUIDS["admin"]
+
+    r = c.post_json(
+        "/named_objects/+bulk",
+        {"create": [{"name": "bulk3"}, {"name": "obj1"}]},
+        expect_errors=True,
+    )
+
+    assert r.status_code == 422
+
+    r = c.get("/named_objects/bulk3", expect_errors=True)
+
+    assert r.status_code == 404
+
+    r = c.post_json(
+        "/named_objects/+bulk",
+        {
+            "update": [
+                {"identifier": "bulk0", "data": {"body": "updated"}},
+                {"identifier": "bulk1", "data": {"body": "updated"}},
+            ],
+            "delete": ["bulk2"],
+        },
+    )
+
+    assert [o["data"]["body"] for o in r.json["updated"]] == ["updated", "updated"]
+    assert r.json["deleted"] == ["bulk2"]
+
+    r = c.get("/named_objects/bulk1")
+
+    assert r.json["data"]["body"] == "updated"
+
+    r = c.get("/named_objects/bulk2", expect_errors=True)
+
+    assert r.status_code == 404
+
     # blob upload test
 
     r = c.post_json("/blob_objects", {})
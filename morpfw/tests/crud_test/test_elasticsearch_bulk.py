@@ -0,0 +1,252 @@
+import json
+import os
+from dataclasses import dataclass
+
+import elasticsearch.exceptions as es_exc
+import pytest
+import transaction
+from elasticsearch import Elasticsearch, Transport
+from elasticsearch.helpers import BulkIndexError
+from morpfw.crud.errors import AlreadyExistsError
+from morpfw.crud.storage import elasticsearchstorage
+from morpfw.crud.storage.elasticsearchstorage import (
+    BulkBuffer,
+    ElasticSearchDataManager,
+)
+
+from ..common import get_client, make_request
+from . import test_elasticsearchstorage
+from .crud_common import PageCollection, PageModel, PageSchema
+
+
+class FakeTransport(Transport):
+    """Transport answering requests from a list of canned responses"""
+
+    def __init__(self, hosts, *args, **kwargs):
+        super().__init__(hosts, *args, **kwargs)
+        self.requests = []
+        self.responses = []
+
+    def perform_request(self, method, url, headers=None, params=None, body=None):
+        if body is None or isinstance(body, dict):
+            lines = [body] if body else []
+        else:
+            lines = [json.loads(line) for line in body.splitlines()]
+        self.requests.append((method, url, params, lines))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@dataclass
+class UniquePageSchema(PageSchema):
+
+    __unique_constraint__ = ["title"]
+
+
+class UniquePageCollection(PageCollection):
+    schema = UniquePageSchema
+
+
+class UniquePageModel(PageModel):
+    schema = UniquePageSchema
+
+
+class UniquePageStorage(test_elasticsearchstorage.PageStorage):
+    model = UniquePageModel
+
+
+class BufferedPageStorage(test_elasticsearchstorage.PageStorage):
+    refresh = None
+    use_bulk_buffer = True
+
+
+def bulk_response(*statuses):
+    items = []
+    for status in statuses:
+        result = {"_index": "test", "_id": "x", "status": status}
+        if status >= 300:
+            result["error"] = {"type": "error_%s" % status}
+        items.append({"index": result})
+    return {"errors": any(s >= 300 for s in statuses), "items": items}
+
+
+def search_response(*sources):
+    return {"hits": {"hits": [{"_source": source} for source in sources]}}
+
+
+@pytest.fixture
+def buffer():
+    client = Elasticsearch(transport_class=FakeTransport)
+    return BulkBuffer(client, chunk_size=2, max_retries=2, retry_backoff=0)
+
+
+def test_bulk_buffer_chunks(buffer):
+    transport = buffer.client.transport
+    transport.responses = [bulk_response(201, 201), bulk_response(200)]
+    buffer.add({"index": {"_index": "test", "_id": "1"}}, {"title": "1"})
+    buffer.add({"update": {"_index": "test", "_id": "1"}}, {"doc": {"title": "2"}})
+    buffer.add({"delete": {"_index": "test", "_id": "2"}}, refresh="wait_for")
+    assert len(buffer) == 3
+
+    items = buffer.flush()
+    assert len(items) == 3
+    assert len(buffer) == 0
+    assert [r[0] for r in transport.requests] == ["POST", "POST"]
+    # refresh is applied once per bulk request
+    assert [r[2]["refresh"] for r in transport.requests] == [b"wait_for", b"wait_for"]
+    assert transport.requests[1][3] == [{"delete": {"_index": "test", "_id": "2"}}]
+
+
+def test_bulk_buffer_retry(buffer):
+    transport = buffer.client.transport
+    transport.responses = [
+        es_exc.TransportError(429, "es_rejected_execution_exception", {}),
+        bulk_response(201, 429),
+        bulk_response(201),
+    ]
+    buffer.add({"index": {"_index": "test", "_id": "1"}}, {"title": "1"})
+    buffer.add({"index": {"_index": "test", "_id": "2"}}, {"title": "2"})
+
+    items = buffer.flush()
+    assert [i["index"]["status"] for i in items] == [201, 201]
+    # only the rejected item is sent again
+    assert transport.requests[2][3] == [
+        {"index": {"_index": "test", "_id": "2"}},
+        {"title": "2"},
+    ]
+
+
+def test_bulk_buffer_errors(buffer):
+    transport = buffer.client.transport
+    transport.responses = [
+        bulk_response(201, 400),
+        bulk_response(429),
+        bulk_response(429),
+        bulk_response(429),
+    ]
+    buffer.add({"index": {"_index": "test", "_id": "1"}}, {"title": "1"})
+    buffer.add({"index": {"_index": "test", "_id": "2"}}, {"title": "2"})
+    with pytest.raises(BulkIndexError) as e:
+        buffer.flush()
+    assert [i["index"]["status"] for i in e.value.errors] == [400]
+
+    # rejected items are reported once retries are exhausted
+    buffer.add({"index": {"_index": "test", "_id": "3"}}, {"title": "3"})
+    with pytest.raises(BulkIndexError) as e:
+        buffer.flush()
+    assert len(transport.requests) == 4
+    assert [i["index"]["status"] for i in e.value.errors] == [429]
+
+
+def test_bulk_buffer_transaction(buffer):
+    transport = buffer.client.transport
+    transport.responses = [bulk_response(201, 201)]
+    manager = transaction.TransactionManager()
+    elasticsearchstorage.reset_stats()
+
+    # writes of an aborted transaction are never sent
+    txn = manager.begin()
+    txn.join(ElasticSearchDataManager(buffer, manager))
+    buffer.add({"index": {"_index": "test", "_id": "1"}}, {"title": "1"})
+    manager.abort()
+    assert transport.requests == []
+    assert len(buffer) == 0
+
+    txn = manager.begin()
+    txn.join(ElasticSearchDataManager(buffer, manager))
+    buffer.add({"index": {"_index": "test", "_id": "2"}}, {"title": "2"})
+    savepoint = txn.savepoint()
+    buffer.add({"index": {"_index": "test", "_id": "3"}}, {"title": "3"})
+    savepoint.rollback()
+    buffer.add({"index": {"_index": "test", "_id": "4"}}, {"title": "4"})
+    assert transport.requests == []
+    manager.commit()
+
+    assert len(transport.requests) == 1
+    assert [line["index"]["_id"] for line in transport.requests[0][3][::2]] == [
+        "2",
+        "4",
+    ]
+    stats = elasticsearchstorage.stats()
+    assert stats["queued"] == 4
+    assert stats["discarded"] == 2
+    assert stats["flushed"] == 2
+    assert stats["flushes"] == 1
+    assert stats["flush_seconds"] > 0
+
+
+@pytest.fixture
+def es_request(monkeypatch):
+    config = os.path.join(
+        os.path.dirname(__file__), "test_elasticsearchstorage-settings.yml"
+    )
+    request = make_request(get_client(config).app)
+    es = Elasticsearch(transport_class=FakeTransport)
+    monkeypatch.setattr(request, "get_es_client", lambda name="default": es)
+    return request
+
+
+def test_elasticsearch_storage_read_pending(es_request, caplog):
+    transport = es_request.get_es_client().transport
+    storage = BufferedPageStorage(es_request)
+    col = PageCollection(es_request, storage)
+
+    transaction.begin()
+    try:
+        obj = col.create({"title": "page", "body": "body"})
+        obj.update({"title": "updated"})
+        # queued writes are visible to reads by identifier without sending them
+        assert col.get(obj.identifier)["title"] == "updated"
+        assert storage.get_many(col, [obj.identifier])[0]["body"] == "body"
+
+        transport.responses = [
+            {"_id": "other", "found": True, "_source": {"title": "other"}},
+            {"docs": [{"_id": "other", "found": False}]},
+            search_response(),
+        ]
+        storage.update(col, "other", {"body": "body"})
+        other = storage.get(col, "other")
+        assert (other["title"], other["body"]) == ("other", "body")
+        obj.delete()
+        assert storage.get(col, obj.identifier) is None
+        assert storage.get_many(col, [obj.identifier, "other"]) == [None, None]
+
+        # searches do not see queued writes
+        assert storage.search(col) == []
+        assert "queued writes" in caplog.text
+
+        # only the reads of the indexed documents are sent
+        assert [r[1] for r in transport.requests] == [
+            "/test-page/_doc/other",
+            "/test-page/_mget",
+            "/test-page/_search",
+        ]
+        assert transport.requests[1][3] == [{"ids": ["other"]}]
+    finally:
+        transaction.abort()
+
+    # aborted writes are never sent
+    assert len(transport.requests) == 3
+
+
+def test_elasticsearch_storage_unique_create(es_request):
+    transport = es_request.get_es_client().transport
+    col = UniquePageCollection(es_request, UniquePageStorage(es_request))
+
+    transaction.begin()
+    try:
+        transport.responses = [search_response(), bulk_response(201)]
+        col.create({"title": "page", "body": "body"})
+        # storages with refresh send writes right away, so that searches of
+        # the transaction see them
+        method, url, params, lines = transport.requests[-1]
+        assert url == "/_bulk"
+        assert params["refresh"] == b"true"
+
+        transport.responses = [search_response(lines[1])]
+        with pytest.raises(AlreadyExistsError):
+            col.create({"title": "page", "body": "body"})
+    finally:
+        transaction.abort()
@@ -4,6 +4,7 @@ import typing
 from dataclasses import dataclass, field
 
 import morpfw.crud.signals as signals
+import transaction
 from elasticsearch import Elasticsearch
 from more.basicauth import BasicAuthIdentityPolicy
 from more.transaction import TransactionApp
@@ -194,3 +195,21 @@ def test_elasticsearchstorage(es_client):
     col = client.mfw_request.get_collection("tests.page")
     col.storage.create_index(col)
     run_jslcrud_test(client)
+
+
+def test_elasticsearchstorage_iter_search(es_client):
+    config = os.path.join(
+        os.path.dirname(__file__), "test_elasticsearchstorage-settings.yml"
+    )
+    client = get_client(config)
+    col = client.mfw_request.get_collection("tests.page")
+    col.storage.create_index(col)
+    with transaction.manager:
+        for i in range(25):
+            col.create({"title": "iter%s" % i, "body": "body", "value": 1000 + i})
+
+    query = {"field": "value", "operator": ">=", "value": 1000}
+    items = col.storage.iter_search(
+        col, query, order_by=("value", "asc"), batch_size=10
+    )
+    assert [o["value"] for o in items] == list(range(1000, 1025))
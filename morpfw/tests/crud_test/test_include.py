@@ -0,0 +1,187 @@
+import os
+import typing
+from dataclasses import dataclass
+
+import rulez
+
+from morpfw.crud.relationship import BackReference, Reference
+from morpfw.crud.schema import Schema
+from morpfw.crud.storage.memorystorage import MemoryStorage
+
+from ..common import get_client, make_request
+from .crud_common import App as BaseApp
+from .crud_common import Collection, Model
+
+
+class App(BaseApp):
+    pass
+
+
+@dataclass
+class AuthorSchema(Schema):
+
+    name: typing.Optional[str] = None
+
+    __backreferences__ = [BackReference("books", "tests.book", "author")]
+
+
+@dataclass
+class BookSchema(Schema):
+
+    title: typing.Optional[str] = None
+    author: typing.Optional[str] = None
+
+    __references__ = [Reference("author", "tests.author")]
+
+
+class AuthorCollection(Collection):
+    schema = AuthorSchema
+
+
+class AuthorModel(Model):
+    schema = AuthorSchema
+
+
+class BookCollection(Collection):
+    schema = BookSchema
+
+
+class BookModel(Model):
+    schema = BookSchema
+
+
+class AuthorStorage(MemoryStorage):
+    model = AuthorModel
+
+
+class BookStorage(MemoryStorage):
+    model = BookModel
+
+
+@App.path(model=AuthorCollection, path="authors")
+def author_collection_factory(request):
+    return AuthorCollection(request, AuthorStorage(request))
+
+
+@App.path(model=AuthorModel, path="authors/{identifier}")
+def author_model_factory(request, identifier):
+    return author_collection_factory(request).get(identifier)
+
+
+@App.path(model=BookCollection, path="books")
+def book_collection_factory(request):
+    return BookCollection(request, BookStorage(request))
+
+
+@App.path(model=BookModel, path="books/{identifier}")
+def book_model_factory(request, identifier):
+    return book_collection_factory(request).get(identifier)
+
+
+@App.typeinfo(name="tests.author", schema=AuthorSchema)
+def get_author_typeinfo(request):
+    return {
+        "title": "Author",
+        "description": "Author type",
+        "schema": AuthorSchema,
+        "collection": AuthorCollection,
+        "collection_factory": author_collection_factory,
+        "model": AuthorModel,
+        "model_factory": author_model_factory,
+    }
+
+
+@App.typeinfo(name="tests.book", schema=BookSchema)
+def get_book_typeinfo(request):
+    return {
+        "title": "Book",
+        "description": "Book type",
+        "schema": BookSchema,
+        "collection": BookCollection,
+        "collection_factory": book_collection_factory,
+        "model": BookModel,
+        "model_factory": book_model_factory,
+    }
+
+
+def get_include_client():
+    config = os.path.join(os.path.dirname(__file__), "test_include-settings.yml")
+    client = get_client(config)
+    client.authorization = ("Basic", ("admin", "admin"))
+    request = make_request(client.app)
+    for col in [author_collection_factory(request), book_collection_factory(request)]:
+        col.storage.datastore.clear()
+    return client, request
+
+
+def test_include_search():
+    client, request = get_include_client()
+    authors = author_collection_factory(request)
+    books = book_collection_factory(request)
+    alice = authors.create({"name": "alice"})
+    bob = authors.create({"name": "bob"})
+    for i in range(3):
+        books.create({"title": "alice%s" % i, "author": alice.uuid})
+    books.create({"title": "bob0", "author": bob.uuid})
+    books.create({"title": "anonymous"})
+
+    result = books.search(order_by=("title", "asc"), include=["author"])
+    assert [b["title"] for b in result] == [
+        "alice0",
+        "alice1",
+        "alice2",
+        "anonymous",
+        "bob0",
+    ]
+    refs = books.schema.__references__
+    assert [b.resolve_reference(refs[0]) for b in result] == [
+        alice,
+        alice,
+        alice,
+        None,
+        bob,
+    ]
+    # resolved from the prefetched relations without querying again
+    assert "author" in result[0]._prefetched_relations
+
+    result = authors.search(order_by=("name", "asc"), include=["books"])
+    bref = authors.schema.__backreferences__[0]
+    assert sorted(b["title"] for b in result[0].resolve_backreference(bref)) == [
+        "alice0",
+        "alice1",
+        "alice2",
+    ]
+    assert [b["title"] for b in result[1].resolve_backreference(bref)] == ["bob0"]
+
+    r = client.get("/books/+search", {"include": "author", "order_by": "title"})
+    included = [o["included"]["author"] for o in r.json["results"]]
+    assert included[0]["data"]["name"] == "alice"
+    assert included[3] is None
+
+    r = client.get("/books/+search", {"include": "unknown"}, expect_errors=True)
+    assert r.status_code == 422
+
+
+def test_include_cache_invalidated_on_write():
+    client, request = get_include_client()
+    authors = author_collection_factory(request)
+    books = book_collection_factory(request)
+    alice = authors.create({"name": "alice"})
+    books.create({"title": "alice0", "author": alice.uuid})
+
+    bref = authors.schema.__backreferences__[0]
+    result = authors.search(include=["books"])
+    assert len(result[0].resolve_backreference(bref)) == 1
+
+    # relations resolved before a write are not served afterwards
+    books.create({"title": "alice1", "author": alice.uuid})
+    assert len(result[0].resolve_backreference(bref)) == 2
+
+    book = books.search(rulez.field["title"] == "alice0")[0]
+    book.update({"author": None})
+    assert len(result[0].resolve_backreference(bref)) == 1
+
+    # cascading delete removes books of every author
+    result = authors.search(include=["books"])
+    result[0].delete()
+    assert [b["title"] for b in books.search()] == ["alice0"]
@@ -0,0 +1,99 @@
+import os
+import typing
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+import colander
+import pytz
+from inverter import dc2colanderjson
+from morpfw.crud import jsonserializer
+
+from ..common import get_client, make_request
+from .crud_common import PageSchema
+
+
+class ContextString(colander.String):
+    def serialize(self, node, appstruct):
+        return "%s@%s" % (appstruct, node.bindings["context"])
+
+
+@dataclass
+class AddressSchema(object):
+    street: typing.Optional[str] = None
+    number: typing.Optional[int] = None
+
+
+@dataclass
+class SerializerSchema(object):
+    name: typing.Optional[str] = None
+    count: typing.Optional[int] = None
+    ratio: typing.Optional[float] = None
+    enabled: typing.Optional[bool] = False
+    day: typing.Optional[date] = None
+    moment: typing.Optional[datetime] = None
+    tags: typing.Optional[list] = field(default_factory=lambda: ["new"])
+    attrs: typing.Optional[dict] = None
+    address: typing.Optional[AddressSchema] = None
+    label: typing.Optional[str] = field(
+        default="label",
+        metadata={"colanderjson.field_factory": lambda request: ContextString()},
+    )
+
+
+def get_request():
+    config = os.path.join(os.path.dirname(__file__), "test_memorystorage-settings.yml")
+    return make_request(get_client(config).app)
+
+
+def colander_serialize(request, schema, data, context):
+    cschema = dc2colanderjson.convert(schema, request=request)
+    return cschema().bind(context=context, request=request).serialize(data)
+
+
+def test_jsonserializer_colander_equivalence():
+    request = get_request()
+    samples = [
+        {},
+        {"name": "name", "count": 3, "enabled": None, "tags": None},
+        {
+            "name": "name",
+            "count": 3,
+            "ratio": 0.5,
+            "enabled": True,
+            "day": date(2020, 2, 29),
+            "moment": datetime(2020, 2, 29, 10, 30, tzinfo=pytz.UTC),
+            "tags": ["a", "b"],
+            "attrs": {"key": "value"},
+            "address": {"street": "street", "number": 1},
+            "label": "other",
+        },
+        # values of unexpected type are serialized by colander
+        {"count": "3", "ratio": "0.5"},
+    ]
+    for data in samples:
+        expected = colander_serialize(request, SerializerSchema, data, "ctx")
+        result = jsonserializer.serialize(
+            request, SerializerSchema, data, context="ctx"
+        )
+        assert result == expected
+
+    excluded = jsonserializer.serialize(
+        request, SerializerSchema, samples[2], ["name", "label"], context="ctx"
+    )
+    assert "name" not in excluded
+    assert "label" not in excluded
+    assert excluded["count"] == 3
+
+
+def test_jsonserializer_default_factory():
+    request = get_request()
+    serializer = jsonserializer.get_serializer(SerializerSchema)
+    first = serializer.serialize(request, {}, "ctx")
+    first["tags"].append("changed")
+    assert serializer.serialize(request, {}, "ctx")["tags"] == ["new"]
+
+    # uuid is generated for every object, as colander would do
+    first, second = [jsonserializer.serialize(request, PageSchema, {}) for i in [1, 2]]
+    assert first["uuid"] != second["uuid"]
+    expected = colander_serialize(request, PageSchema, {}, None)
+    assert sorted(first.keys()) == sorted(expected.keys())
@@ -2,12 +2,20 @@ import os
 
 import jsl
 import morpfw.crud.signals as signals
+import pytest
+import rulez
+from inverter import dc2colanderjson
 from more.basicauth import BasicAuthIdentityPolicy
 from more.transaction import TransactionApp
+from morpfw.crud import schemacache
 from morpfw.crud.blobstorage.fsblobstorage import FSBlobStorage
+from morpfw.crud.errors import AlreadyExistsError
+from morpfw.crud.storage.columnarstorage import ColumnarStorage
 from morpfw.crud.storage.memorystorage import MemoryStorage
+from morpfw.crud.view import export
+from morpfw.memoizer import requestmemoize
 
-from ..common import get_client
+from ..common import get_client, make_request
 from .crud_common import FSBLOB_DIR
 from .crud_common import App as BaseApp
 from .crud_common import (
@@ -24,7 +32,15 @@ from .crud_common import (
 )
 
 
-class App(BaseApp):
+class CrudApp(BaseApp):
+    pass
+
+
+class App(CrudApp):
+    pass
+
+
+class ColumnarApp(CrudApp):
     pass
 
 
@@ -32,19 +48,33 @@ class PageStorage(MemoryStorage):
     model = PageModel
 
 
-@App.path(model=PageCollection, path="pages")
+class ColumnarPageStorage(ColumnarStorage):
+    model = PageModel
+
+
+@App.storage(model=PageModel)
+def get_page_storage(model, request, blobstorage):
+    return PageStorage(request, blobstorage=blobstorage)
+
+
+@ColumnarApp.storage(model=PageModel)
+def get_columnar_page_storage(model, request, blobstorage):
+    return ColumnarPageStorage(request, blobstorage=blobstorage)
+
+
+@CrudApp.path(model=PageCollection, path="pages")
 def collection_factory(request):
-    storage = PageStorage(request)
+    storage = request.app.get_storage(PageModel, request)
     return PageCollection(request, storage)
 
 
-@App.path(model=PageModel, path="pages/{identifier}")
+@CrudApp.path(model=PageModel, path="pages/{identifier}")
 def model_factory(request, identifier):
     col = collection_factory(request)
     return col.get(identifier)
 
 
-@App.typeinfo(name="tests.page", schema=PageSchema)
+@CrudApp.typeinfo(name="tests.page", schema=PageSchema)
 def get_page_typeinfo(request):
     return {
         "title": "Page",
@@ -63,13 +93,29 @@ class ObjectStorage(MemoryStorage):
     model = ObjectModel
 
 
-@App.path(model=ObjectCollection, path="objects")
+class ColumnarObjectStorage(ColumnarStorage):
+    incremental_id = True
+    incremental_column = "id"
+    model = ObjectModel
+
+
+@App.storage(model=ObjectModel)
+def get_object_storage(model, request, blobstorage):
+    return ObjectStorage(request, blobstorage=blobstorage)
+
+
+@ColumnarApp.storage(model=ObjectModel)
+def get_columnar_object_storage(model, request, blobstorage):
+    return ColumnarObjectStorage(request, blobstorage=blobstorage)
+
+
+@CrudApp.path(model=ObjectCollection, path="objects")
 def object_collection_factory(request):
-    storage = ObjectStorage(request)
+    storage = request.app.get_storage(ObjectModel, request)
     return ObjectCollection(request, storage)
 
 
-@App.path(model=ObjectModel, path="objects/{identifier}")
+@CrudApp.path(model=ObjectModel, path="objects/{identifier}")
 def object_model_factory(request, identifier):
     col = object_collection_factory(request)
     return col.get(identifier)
@@ -79,13 +125,27 @@ class NamedObjectStorage(MemoryStorage):
     model = NamedObjectModel
 
 
-@App.path(model=NamedObjectCollection, path="named_objects")
+class ColumnarNamedObjectStorage(ColumnarStorage):
+    model = NamedObjectModel
+
+
+@App.storage(model=NamedObjectModel)
+def get_namedobject_storage(model, request, blobstorage):
+    return NamedObjectStorage(request, blobstorage=blobstorage)
+
+
+@ColumnarApp.storage(model=NamedObjectModel)
+def get_columnar_namedobject_storage(model, request, blobstorage):
+    return ColumnarNamedObjectStorage(request, blobstorage=blobstorage)
+
+
+@CrudApp.path(model=NamedObjectCollection, path="named_objects")
 def namedobject_collection_factory(request):
-    storage = NamedObjectStorage(request)
+    storage = request.app.get_storage(NamedObjectModel, request)
     return NamedObjectCollection(request, storage)
 
 
-@App.path(model=NamedObjectModel, path="named_objects/{identifier}")
+@CrudApp.path(model=NamedObjectModel, path="named_objects/{identifier}")
 def namedobject_model_factory(request, identifier):
     col = namedobject_collection_factory(request)
     return col.get(identifier)
@@ -95,29 +155,206 @@ class BlobObjectStorage(MemoryStorage):
     model = BlobObjectModel
 
 
+class ColumnarBlobObjectStorage(ColumnarStorage):
+    model = BlobObjectModel
+
+
 @App.storage(model=BlobObjectModel)
 def get_blobobject_storage(model, request, blobstorage):
     return BlobObjectStorage(request, blobstorage=blobstorage)
 
 
-@App.blobstorage(model=BlobObjectModel)
+@ColumnarApp.storage(model=BlobObjectModel)
+def get_columnar_blobobject_storage(model, request, blobstorage):
+    return ColumnarBlobObjectStorage(request, blobstorage=blobstorage)
+
+
+@CrudApp.blobstorage(model=BlobObjectModel)
 def get_blobobject_blobstorage(model, request):
     return FSBlobStorage(request, FSBLOB_DIR)
 
 
-@App.path(model=BlobObjectCollection, path="blob_objects")
+@CrudApp.path(model=BlobObjectCollection, path="blob_objects")
 def blobobject_collection_factory(request):
     storage = request.app.get_storage(BlobObjectModel, request)
     return BlobObjectCollection(request, storage)
 
 
-@App.path(model=BlobObjectModel, path="blob_objects/{identifier}")
+@CrudApp.path(model=BlobObjectModel, path="blob_objects/{identifier}")
 def blobobject_model_factory(request, identifier):
     col = blobobject_collection_factory(request)
     return col.get(identifier)
 
 
-def test_memorystorage():
-    config = os.path.join(os.path.dirname(__file__), "test_memorystorage-settings.yml")
+@pytest.fixture(params=["memorystorage", "columnarstorage"])
+def config(request):
+    return os.path.join(
+        os.path.dirname(__file__), "test_%s-settings.yml" % request.param
+    )
+
+
+def test_memorystorage(config):
+    client = get_client(config)
+    run_jslcrud_test(client)
+
+
+def test_memorystorage_aggregate(config):
+    client = get_client(config)
+    client.authorization = ("Basic", ("admin", "admin"))
+    col = collection_factory(make_request(client.app))
+    col.storage.datastore.clear()
+    for i in range(10):
+        col.create({"title": "page%s" % (i % 2), "body": "body", "value": i})
+
+    r = client.get(
+        "/pages/+aggregate",
+        {
+            "q": "value >= 2",
+            "group": (
+                "title:title, count:count(uuid), distinct:count_distinct(value),"
+                "median:median(value), p90:percentile(value, 0.9),"
+                "stddev:stddev(value), week:date_trunc(created, week, Asia/Tokyo)"
+            ),
+            "order_by": "title:desc",
+        },
+    )
+    assert [row["title"] for row in r.json] == ["page1", "page0"]
+    page1 = r.json[0]
+    assert page1["count"] == 4
+    assert page1["distinct"] == 4
+    assert page1["median"] == 6
+    assert page1["p90"] == 8.4
+    assert round(page1["stddev"], 4) == 2.582
+    assert page1["week"].endswith("T00:00:00+09:00")
+
+    r = client.get("/pages/+aggregate", {"group": "count:unknown(value)"}, status=422)
+
+
+def test_memorystorage_memoize(config):
+    client = get_client(config)
+    col = collection_factory(make_request(client.app))
+    col.create({"title": "memoized", "body": "body"})
+    count = col.count()
+
+    # count is served from the shared cache in another request, although a
+    # storage level delete left count - 1 objects
+    obj = col.search()[0]
+    col.storage.delete(obj.identifier, obj)
+    assert collection_factory(make_request(client.app)).count() == count
+
+    # and invalidated by writes
+    col.create({"title": "memoized", "body": "body"})
+    col.create({"title": "memoized", "body": "body"})
+    assert collection_factory(make_request(client.app)).count() == count + 1
+    obj = col.search()[0]
+    obj.delete()
+    assert collection_factory(make_request(client.app)).count() == count
+
+
+def test_memorystorage_default_factory(config):
+    client = get_client(config)
+
+    # uuid of objects identified by another field is generated per object
+    # although the validation schema is cached
+    col = namedobject_collection_factory(make_request(client.app))
+    col.storage.datastore.clear()
+    obj1 = col.create({"name": "obj1"})
+    obj2 = col.create({"name": "obj2"})
+    assert obj1["uuid"] != obj2["uuid"]
+    col = namedobject_collection_factory(make_request(client.app))
+    assert col.get("obj2")["uuid"] == obj2["uuid"]
+
+    request = make_request(client.app)
+    cschema = schemacache.convert(dc2colanderjson, PageSchema, request=request)
+    first, second = [cschema().serialize({"title": "page"}) for i in range(2)]
+    assert first["uuid"] != second["uuid"]
+    assert first["xattrs"] == {}
+
+
+def test_memorystorage_export_memoize(config):
+    client = get_client(config)
+    request = make_request(client.app)
+    # admin:admin
+    request.authorization = ("Basic", "YWRtaW46YWRtaW4=")
+    col = collection_factory(request)
+    col.storage.datastore.clear()
+    for i in range(5):
+        col.create({"title": "page%s" % i, "body": "body"})
+
+    # exporting does not keep serialized objects in the request cache
+    col.search()
+    size = len(request.environ[requestmemoize.environ_key])
+    lines = list(export(col, request).app_iter)
+    assert len(lines) == 5
+    assert len(request.environ[requestmemoize.environ_key]) == size
+
+
+def test_memorystorage_bulk_create(config):
+    client = get_client(config)
+    col = namedobject_collection_factory(make_request(client.app))
+    col.storage.datastore.clear()
+    objs = col.bulk_create([{"name": "bulk%s" % i} for i in range(3)])
+    assert [o["name"] for o in objs] == ["bulk0", "bulk1", "bulk2"]
+
+    with pytest.raises(AlreadyExistsError):
+        col.bulk_create([{"name": "bulk3"}, {"name": "bulk3"}])
+    with pytest.raises(AlreadyExistsError):
+        col.bulk_create([{"name": "bulk4"}, {"name": "bulk0"}])
+    assert len(col.search()) == 3
+
+
+def test_memorystorage_typeinfo(config):
+    client = get_client(config)
+    registry = client.app.config.type_registry
+
+    class SubPageSchema(PageSchema):
+        pass
+
+    request = make_request(client.app)
+    typeinfo = registry.get_typeinfo("tests.page", request)
+    assert typeinfo["name"] == "tests.page"
+    assert registry.get_typeinfo_by_schema(SubPageSchema, request)["title"] == "Page"
+    assert registry.get_name_by_schema(SubPageSchema) == "tests.page"
+
+    # static part is computed once and shared across requests
+    other = registry.get_typeinfo("tests.page", make_request(client.app))
+    assert other.request is not typeinfo.request
+    assert registry.get_static_typeinfo("tests.page", request) is (
+        registry.get_static_typeinfo("tests.page", other.request)
+    )
+    if isinstance(client.app, ColumnarApp):
+        assert isinstance(typeinfo.get_storage(), ColumnarPageStorage)
+    else:
+        assert isinstance(typeinfo.get_storage(), PageStorage)
+
+
+def test_columnarstorage_search():
+    config = os.path.join(
+        os.path.dirname(__file__), "test_columnarstorage-settings.yml"
+    )
     client = get_client(config)
-    run_jslcrud_test(client, skip_aggregate=True)
+    client.authorization = ("Basic", ("admin", "admin"))
+    col = collection_factory(make_request(client.app))
+    table = col.storage.table
+    table.clear()
+    for i in range(10):
+        col.create({"title": "page%s" % (i % 2), "body": "body", "value": i})
+
+    query = rulez.and_(rulez.field["title"] == "page1", rulez.field["value"] >= 3)
+    result = col.search(query, order_by=("value", "desc"), offset=1, limit=2)
+    assert [o["value"] for o in result] == [7, 5]
+    assert "title" in table.hash_indexes
+    assert "value" in table.sorted_indexes
+
+    # indexes follow updates and deletes
+    obj = col.search(rulez.field["value"] == 7)[0]
+    obj.update({"value": 70})
+    assert col.search(rulez.field["value"] == 7) == []
+    assert [o["value"] for o in col.search(rulez.field["value"] > 9)] == [70]
+    obj.delete()
+    assert col.search(rulez.field["value"] > 9) == []
+    assert col.storage.get_by_uuid(col, obj.uuid) is None
+    assert len(table) == 9
+
+    r = client.get("/pages/+search", {"q": "value < 2", "order_by": "value:asc"})
+    assert [o["data"]["value"] for o in r.json["results"]] == [0, 1]
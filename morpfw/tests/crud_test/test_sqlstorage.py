@@ -2,6 +2,7 @@ import os
 import pprint
 
 import jsl
+import pytest
 import morpfw.crud.signals as signals
 import sqlalchemy as sa
 import sqlalchemy_jsonfield as sajson
@@ -10,6 +11,7 @@ from morepath.reify import reify
 from morepath.request import Request
 from morpfw.app import SQLApp
 from morpfw.crud.blobstorage.fsblobstorage import FSBlobStorage
+from morpfw.crud.errors import AlreadyExistsError
 from morpfw.crud.model import Collection, Model
 from morpfw.crud.storage.sqlstorage import GUID, Base, SQLStorage
 from sqlalchemy.orm import sessionmaker
@@ -172,3 +174,71 @@ def test_sqlstorage(pgsql_db):
     request = make_request(c.app)
     Base.metadata.create_all(bind=request.db_session.bind)
     run_jslcrud_test(c)
+
+
+def test_sqlstorage_create_statements(pgsql_db):
+    config = os.path.join(os.path.dirname(__file__), "test_sqlstorage-settings.yml")
+    c = get_client(config)
+    request = make_request(c.app)
+    Base.metadata.create_all(bind=request.db_session.bind)
+    col = collection_factory(request)
+
+    statements = []
+
+    def count_statements(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0])
+
+    engine = request.db_session.bind
+    sa.event.listen(engine, "before_cursor_execute", count_statements)
+    try:
+        obj = col.create({"title": "Hello", "body": "World"})
+        request.db_session.flush()
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", count_statements)
+
+    # uuid, created and state are set before the object is inserted
+    assert statements == ["INSERT"]
+    assert obj["uuid"]
+    assert obj["created"]
+    assert obj["state"] == "new"
+
+    # identifiers set by clients are checked against existing objects
+    col = namedobject_collection_factory(request)
+    del statements[:]
+    sa.event.listen(engine, "before_cursor_execute", count_statements)
+    try:
+        col.create({"name": "obj1"})
+        request.db_session.flush()
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", count_statements)
+
+    assert statements == ["SELECT", "INSERT"]
+    with pytest.raises(AlreadyExistsError):
+        col.create({"name": "obj1"})
+
+
+def test_sqlstorage_live_index(pgsql_db):
+    config = os.path.join(os.path.dirname(__file__), "test_sqlstorage-settings.yml")
+    c = get_client(config)
+    request = make_request(c.app)
+    Base.metadata.create_all(bind=request.db_session.bind)
+
+    indexes = sa.inspect(request.db_session.bind).get_indexes(Page.__tablename__)
+    live = [i for i in indexes if i["name"] == "ix_jslcrud_test_page_created_id_live"]
+    assert live and live[0]["column_names"] == ["created", "id"]
+
+    col = collection_factory(request)
+    for i in range(20):
+        col.create({"title": "Hello %s" % i, "body": "World"})
+    session = request.db_session
+    session.execute("ANALYZE %s" % Page.__tablename__)
+    session.execute("SET LOCAL enable_seqscan = off")
+    q = (
+        session.query(Page.id)
+        .filter(Page.deleted.is_(None))
+        .order_by(Page.created.desc(), Page.id.desc())
+        .limit(10)
+    )
+    sql = str(q.statement.compile(compile_kwargs={"literal_binds": True}))
+    plan = "\n".join(r[0] for r in session.execute("EXPLAIN " + sql))
+    assert "ix_jslcrud_test_page_created_id_live" in plan
@@ -0,0 +1,149 @@
+import time
+
+import rulez
+from morpfw import memoizer
+from morpfw.interfaces import ICollection
+from morpfw.memoizer import (
+    FileBackend,
+    LRUBackend,
+    RedisBackend,
+    canonical,
+    requestmemoize,
+)
+
+
+class LocalRedis(object):
+    """Minimal in-process stand-in for a redis client"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires < time.time():
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value, time.time() + ex if ex else None)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def keys(self, pattern):
+        prefix = pattern.rstrip("*")
+        return [k for k in self.data.keys() if k.startswith(prefix)]
+
+
+def check_backend(backend):
+    backend.set("morpfw.memoize:a", {"result": 1})
+    assert backend.get("morpfw.memoize:a") == {"result": 1}
+    assert backend.get("morpfw.memoize:missing") is None
+
+    backend.set("morpfw.memoize:ttl", 1, ttl=1)
+    assert backend.get("morpfw.memoize:ttl") == 1
+    time.sleep(1.1)
+    assert backend.get("morpfw.memoize:ttl") is None
+
+    version = backend.version("morpfw.memoize.version:x")
+    assert backend.version("morpfw.memoize.version:x") == version
+    assert backend.bump("morpfw.memoize.version:x") != version
+
+    backend.delete("morpfw.memoize:a")
+    assert backend.get("morpfw.memoize:a") is None
+
+    backend.set("morpfw.memoize:b", 2)
+    backend.clear()
+    assert backend.get("morpfw.memoize:b") is None
+
+
+def test_lru_backend():
+    check_backend(LRUBackend())
+
+    backend = LRUBackend(maxsize=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+    assert backend.get("a") == 1
+    assert backend.get("b") is None
+    assert len(backend) == 2
+
+
+def test_file_backend(tmpdir):
+    check_backend(FileBackend(str(tmpdir)))
+
+    # entries are shared between backend instances, eg: worker processes
+    FileBackend(str(tmpdir)).set("morpfw.memoize:shared", [1, 2])
+    assert FileBackend(str(tmpdir)).get("morpfw.memoize:shared") == [1, 2]
+
+    backend = FileBackend(str(tmpdir), maxsize=5)
+    for i in range(10):
+        backend.set("morpfw.memoize:%s" % i, i)
+    backend.prune()
+    assert len(tmpdir.listdir()) == 5
+
+
+def test_redis_backend():
+    check_backend(RedisBackend(client=LocalRedis(), prefix="test:"))
+
+
+def test_canonical_keys():
+    query = rulez.and_(rulez.field["a"] == 1, rulez.field["b"].in_([1, 2]))
+    same = {
+        "operator": "and",
+        "value": [
+            {"operator": "==", "value": 1, "field": "a"},
+            {"field": "b", "value": [1, 2], "operator": "in"},
+        ],
+    }
+    assert canonical(query) == canonical(same)
+    assert hash(canonical(query)) == hash(canonical(same))
+    assert canonical(["a", 1]) == canonical(("a", 1))
+    assert canonical({"a": 1}) != canonical((("a", 1),))
+    assert canonical({1, 2}) == canonical({2, 1})
+
+
+class Request(object):
+    def __init__(self):
+        self.environ = {}
+        self.headers = {}
+
+
+class Collection(ICollection):
+
+    search = aggregate = get = get_by_uuid = create = json = links = None
+
+    def __init__(self):
+        self.request = Request()
+        self.calls = 0
+
+    @requestmemoize()
+    def query(self, query=None, limit=None, order_by=("created", "desc")):
+        self.calls += 1
+        return self.calls
+
+
+Collection.__abstractmethods__ = frozenset()
+
+
+def test_requestmemoize_arguments():
+    memoizer.reset_stats()
+    col = Collection()
+    query = rulez.field["title"] == "hello"
+    assert col.query(query) == 1
+    assert col.query(query=dict(query), limit=None) == 1
+    assert col.query(query, None, ["created", "desc"]) == 1
+    assert col.query(query, 10) == 2
+    assert col.query(rulez.field["title"] == "world") == 3
+
+    # unhashable arguments are not memoized
+    assert col.query({"unhashable": bytearray()}) == 4
+    assert col.query({"unhashable": bytearray()}) == 5
+
+    requestmemoize.invalidate(col.request)
+    assert col.query(query) == 6
+
+    stats = memoizer.stats()["%s.Collection.query" % __name__]
+    assert stats == {"hits": 2, "misses": 4, "evictions": 3}
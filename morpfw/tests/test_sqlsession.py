@@ -1,9 +1,12 @@
+import copy
 import os
+from datetime import timedelta
 
 import morepath
 import morpfw
 import morpfw.sql
 import yaml
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.sql import func, select
 
 from .test_sqlapp import get_pagecollection
@@ -42,6 +45,11 @@ def test_sqlsession(pgsql_db):
         res = session.execute(sel_stmt)
         assert res.fetchone()[0] == 1
 
+        # retention window and dry run keep the record
+        assert col.storage.vacuum(older_than=timedelta(days=1)) == 0
+        assert list(col.storage.iter_vacuum(dry_run=True)) == [1]
+        assert col.storage.vacuum_count() == 1
+
         col.storage.vacuum()
 
         res = session.execute(sel_stmt)
@@ -56,3 +64,31 @@ def test_sqlsession(pgsql_db):
         sel_stmt = select([func.count(tbl.c.uuid)]).where(orm_model.deleted.isnot(None))
         res = session.execute(sel_stmt)
         assert res.fetchone()[0] == 0
+
+    # engines are pooled and reused across requests
+    with morpfw.request_factory(settings, scan=False) as request:
+        engine = request.get_db_engine()
+        assert isinstance(engine.pool, QueuePool)
+
+    with morpfw.request_factory(settings, scan=False) as request:
+        assert request.get_db_engine() is engine
+
+
+def test_db_engine_per_dburl(tmpdir):
+    morepath.scan(morpfw)
+    with open(os.path.join(os.path.dirname(__file__), "test_sqlapp-settings.yml")) as f:
+        settings = yaml.load(f.read(), Loader=yaml.Loader)
+
+    # same engine name configured with different urls must not share engines
+    engines = []
+    for dbname in ["first.db", "second.db"]:
+        app_settings = copy.deepcopy(settings)
+        dburl = "sqlite:///%s" % tmpdir.join(dbname)
+        app_settings["configuration"]["morpfw.storage.sqlstorage.dburl"] = dburl
+        with morpfw.request_factory(app_settings, scan=False) as request:
+            engine = request.get_db_engine()
+            assert str(engine.url) == dburl
+            assert request.db_session.bind is engine
+            engines.append(engine)
+
+    assert engines[0] is not engines[1]